@@ -0,0 +1,218 @@
+import asyncio
+import ssl
+import time
+from http import HTTPStatus
+import h264Utils
+import qualityUtils
+import streamUtils
+
+# === Asyncio Web Server ===
+# Serves the web app and the MJPEG camera stream from ONE thread using asyncio, instead of
+# one thread per connection. Each viewer is just a small object waiting for the next frame,
+# so dozens of viewers (or stuck browser tabs) cost very little.
+#
+# - New frames are handed over from the camera thread with call_soon_threadsafe (FrameRelay).
+# - Each connection only gets the newest frame once its previous one has been sent
+#   (write backpressure), so a slow phone skips frames instead of piling them up.
+# - Connections that stop reading (or never send a request) are closed after a timeout.
+
+# === Frame Relay: camera thread -> event loop ===
+class FrameRelay:
+    def __init__(self, loop, output):
+        self.loop = loop
+        self.output = output
+        self.waiter = loop.create_future()
+        output.AddFrameListener(self._on_frame)     # Called on the camera thread
+
+    def _on_frame(self, sequence):
+        self.loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        # Wake every connection waiting for a frame, and get a fresh "doorbell" for the next one
+        waiter, self.waiter = self.waiter, self.loop.create_future()
+        waiter.set_result(None)
+
+    async def WaitForFrame(self, sequence, timeout):
+        # Like FrameBroadcaster.WaitForFrame, but without blocking the event loop
+        while True:
+            waiter = self.waiter
+            found_sequence, frame = self.output.WaitForFrame(sequence, timeout=0)
+            if frame is not None:
+                return found_sequence, frame
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+
+
+# Request headers with case-insensitive names (like http.server's self.headers)
+class Headers(dict):
+    def get(self, name, default=None):
+        return super().get(name.lower(), default)
+
+
+class AsyncStreamServer:
+    def __init__(self, routes, streams, port, ssl_context=None,
+                 idle_timeout=30, write_timeout=10, write_buffer=256 * 1024, tier_encoder=None, mp4_streams=None,
+                 on_listening=None):
+        self.routes = routes                # webUtils.Router shared with the threaded server
+        self.streams = streams              # {"/stream.mjpg": StreamingOutput, ...}
+        self.mp4_streams = mp4_streams or {}  # {"/stream.mp4": h264Utils.H264Stream}
+        self.port = port
+        self.ssl_context = ssl_context
+        self.idle_timeout = idle_timeout    # Close connections that send nothing for this long
+        self.write_timeout = write_timeout  # Close viewers that can't take a frame for this long
+        self.write_buffer = write_buffer    # Bytes we let pile up for one connection before waiting
+        self.tier_encoder = tier_encoder or qualityUtils.TierEncoder()   # Per-viewer quality tiers (see qualityUtils)
+        self.on_listening = on_listening    # Called once the port is open (e.g. to mark the web server ready)
+        self.relays = {}
+        self.connections = 0
+        self.loop = None
+        self.server = None
+
+    def ServeForever(self):
+        asyncio.run(self._main())
+
+    def Shutdown(self):
+        # Stop ServeForever (safe to call from any thread)
+        if self.loop and self.server:
+            self.loop.call_soon_threadsafe(self.server.close)
+
+    async def _main(self):
+        loop = self.loop = asyncio.get_running_loop()
+        self.relays = {path: FrameRelay(loop, output)
+                       for path, output in list(self.streams.items()) + list(self.mp4_streams.items())}
+        # With TLS on, handshakes also happen here on the event loop (with a time limit)
+        server = await asyncio.start_server(self._client, port=self.port, ssl=self.ssl_context,
+                                            ssl_handshake_timeout=10 if self.ssl_context else None,
+                                            reuse_address=True)
+        self.server = server
+        print(f"🌐 asyncio {'HTTPS' if self.ssl_context else 'HTTP'} server on port {self.port}")
+        if self.on_listening:
+            self.on_listening()
+        async with server:
+            try:
+                await server.serve_forever()
+            except asyncio.CancelledError:
+                pass    # Shutdown() was called
+
+    async def _client(self, reader, writer):
+        self.connections += 1
+        writer.transport.set_write_buffer_limits(high=self.write_buffer)
+        try:
+            while True:
+                request = await asyncio.wait_for(self._read_request(reader), self.idle_timeout)
+                if request is None:
+                    break
+                version, path, headers = request
+                stream_path = path.split("?", 1)[0]
+                if stream_path in self.streams:
+                    await self._stream(reader, writer, path, self.streams[stream_path], self.relays[stream_path])
+                    break
+                if stream_path in self.mp4_streams:
+                    await self._stream_mp4(reader, writer, self.mp4_streams[stream_path], self.relays[stream_path])
+                    break
+                await self._respond(writer, path, headers)
+                # HTTP/1.1 keeps the connection open for the next request unless asked not to
+                if version != "HTTP/1.1" or headers.get("Connection", "").lower() == "close":
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ssl.SSLError):
+            pass        # Slow, stuck or vanished client: just hang up
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def _read_request(self, reader):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.LimitOverrunError:
+            return None     # Headers too big: not a browser we want to talk to
+        lines = head.decode("latin-1").split("\r\n")
+        parts = lines[0].split(" ")
+        if len(parts) != 3 or parts[0] != "GET":
+            return None
+        headers = Headers()
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        return parts[2], parts[1], headers
+
+    async def _respond(self, writer, path, headers):
+        handler, blocking = self.routes.Find(path)
+        if handler is None:
+            response = None
+        elif blocking:
+            # Handlers that may wait (e.g. for the camera) run on a worker thread
+            response = await asyncio.get_running_loop().run_in_executor(None, handler, path, headers)
+        else:
+            response = handler(path, headers)
+        status, response_headers, body = response or (404, [("Content-Type", "text/plain"), ("Content-Length", "9")], b"Not Found")
+        head = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}"]
+        head += [f"{name}: {value}" for name, value in response_headers]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await asyncio.wait_for(writer.drain(), self.write_timeout)
+
+    async def _stream(self, reader, writer, path, output, relay):
+        print("📡 MJPEG stream requested (asyncio)")
+        quality = qualityUtils.ViewerQuality.FromPath(path)     # ?quality=full|medium|low|minimal|auto
+        qualityUtils.LimitSendBuffer(writer.get_extra_info("socket"))
+        loop = asyncio.get_running_loop()
+        writer.write(b"HTTP/1.1 200 OK\r\n"
+                     b"Cache-Control: no-cache, private\r\n"
+                     b"Content-Type: multipart/x-mixed-replace; boundary=FRAME\r\n\r\n")
+        sequence = max(output.Latest()[0] - 1, 0)      # Start with the newest frame already captured
+        output.AddViewer()
+        try:
+            while True:
+                try:
+                    sequence, frame = await relay.WaitForFrame(sequence, timeout=5)
+                except asyncio.TimeoutError:
+                    if reader.at_eof():
+                        return  # No frames (camera off) and the browser has hung up
+                    continue    # Camera is off; keep the connection and wait
+                if not quality.Wants(sequence):
+                    continue    # Lower tiers skip some frames
+                started = time.monotonic()
+                if (qualityUtils.QUALITY_TIERS[quality.tier]["quality"] is not None
+                        or self.tier_encoder.WantsOverlay(quality.overlay)):
+                    # Re-encoding takes a few milliseconds: do it on a worker thread, not the event loop
+                    frame = await loop.run_in_executor(None, self.tier_encoder.Encode, quality.tier, sequence, frame,
+                                                       quality.overlay)
+                sending = time.perf_counter()
+                writer.write(b"--FRAME\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n" % len(frame))
+                writer.write(frame)
+                writer.write(b"\r\n")
+                # Wait until this frame is (mostly) on its way before taking the next one.
+                # A viewer that can't take anything for write_timeout seconds is gone.
+                await asyncio.wait_for(writer.drain(), self.write_timeout)
+                streamUtils.SEND_SECONDS.Observe(time.perf_counter() - sending)
+                streamUtils.MJPEG_FRAMES_SENT.Inc()
+                streamUtils.MJPEG_BYTES_SENT.Inc(len(frame))
+                quality.Sent(started, time.monotonic())    # In "auto" mode, pick the tier from how long that took
+        finally:
+            output.RemoveViewer()
+
+    async def _stream_mp4(self, reader, writer, stream, relay):
+        print("📡 H.264 stream requested (asyncio)")
+        writer.write(b"HTTP/1.1 200 OK\r\n"
+                     b"Cache-Control: no-cache, private\r\n"
+                     b"Content-Type: video/mp4\r\n"
+                     b"Connection: close\r\n\r\n")    # No length: the video keeps coming until the browser hangs up
+        qualityUtils.LimitSendBuffer(writer.get_extra_info("socket"))
+        viewer = h264Utils.Mp4Viewer()              # Starts at a keyframe and sends the init segment first
+        sequence = stream.StartSequence()           # The newest keyframe already captured, for a quick start
+        stream.AddViewer()
+        try:
+            while True:
+                try:
+                    sequence, item = await relay.WaitForFrame(sequence, timeout=5)
+                except asyncio.TimeoutError:
+                    if reader.at_eof():
+                        return
+                    continue
+                data = viewer.Take(sequence, item)
+                if data:
+                    writer.write(data)
+                    await asyncio.wait_for(writer.drain(), self.write_timeout)
+                    streamUtils.MP4_FRAMES_SENT.Inc()
+                    streamUtils.MP4_BYTES_SENT.Inc(len(data))
+        finally:
+            stream.RemoveViewer()
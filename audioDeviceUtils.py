@@ -0,0 +1,162 @@
+import re
+import subprocess
+import threading
+import time
+
+# pulsectl talks to PulseAudio/PipeWire directly over its socket (no "pactl" programs to start).
+# It's optional: without it we fall back to one long-running "pactl subscribe" for change events.
+try:
+    import pulsectl
+except ImportError:
+    pulsectl = None
+
+# === Audio Device Manager ===
+# Keeps track of the speaker (the Bluetooth one if connected) and its volume, so a volume click
+# is one quick call instead of starting three "pactl" programs and reading their whole output.
+# The sound server tells us about changes as they happen (a speaker connecting, someone changing
+# the volume elsewhere), and the remembered values are updated right away.
+BLUETOOTH_SINK_KEYWORDS = ("bluez_output", "bluez_sink")
+
+class AudioDeviceManager:
+    def __init__(self, client_name="orion-doorbell", keywords=BLUETOOTH_SINK_KEYWORDS):
+        self.client_name = client_name
+        self.keywords = keywords
+        self.lock = threading.Lock()
+        self.sink = None                 # Name of the Bluetooth speaker (None if not connected)
+        self.volume = None               # Its volume in percent
+        self.sink_info = None            # pulsectl's object for the speaker (pulsectl mode only)
+        self.sink_listeners = []         # Functions to call with the new sink name when the speaker comes or goes
+        self.last_set = 0.0              # When we last changed the volume ourselves
+        self.pulse = None                # Command connection (pulsectl mode)
+        self.events = None               # Event connection (pulsectl) or "pactl subscribe" process
+        self.closed = False
+        self.thread = threading.Thread(target=self._watch, name="audio-devices", daemon=True)
+
+    def Begin(self):
+        try:
+            if pulsectl:
+                self._connect()
+            self._refresh()
+        except Exception as e:
+            print("⚠️ Sound server not reachable yet:", e)    # The watcher keeps trying
+        self.thread.start()
+        print(f"🔈 Audio devices: {'pulsectl' if pulsectl else 'pactl'}, speaker {self.sink or 'not connected'}")
+
+    def Close(self):
+        self.closed = True
+        if pulsectl and self.events:
+            self.events.event_listen_stop()
+        elif self.events:
+            self.events.terminate()
+
+    def AddSinkListener(self, listener):
+        self.sink_listeners.append(listener)
+
+    def ChangeVolume(self, steps, step_percent=5):
+        # Returns the new volume in percent, or None if there is no speaker / it failed
+        with self.lock:
+            if not self.sink or self.volume is None:
+                print("⚠️ Bluetooth sink not found.")
+                return None
+            new_volume = max(0, min(100, self.volume + step_percent * steps))
+            try:
+                if pulsectl:
+                    self.pulse.volume_set_all_chans(self.sink_info, new_volume / 100)
+                else:
+                    subprocess.run(["pactl", "set-sink-volume", self.sink, f"{new_volume}%"], check=True)
+            except Exception as e:
+                print(f"❌ Volume change error: {e}")
+                return None
+            self.volume = new_volume
+            self.last_set = time.monotonic()
+            return new_volume
+
+    # === Reading the Sinks ===
+    def _connect(self):
+        self.pulse = pulsectl.Pulse(self.client_name)
+        self.events = pulsectl.Pulse(self.client_name + "-events")
+        self.events.event_mask_set("sink", "server")
+
+    def _refresh(self):
+        try:
+            sinks = self._list_sinks()
+        except Exception as e:
+            print("❌ Could not read audio devices:", e)
+            return
+        with self.lock:
+            old_sink = self.sink
+            self.sink, self.volume, self.sink_info = None, None, None
+            for name, volume, info in sinks:
+                if any(keyword in name for keyword in self.keywords):
+                    self.sink, self.volume, self.sink_info = name, volume, info
+                    break
+            changed = self.sink != old_sink
+        if changed:
+            print(f"🔈 Bluetooth speaker {'connected: ' + self.sink if self.sink else 'disconnected'}")
+            for listener in self.sink_listeners:
+                listener(self.sink)
+
+    def _list_sinks(self):
+        # [(name, volume percent, pulsectl object or None), ...]
+        if pulsectl:
+            with self.lock:
+                return [(sink.name, round(sink.volume.value_flat * 100), sink) for sink in self.pulse.sink_list()]
+        result = subprocess.run(["pactl", "list", "sinks"], capture_output=True, text=True, check=True)
+        sinks, name = [], None
+        for line in result.stdout.splitlines():
+            line = line.strip()
+            if line.startswith("Name:"):
+                name = line.split(":", 1)[1].strip()
+            elif name and line.startswith("Volume:"):
+                match = re.search(r"(\d+)%", line)    # The first channel's volume, like "45%"
+                sinks.append((name, int(match.group(1)) if match else None, None))
+                name = None
+        return sinks
+
+    # === Listening for Changes ===
+    def _watch(self):
+        while not self.closed:
+            try:
+                if pulsectl:
+                    self._watch_pulsectl()
+                else:
+                    self._watch_pactl()
+            except Exception as e:
+                print("⚠️ Lost the sound server, reconnecting:", e)
+            if self.closed:
+                return
+            time.sleep(2)                # The sound server restarted (or isn't up yet): try again
+            try:
+                if pulsectl:
+                    self._connect()
+                self._refresh()
+            except Exception:
+                pass
+
+    def _watch_pulsectl(self):
+        changed = []
+        def on_event(event):
+            changed.append(event)
+            raise pulsectl.PulseLoopStop  # Leave event_listen so we can read the sinks
+        self.events.event_callback_set(on_event)
+        while not self.closed:
+            changed.clear()
+            self.events.event_listen()
+            if changed and not self._only_our_change(changed[0].t == "change"):
+                self._refresh()
+
+    def _watch_pactl(self):
+        # "pactl subscribe" keeps running and prints a line for every change, like:
+        #   Event 'change' on sink #52
+        self.events = subprocess.Popen(["pactl", "subscribe"], stdout=subprocess.PIPE, text=True)
+        for line in self.events.stdout:
+            if self.closed:
+                return
+            if " on sink " in line or " on server" in line:
+                if not self._only_our_change("'change'" in line):
+                    self._refresh()
+        raise RuntimeError("pactl subscribe ended")
+
+    def _only_our_change(self, is_change):
+        # A volume change we just made ourselves: the remembered value is already right
+        return is_change and time.monotonic() - self.last_set < 1.0
@@ -1,8 +1,63 @@
-import pyaudio
 import threading
 import logging
 import io
+import json
+import math
+import collections
 import wave
+import struct
+import time
+import queue
+import subprocess
+import warnings
+import numpy as np
+import metricsUtils
+
+# PyAudio (PortAudio) talks to the sound card. Without it (e.g. testing on a laptop) a stand-in
+# can be plugged in with UseAudioBackend(fakeDevices.FakeAudioBackend()).
+try:
+    import pyaudio
+except ImportError:
+    pyaudio = None
+
+def UseAudioBackend(backend):
+    # backend: anything that looks like the pyaudio module (PyAudio(), paInt16, paContinue)
+    global pyaudio
+    pyaudio = backend
+
+# PyAV (the "av" package) decodes the app's WebM/Opus audio right in memory.
+# Without it we fall back to an ffmpeg process that reads and writes through pipes.
+try:
+    import av
+except ImportError:
+    av = None
+
+# audioop does the ADPCM compression in C. It was removed from Python 3.13
+# (the "audioop-lts" package brings it back); without it we send plain PCM.
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore", DeprecationWarning)
+    try:
+        import audioop
+    except ImportError:
+        audioop = None
+
+# === Streaming Audio Packets ===
+# Each packet holds a few milliseconds of sound plus a small header, so the web app can
+# put packets back in order and play them smoothly (see client_app.js):
+#   magic "ORA1" | codec | flags | sample rate | sequence number | time (ms) | ADPCM state (2 values)
+AUDIO_PACKET_MAGIC = b"ORA1"
+AUDIO_PACKET_HEADER = struct.Struct("<4sBBHIIhBx")
+CODEC_PCM16 = 0        # Plain 16-bit samples
+CODEC_ADPCM = 1        # IMA ADPCM: 4 bits per sample (a quarter of the size)
+FLAG_KEEPALIVE = 1     # Header only, no sound: "still connected, nobody is speaking"
+
+# Numbers for /metrics
+AUDIO_ENCODE_SECONDS = metricsUtils.STAGE_SECONDS.Labels("audio_encode")
+VAD_SECONDS = metricsUtils.STAGE_SECONDS.Labels("vad")
+AUDIO_PUBLISH_SECONDS = metricsUtils.STAGE_SECONDS.Labels("audio_publish")
+AUDIO_PACKETS = metricsUtils.REGISTRY.Counter("doorbell_audio_packets_total", "Microphone packets published", labels=("kind",))
+AUDIO_SOUND_PACKETS, AUDIO_KEEPALIVES = AUDIO_PACKETS.Labels("sound"), AUDIO_PACKETS.Labels("keepalive")
+AUDIO_BYTES = metricsUtils.REGISTRY.Counter("doorbell_audio_bytes_total", "Microphone bytes published").Labels()
 
 class AudioInputStream:
     def __init__(self, sample_rate=44100, channels=1, chunk_size=1024):
@@ -83,6 +138,125 @@ class AudioOutputStream:
         self.Close()
 
 
+# === Audio Frame Encoder ===
+# Turns raw microphone audio into small streaming packets:
+# cuts it into fixed-length frames, lowers the sample rate (e.g. 44.1 kHz -> 16 kHz,
+# plenty for voices) and optionally compresses it with ADPCM.
+class AudioFrameEncoder:
+    def __init__(self, input_rate=44100, output_rate=16000, frame_ms=20, codec="adpcm"):
+        if (input_rate * frame_ms) % 1000 or (output_rate * frame_ms) % 1000:
+            raise ValueError("frame_ms must give a whole number of samples at both sample rates")
+        self.input_rate = input_rate
+        self.output_rate = output_rate
+        self.frame_ms = frame_ms
+        self.codec = CODEC_ADPCM if codec == "adpcm" and audioop else CODEC_PCM16
+        self.input_samples = input_rate * frame_ms // 1000     # Microphone samples per frame
+        self.output_samples = output_rate * frame_ms // 1000   # Samples per frame after resampling
+        self.input_bytes = self.input_samples * 2               # 16-bit samples are 2 bytes each
+        # Where each output sample falls between the input samples (the same for every frame)
+        self.positions = np.arange(self.output_samples) * (input_rate / output_rate)
+        self.filter = np.array([1, 2, 3, 2, 1], dtype=np.float32) / 9   # Gentle low-pass to avoid aliasing
+        self.tail = np.zeros(len(self.filter) - 1, dtype=np.float32)    # End of the last frame, so frames join smoothly
+        self.adpcm_state = None
+        self.sequence = 0
+        self.start_time = time.monotonic()
+
+    def Encode(self, data):
+        # data: exactly input_bytes of 16-bit mono audio. Returns one packet (bytes).
+        started = time.perf_counter()
+        samples = np.frombuffer(data, dtype=np.int16).astype(np.float32)
+        if self.output_rate != self.input_rate:
+            smoothed = np.convolve(np.concatenate((self.tail, samples)), self.filter, mode="valid")
+            self.tail = samples[-len(self.tail):]
+            samples = np.interp(self.positions, np.arange(len(smoothed)), smoothed)
+        pcm = np.clip(samples, -32768, 32767).astype(np.int16).tobytes()
+
+        predictor, index = self.adpcm_state or (0, 0)
+        if self.codec == CODEC_ADPCM:
+            # The header carries the state the decoder needs, so every packet can be decoded on its own
+            payload, self.adpcm_state = audioop.lin2adpcm(pcm, 2, self.adpcm_state)
+        else:
+            payload = pcm
+        AUDIO_ENCODE_SECONDS.Observe(time.perf_counter() - started)
+        return self._packet(self.codec, payload, predictor, index)
+
+    def Skip(self, data):
+        # A silent frame that won't be sent: only remember its end, so the next sent frame joins smoothly
+        if self.output_rate != self.input_rate:
+            self.tail = np.frombuffer(data, dtype=np.int16)[-len(self.tail):].astype(np.float32)
+        self.adpcm_state = None
+
+    def KeepAlive(self):
+        # A header-only packet (20 bytes) that keeps the packet numbers going during silence
+        return self._packet(self.codec, b"", flags=FLAG_KEEPALIVE)
+
+    def _packet(self, codec, payload, predictor=0, index=0, flags=0):
+        elapsed_ms = int((time.monotonic() - self.start_time) * 1000) & 0xFFFFFFFF
+        header = AUDIO_PACKET_HEADER.pack(AUDIO_PACKET_MAGIC, codec, flags, self.output_rate,
+                                          self.sequence, elapsed_ms, predictor, index)
+        self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+        return header + payload
+
+
+# === Voice Activity Detector ===
+# Decides for each block of microphone sound whether somebody is speaking, so that silence
+# doesn't have to be sent at all. Two cheap measurements per block (NumPy, no Python loops):
+#   - loudness (RMS in dB), compared with the background noise level, which it keeps learning
+#   - zero crossings: how often the wave changes sign. Hissy sounds like "s" and "f" are quiet
+#     but cross zero very often, so they still count as speech when a little above the noise.
+# Speech starts above start_db and only ends below the (lower) stop_db, and stays "on" for
+# hangover_ms after the last speech block, so pauses between words don't chop the sound.
+class VoiceActivityDetector:
+    def __init__(self, sample_rate=44100, start_db=9.0, stop_db=5.0, min_db=-55.0,
+                 unvoiced_zcr=0.25, hangover_ms=400, floor_rise_db=0.5):
+        self.sample_rate = sample_rate
+        self.start_db = start_db          # dB above the noise level that starts speech
+        self.stop_db = stop_db            # dB above the noise level that keeps it going
+        self.min_db = min_db              # Anything quieter than this is silence, whatever the noise level
+        self.unvoiced_zcr = unvoiced_zcr  # Zero crossings per sample that sound like "s"/"f"/"sh"
+        self.hangover_ms = hangover_ms
+        self.floor_rise_db = floor_rise_db    # How fast (dB per second) the noise level may creep up
+        self.noise_db = None              # Learned background noise level
+        self.speaking = False
+        self.last_speech = 0.0            # Audio time (seconds) of the last block that sounded like speech
+        self.position = 0.0               # Audio time (seconds) processed so far
+        self.level_db = -96.0             # Loudness of the last block
+
+    def Process(self, data):
+        # data: 16-bit mono samples (bytes). Returns True while somebody is speaking.
+        samples = np.frombuffer(data, dtype=np.int16)
+        if not len(samples):
+            return self.speaking
+        seconds = len(samples) / self.sample_rate
+        self.position += seconds
+        as_float = samples.astype(np.float32)
+        power = float(np.dot(as_float, as_float)) / len(samples)
+        self.level_db = 10 * math.log10(power / (32768.0 ** 2) + 1e-10)
+        negative = np.signbit(samples)
+        zcr = int(np.count_nonzero(negative[1:] != negative[:-1])) / len(samples)
+
+        if self.noise_db is None:
+            self.noise_db = self.level_db
+        above = self.level_db - self.noise_db
+        loud_enough = self.level_db > self.min_db
+        if self.speaking:
+            voice = loud_enough and above > self.stop_db
+        else:
+            voice = loud_enough and (above > self.start_db or
+                                     (above > self.stop_db and zcr > self.unvoiced_zcr))
+        if voice:
+            self.last_speech = self.position
+        else:
+            # Learn the background: follow it down right away, up only slowly (so speech isn't learned as noise)
+            if self.level_db < self.noise_db:
+                self.noise_db = self.level_db
+            else:
+                self.noise_db = min(self.level_db, self.noise_db + self.floor_rise_db * seconds)
+        self.speaking = voice or (self.speaking and
+                                  self.position - self.last_speech < self.hangover_ms / 1000)
+        return self.speaking
+
+
 class AudioPlayback:
    def __init__(self, sample_rate=44100, channels=1, chunk_size=1024):
       self.input = AudioInputStream(sample_rate, channels, chunk_size)
@@ -90,11 +264,32 @@ class AudioPlayback:
       self.lock = threading.Lock()
       self.is_playing = False
       self.playback_frame_count = 80
+      self.stream_settings = None      # Set by SetStreamMode() to send small packets instead of WAV files
+      self.vad_settings = None         # Set by SetVoiceDetection() to leave out silence
+      self.events_topic = None         # Where "speech started/stopped" messages go
+      self.stats_lock = threading.Lock()
+      self.stats = {"blocks": 0, "speech_blocks": 0, "keepalives": 0, "speech_events": 0,
+                    "bytes_sent": 0, "bytes_saved": 0}
       # self.playback_thread = threading.Thread(target=self._playback)
       
    def SetPlayBackFrameCount(self, frame_count):
        self.playback_frame_count = frame_count
 
+   def SetStreamMode(self, output_rate=16000, frame_ms=20, codec="adpcm"):
+       # Send a small packet every frame_ms instead of a ~2 second WAV file (much lower delay)
+       self.stream_settings = {"output_rate": output_rate, "frame_ms": frame_ms, "codec": codec}
+
+   def SetVoiceDetection(self, events_topic=None, keepalive_ms=1000, preroll_ms=200, **detector_settings):
+       # Only send sound while somebody is speaking. During silence a tiny keep-alive packet goes
+       # out every keepalive_ms, and speech start/stop is reported on events_topic (JSON).
+       # preroll_ms of sound before speech is detected is sent too, so first syllables aren't cut off.
+       self.vad_settings = {"keepalive_ms": keepalive_ms, "preroll_ms": preroll_ms, "detector": detector_settings}
+       self.events_topic = events_topic
+
+   def Stats(self):
+       with self.stats_lock:
+           return dict(self.stats)
+
    def SetMQTTClient(self, client, topic):
        self.client = client
        self.topic = topic
@@ -127,12 +322,29 @@ class AudioPlayback:
             # self.output.Close()
       
    def _playback(self):
+        if self.stream_settings:
+            self._stream()
+            return
         frames = []
+        detector = self._detector()
+        if detector:
+            keepalive = AudioFrameEncoder(self.input._sample_rate, self.input._sample_rate, 10, "pcm")
+        speech_in_block = False
         print("Audio playback started")
         while self.IsPlaying():
             data = self.input.ReadData()
             frames.append(data)
+            if detector:
+                speech_in_block = self._detect(detector, data) or speech_in_block
             if len(frames) >= self.playback_frame_count:
+                if detector and not speech_in_block:
+                    # Nobody spoke in this whole block: send 20 bytes instead of a WAV file
+                    self._send(keepalive.KeepAlive(), False,
+                               saved=sum(len(frame) for frame in frames) + 44)
+                    frames = []
+                    continue
+                speech_in_block = False
+                started = time.perf_counter()
                 buffer = io.BytesIO()
                 with wave.open(buffer, 'wb') as wf:
                     wf.setnchannels(1)
@@ -141,9 +353,95 @@ class AudioPlayback:
                     wf.writeframes(b''.join(frames))
                 
                 wav_data = buffer.getvalue()
+                AUDIO_ENCODE_SECONDS.Observe(time.perf_counter() - started)
                 print("📤 Publishing audio:", len(wav_data))
-                self.client.publish(self.topic, payload=wav_data, qos=0, retain=False)
+                self._send(wav_data, True)
                 frames = []
+        self._end_speech(detector)
+
+   def _stream(self):
+        encoder = AudioFrameEncoder(self.input._sample_rate, **self.stream_settings)
+        print(f"Audio streaming started ({encoder.frame_ms} ms frames, {encoder.output_rate} Hz, "
+              f"{'ADPCM' if encoder.codec == CODEC_ADPCM else 'PCM'}"
+              f"{', voice detection' if self.vad_settings else ''})")
+        detector = self._detector()
+        if detector:
+            held = collections.deque()      # Recent silent frames, sent first if speech starts (pre-roll)
+            hold_frames = self.vad_settings["preroll_ms"] // encoder.frame_ms
+            keepalive_frames = max(1, self.vad_settings["keepalive_ms"] // encoder.frame_ms)
+            silent_frames = 0
+        pending = b""
+        while self.IsPlaying():
+            pending += self.input.ReadData()
+            # Send every complete frame we have; keep the leftover for next time
+            while len(pending) >= encoder.input_bytes:
+                frame = pending[:encoder.input_bytes]
+                pending = pending[encoder.input_bytes:]
+                if not detector:
+                    self._send(encoder.Encode(frame), True)
+                    continue
+                if self._detect(detector, frame):
+                    while held:
+                        self._send(encoder.Encode(held.popleft()), True)
+                    self._send(encoder.Encode(frame), True)
+                    silent_frames = 0
+                    continue
+                held.append(frame)
+                if len(held) > hold_frames:
+                    dropped = held.popleft()
+                    encoder.Skip(dropped)
+                    # What this frame would have cost: its share of the samples, plus a header
+                    self._count_saved(AUDIO_PACKET_HEADER.size + encoder.output_samples *
+                                      (2 if encoder.codec == CODEC_PCM16 else 0.5))
+                silent_frames += 1
+                if (silent_frames - 1) % keepalive_frames == 0:     # First silent frame, then every keepalive_ms
+                    self._send(encoder.KeepAlive(), False)
+        self._end_speech(detector)
+
+   # === Voice Detection Helpers ===
+   def _detector(self):
+       if not self.vad_settings:
+           return None
+       return VoiceActivityDetector(self.input._sample_rate, **self.vad_settings["detector"])
+
+   def _detect(self, detector, data):
+       was_speaking = detector.speaking
+       started = time.perf_counter()
+       speaking = detector.Process(data)
+       VAD_SECONDS.Observe(time.perf_counter() - started)
+       with self.stats_lock:
+           self.stats["blocks"] += 1
+           self.stats["speech_blocks"] += speaking
+       if speaking != was_speaking:
+           self._speech_event(speaking, detector.level_db)
+       return speaking
+
+   def _end_speech(self, detector):
+       if detector and detector.speaking:
+           self._speech_event(False, detector.level_db)
+
+   def _speech_event(self, speaking, level_db):
+       with self.stats_lock:
+           self.stats["speech_events"] += speaking
+       print("🗣️ Speech started at the door" if speaking else "🤫 Speech stopped")
+       if self.events_topic:
+           event = {"speaking": speaking, "time": time.time(), "level_db": round(level_db, 1)}
+           self.client.publish(self.events_topic, payload=json.dumps(event), qos=0, retain=False)
+
+   def _send(self, payload, is_sound, saved=0):
+       with self.stats_lock:
+           self.stats["bytes_sent"] += len(payload)
+           self.stats["keepalives"] += not is_sound
+           self.stats["bytes_saved"] += saved
+       started = time.perf_counter()
+       self.client.publish(self.topic, payload=payload, qos=0, retain=False)
+       AUDIO_PUBLISH_SECONDS.Observe(time.perf_counter() - started)
+       (AUDIO_SOUND_PACKETS if is_sound else AUDIO_KEEPALIVES).Inc()
+       AUDIO_BYTES.Inc(len(payload))
+
+   def _count_saved(self, size):
+       with self.stats_lock:
+           self.stats["bytes_saved"] += int(size)
 
    def Close(self):
          self.StopPlaying()
@@ -154,8 +452,187 @@ class AudioPlayback:
          print("Audio playback closed ")
 
 
-          
+# === Talk-Back Player ===
+# Plays the voice messages sent from the web app ("Talk" button) on the doorbell speaker.
+# Messages are decoded in memory (never written to the SD card) and played through one
+# audio output stream that stays open, on a worker thread of its own, so the MQTT thread
+# is never stuck waiting for a message to finish playing.
+class TalkbackPlayer:
+    def __init__(self, sample_rate=44100, channels=1, max_queued=4):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.output = AudioOutputStream(sample_rate, channels)
+        self.messages = queue.Queue(maxsize=max_queued)   # Voice messages waiting to be played
+        self.thread = threading.Thread(target=self._run, name="talkback", daemon=True)
+
+    def Begin(self):
+        self.output.Open()
+        self.thread.start()
+        print(f"🔈 Talk-back ready (decoding with {'PyAV' if av else 'ffmpeg pipes'})")
+
+    def Play(self, payload):
+        # Queue a WebM/Opus voice message. Returns right away.
+        try:
+            self.messages.put_nowait(payload)
+        except queue.Full:
+            # Too many messages waiting: drop the oldest one so the newest still gets played
+            try:
+                self.messages.get_nowait()
+            except queue.Empty:
+                pass
+            self.messages.put_nowait(payload)
+            print("⚠️ Talk-back queue full — dropped the oldest message")
+
+    def Close(self):
+        self.messages.put(None)
+        self.thread.join(timeout=5)
+        self.output.Close()
+        self.output.Terminate()
+
+    def _run(self):
+        while True:
+            payload = self.messages.get()
+            if payload is None:
+                return
+            try:
+                pcm = self.Decode(payload)
+                print(f"🔈 Playing talk-back ({len(pcm) / (2 * self.channels * self.sample_rate):.1f}s)")
+                self.output.WriteData(pcm)
+            except Exception as e:
+                print("❌ Audio playback failed:", e)
+
+    def Decode(self, payload):
+        # WebM/Opus bytes -> raw 16-bit samples at our sample rate
+        return DecodeAudio(payload, self.sample_rate, self.channels)
+
+
+# === Decoding Compressed Audio ===
+# Any file ffmpeg understands (WebM/Opus, MP3, WAV, ...) -> raw 16-bit samples,
+# done in memory with PyAV, or through an ffmpeg process with pipes if PyAV isn't installed
+def DecodeAudio(data, sample_rate=44100, channels=1):
+    if av:
+        return _decode_with_pyav(data, sample_rate, channels)
+    return _decode_with_ffmpeg(data, sample_rate, channels)
 
+def _decode_with_pyav(data, sample_rate, channels):
+    layout = "mono" if channels == 1 else "stereo"
+    resampler = av.AudioResampler(format="s16", layout=layout, rate=sample_rate)
+    chunks = []
+    with av.open(io.BytesIO(data)) as container:
+        for frame in container.decode(audio=0):
+            for resampled in resampler.resample(frame):
+                chunks.append(resampled.to_ndarray().tobytes())
+    for resampled in resampler.resample(None):    # Whatever the resampler was still holding
+        chunks.append(resampled.to_ndarray().tobytes())
+    return b"".join(chunks)
 
+def _decode_with_ffmpeg(data, sample_rate, channels):
+    result = subprocess.run(
+        ["ffmpeg", "-loglevel", "error", "-i", "pipe:0",
+         "-f", "s16le", "-ac", str(channels), "-ar", str(sample_rate), "pipe:1"],
+        input=data, capture_output=True, timeout=30, check=True)
+    return result.stdout
 
-       
\ No newline at end of file
+
+# === Chime Player ===
+# Plays the doorbell chime (and any other short sounds) with as little delay as possible:
+#   - every sound is decoded ONCE at startup and kept in memory as raw samples
+#   - one output stream stays open the whole time; PortAudio asks us for the next few
+#     milliseconds of sound (the callback), so a new chime starts within one small buffer
+#   - what happens when the button is pressed again while a chime is still ringing:
+#       "restart" - start the chime over, "mix" - play both on top of each other, "ignore" - keep the first
+# Play() can be given the time the button was pressed; the delay until the first sample of
+# that chime is handed to the sound card is passed to the latency hook.
+class ChimePlayer:
+    def __init__(self, sample_rate=44100, channels=1, frames_per_buffer=256, overlap="restart",
+                 cooldown=0.0, max_voices=4):
+        logging.getLogger('pyaudio').setLevel(logging.WARNING)
+        self.audio = pyaudio.PyAudio()
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frames_per_buffer = frames_per_buffer   # Smaller = less delay, more wake-ups (256 = ~6 ms)
+        self.overlap = overlap
+        self.cooldown = cooldown                # Seconds after a chime starts during which presses are ignored
+        self.max_voices = max_voices            # Most sounds playing at once in "mix" mode
+        self.sounds = {}                        # name -> int16 samples
+        self.voices = []                        # Sounds playing right now: [name, samples, position, pressed_at]
+        self.lock = threading.Lock()
+        self.last_started = 0.0
+        self.latency_hook = None
+        self.latencies = []                     # Recent press-to-sound delays in seconds (for Stats)
+        self.stream = None
+
+    def Load(self, name, path):
+        # Decode a sound file into memory (done once, at startup)
+        with open(path, "rb") as f:
+            pcm = DecodeAudio(f.read(), self.sample_rate, self.channels)
+        self.sounds[name] = np.frombuffer(pcm, dtype=np.int16)
+        print(f"🔔 Loaded sound '{name}' ({len(self.sounds[name]) / (self.channels * self.sample_rate):.1f}s)")
+
+    def SetLatencyHook(self, hook):
+        # hook(name, seconds) runs on the audio thread, so it must be quick
+        self.latency_hook = hook
+
+    def Begin(self):
+        self.stream = self.audio.open(format=pyaudio.paInt16, channels=self.channels, rate=self.sample_rate,
+                                      output=True, frames_per_buffer=self.frames_per_buffer,
+                                      stream_callback=self._callback)
+        self.stream.start_stream()
+
+    def Play(self, name="bell", pressed_at=None):
+        # Start a sound. pressed_at = time.perf_counter() when the button was pressed (for the latency hook).
+        # Returns False if the press was ignored.
+        samples = self.sounds.get(name)
+        if samples is None:
+            print(f"⚠️ Unknown sound '{name}'")
+            return False
+        now = time.perf_counter()
+        with self.lock:
+            if now - self.last_started < self.cooldown:
+                return False
+            if self.voices and self.overlap == "ignore":
+                return False
+            if self.overlap == "restart":
+                self.voices = [voice for voice in self.voices if voice[0] != name]
+            elif len(self.voices) >= self.max_voices:
+                self.voices.pop(0)
+            self.voices.append([name, samples, 0, pressed_at if pressed_at is not None else now])
+            self.last_started = now
+        return True
+
+    def Stats(self):
+        with self.lock:
+            latencies = list(self.latencies)
+        if not latencies:
+            return {"plays": 0}
+        return {"plays": len(latencies),
+                "last_ms": round(1000 * latencies[-1], 1),
+                "avg_ms": round(1000 * sum(latencies) / len(latencies), 1),
+                "max_ms": round(1000 * max(latencies), 1),
+                "device_latency_ms": round(1000 * self.stream.get_output_latency(), 1) if self.stream else None}
+
+    def Close(self):
+        if self.stream:
+            self.stream.stop_stream()
+            self.stream.close()
+        self.audio.terminate()
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        # Called by PortAudio (on its own thread) whenever it needs the next buffer of sound
+        wanted = frame_count * self.channels
+        mixed = np.zeros(wanted, dtype=np.int32)
+        started = []
+        with self.lock:
+            for voice in self.voices:
+                name, samples, position, pressed_at = voice
+                chunk = samples[position:position + wanted]
+                mixed[:len(chunk)] += chunk
+                if position == 0:
+                    started.append((name, time.perf_counter() - pressed_at))
+                voice[2] = position + len(chunk)
+            self.voices = [voice for voice in self.voices if voice[2] < len(voice[1])]
+            self.latencies = (self.latencies + [seconds for _, seconds in started])[-50:]
+        for name, seconds in started:
+            if self.latency_hook:
+                self.latency_hook(name, seconds)
+        return np.clip(mixed, -32768, 32767).astype(np.int16).tobytes(), pyaudio.paContinue
@@ -0,0 +1,86 @@
+# === Camera Start Benchmark ===
+# How long from a trigger (bell press, motion, "camera on" in the app) until the first JPEG is in
+# the stream, for each camera standby policy (see cameraUtils.py):
+#   off         - sensor stopped and unconfigured while idle (least power)
+#   configured  - sensor stopped but configured
+#   warm        - sensor running at --standby-fps while idle, nothing encoded
+# Each policy is started and stopped --cycles times with a viewer waiting, like the web app does.
+# The fake camera pretends configure() and start() take --configure-ms / --start-ms (a real
+# sensor needs a few hundred milliseconds); use --backend pi on the doorbell to measure the real one.
+#
+#   python3 benchmarks/camera_start_bench.py
+#   python3 benchmarks/camera_start_bench.py --backend pi --encoder jpeg --cycles 10
+import argparse, contextlib, os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import cv2
+import cameraUtils, streamUtils
+from fakeDevices import FakePicamera2, FakeJpegEncoder, FakeFileOutput
+
+class JpegOutput(streamUtils.FrameBroadcaster):
+    def EncodeFrame(self, frame, quality=85):
+        _, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        self.Publish(jpeg.tobytes())
+
+    def write(self, buf):
+        self.Publish(bytes(buf))
+
+    def flush(self):
+        pass
+
+def make_camera(args):
+    if args.backend == "pi":
+        from picamera2 import Picamera2
+        from picamera2.encoders import JpegEncoder
+        from picamera2.outputs import FileOutput
+        return Picamera2(), JpegEncoder, FileOutput
+    camera = FakePicamera2(fps=args.fps, configure_seconds=args.configure_ms / 1000, start_seconds=args.start_ms / 1000)
+    return camera, FakeJpegEncoder, FakeFileOutput
+
+def run(policy, camera, encoder_class, file_output, args):
+    output = JpegOutput()
+    worker = cameraUtils.CameraWorker(camera, output, lambda settings: (encoder_class(q=settings["quality"]), file_output(output)),
+                                      fps=args.fps, encoder=args.encoder, standby=policy, standby_fps=args.standby_fps)
+    output.AddViewer()                    # Somebody is waiting for the picture
+    worker.Begin()
+    time.sleep(args.idle_seconds)         # Let the standby state settle
+    for _ in range(args.cycles):
+        starts = worker.Stats()["starts"]
+        worker.Start()
+        deadline = time.monotonic() + 10
+        while worker.Stats()["starts"] == starts and time.monotonic() < deadline:
+            time.sleep(0.002)
+        worker.Stop()
+        time.sleep(args.idle_seconds)     # Idle between visitors
+    stats = worker.Stats()
+    worker.Shutdown()
+    output.RemoveViewer()
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backend', type=str, default='fake', choices=['fake', 'pi'])
+    parser.add_argument('--encoder', type=str, default='cv2', choices=['cv2', 'jpeg'])
+    parser.add_argument('--policy', type=str, action='append', choices=['off', 'configured', 'warm'],
+                        help='standby policy to test (repeatable, default all three)')
+    parser.add_argument('--cycles', type=int, default=20)
+    parser.add_argument('--fps', type=int, default=24)
+    parser.add_argument('--standby-fps', type=int, default=2)
+    parser.add_argument('--idle-seconds', type=float, default=0.5, help='time in standby between starts')
+    parser.add_argument('--configure-ms', type=float, default=150, help='fake camera: time configure() takes')
+    parser.add_argument('--start-ms', type=float, default=250, help='fake camera: time start() takes')
+    args = parser.parse_args()
+
+    camera, encoder_class, file_output = make_camera(args)
+    print(f"{'policy':12} {'first picture avg':>18} {'max':>8}   idle sensor")
+    for policy in args.policy or ["off", "configured", "warm"]:
+        with contextlib.redirect_stdout(open(os.devnull, "w")):
+            stats = run(policy, camera, encoder_class, file_output, args)
+        idle = f"{args.standby_fps} fps, nothing encoded" if policy == "warm" else "stopped"
+        if stats["starts"]:
+            print(f"{policy:12} {stats['avg_ms']:15.1f} ms {stats['max_ms']:6.1f} ms   {idle}")
+        else:
+            print(f"{policy:12} {'no pictures':>18}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# === Camera Worker Soak Test ===
+# Turns the camera on and off thousands of times against the fake camera and checks
+# that the number of threads and the memory used stay flat.
+#
+#   python3 benchmarks/camera_worker_soak.py --cycles 5000
+import argparse, contextlib, os, sys, threading, time, tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import cameraUtils, streamUtils
+from fakeDevices import FakePicamera2
+
+# Stand-in for StreamingOutput that skips the JPEG step, so only the worker is measured
+class PassThroughOutput(streamUtils.FrameBroadcaster):
+    def EncodeFrame(self, frame, quality=85):
+        self.Publish(frame[:1, :16].tobytes())
+
+    def write(self, buf):
+        self.Publish(bytes(buf))
+
+    def flush(self):
+        pass
+
+def wait_until_idle(worker):
+    # Commands are handled in the background; wait until the queue has been emptied
+    while not worker.commands.empty():
+        time.sleep(0.0005)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cycles', type=int, default=5000, help='number of on/off cycles')
+    parser.add_argument('--encoder', type=str, default='cv2', choices=['cv2', 'jpeg'])
+    parser.add_argument('--max-growth-kb', type=int, default=256, help='allowed memory growth')
+    args = parser.parse_args()
+
+    output = PassThroughOutput()
+    camera = FakePicamera2(fps=1000)
+    worker = cameraUtils.CameraWorker(camera, output, lambda settings: (None, output),
+                                      fps=1000, encoder=args.encoder)
+    worker.Begin()
+
+    # Warm up once so one-off allocations don't count as growth
+    worker.Start(); output.AddViewer(); output.WaitForFrame(0, timeout=1)
+    output.RemoveViewer(); worker.Stop(); wait_until_idle(worker)
+    time.sleep(0.05)
+
+    tracemalloc.start()
+    threads_before = threading.active_count()
+    memory_before, _ = tracemalloc.get_traced_memory()
+    most_threads = threads_before
+    started = time.perf_counter()
+
+    quiet = contextlib.redirect_stdout(open(os.devnull, "w"))   # Hide the thousands of start/stop messages
+    quiet.__enter__()
+    for cycle in range(args.cycles):
+        worker.Start()
+        if cycle % 2 == 0:         # Every other cycle has a viewer, so frames are really captured
+            output.AddViewer()
+            output.WaitForFrame(output.sequence, timeout=1)
+            output.RemoveViewer()
+        worker.Stop()
+        if cycle % 100 == 0:
+            wait_until_idle(worker)
+            most_threads = max(most_threads, threading.active_count())
+
+    wait_until_idle(worker)
+    time.sleep(0.05)
+    quiet.__exit__(None, None, None)
+    elapsed = time.perf_counter() - started
+    threads_after = threading.active_count()
+    memory_after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    worker.Shutdown()
+
+    growth_kb = (memory_after - memory_before) / 1024
+    print(f"cycles:          {args.cycles} ({elapsed:.2f}s)")
+    print(f"frames captured: {output.sequence}")
+    print(f"threads:         {threads_before} -> {threads_after} (max {most_threads})")
+    print(f"memory growth:   {growth_kb:.1f} KB")
+
+    ok = threads_after == threads_before and most_threads <= threads_before + 1 and growth_kb < args.max_growth_kb
+    ok = ok and not worker.thread.is_alive()
+    print("✅ PASS" if ok else "❌ FAIL")
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+# === Local Detector Benchmark ===
+# Times the on-device person/package detector (detectUtils.py) on a folder of pictures, or on
+# the fake camera's made-up frames, in two ways:
+#   - model:   decode + detect in this program, for every --sizes / --batches combination:
+#              latency per batch (p50/p95), frames per second and CPU used (% of one core)
+#   - service: the real DetectionService (its own low-priority process, newest frames only, CPU
+#              budget) fed with the same JPEGs at --fps like the camera: how many frames it
+#              looked at, how many it skipped, and the CPU it actually used
+# Results can be saved and compared like benchmarks/suite.py (--output, --compare, --tolerance).
+#
+#   python3 benchmarks/detect_bench.py --model yolov8n.onnx --format yolo --labels coco.txt
+#   python3 benchmarks/detect_bench.py --model yolov8n.onnx --format yolo --images ./porch/ --sizes 256 320 416
+#   python3 benchmarks/detect_bench.py --model hog --batches 1 --output detect.json    (then --compare detect.json)
+import argparse, json, os, sys, threading, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import cv2
+import detectUtils
+import streamUtils
+from fakeDevices import FakePicamera2, LoadFrames
+from suite import compare, describe_machine, percentile
+
+def make_jpegs(args):
+    # The camera's JPEGs: the pictures in --images (shrunk to --width), or the fake camera's frames
+    if args.images:
+        pictures = LoadFrames(args.images, limit=args.count)
+    else:
+        camera = FakePicamera2()
+        camera.configure({"main": {"size": (args.width, args.width * 3 // 4)}})
+        camera.start()
+        pictures = [camera.capture_array() for _ in range(args.count)]
+    jpegs = []
+    for picture in pictures:
+        if picture.shape[1] != args.width:
+            picture = cv2.resize(picture, (args.width, picture.shape[0] * args.width // picture.shape[1]),
+                                 interpolation=cv2.INTER_AREA)
+        jpegs.append(cv2.imencode(".jpg", picture, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes())
+    return jpegs
+
+def settings_for(args, size):
+    return detectUtils.ModelSettings(args.model, config=args.config, labels=args.labels, format=args.format,
+                                     engine=args.engine, size=size, threshold=args.threshold, classes=(),
+                                     threads=args.threads, camera_width=args.width)
+
+def model_run(args, jpegs, size, batch):
+    settings = settings_for(args, size)
+    model = detectUtils.MakeModel(settings)
+    batches = [jpegs[i:i + batch] for i in range(0, len(jpegs) - batch + 1, batch)]
+    detectUtils.DecodeAndDetect(model, settings, batches[0])      # The first pass sets things up: not counted
+    times, found = [], 0
+    cpu_started, started = time.process_time(), time.perf_counter()
+    for pictures in batches[:max(1, args.batch_runs)]:
+        called = time.perf_counter()
+        found += sum(len(detections) for detections in detectUtils.DecodeAndDetect(model, settings, pictures))
+        times.append(time.perf_counter() - called)
+    cpu, elapsed = time.process_time() - cpu_started, time.perf_counter() - started
+    frames = batch * len(times)
+    return {"batch_p50_ms": round(1000 * percentile(times, 0.50), 2),
+            "batch_p95_ms": round(1000 * percentile(times, 0.95), 2),
+            "fps": round(frames / elapsed, 1), "cpu_percent": round(100 * cpu / elapsed, 1),
+            "found_per_frame": round(found / frames, 2)}
+
+def service_run(args, jpegs, size):
+    # Publishes the JPEGs like the camera would and lets the service keep up as well as it can
+    output = streamUtils.FrameBroadcaster()
+    latencies = []
+    service = detectUtils.DetectionService(output, settings_for(args, size),
+                                           lambda message: latencies.append(message["latency_ms"]),
+                                           cpu_budget=args.cpu, batch=args.batches[0])
+    service.Begin()
+    stop = threading.Event()
+    def camera():
+        index = 0
+        while not stop.wait(1 / args.fps):
+            output.Publish(jpegs[index % len(jpegs)])
+            index += 1
+    camera_thread = threading.Thread(target=camera, daemon=True)
+    camera_thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    camera_thread.join()
+    stats = service.Stats()
+    service.Close()
+    seen = max(1, stats["frames_seen"])
+    return {"detected_fps": round(stats["frames_detected"] / args.seconds, 1),
+            "skipped_percent": round(100 * stats["skipped"] / seen, 1),
+            "cpu_percent": stats["cpu_percent"], "avg_batch_ms": stats["avg_batch_ms"],
+            "published_latency_p95_ms": round(percentile(latencies, 0.95), 1) if latencies else None}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--images', type=str, help='folder of pictures (default: the fake camera\'s frames)')
+    parser.add_argument('--count', type=int, default=60, help='pictures to use')
+    parser.add_argument('--width', type=int, default=640, help='camera stream width the pictures are shrunk to')
+    parser.add_argument('--model', type=str, default='hog', help='hog | a model file (like --detect-model)')
+    parser.add_argument('--config', type=str)
+    parser.add_argument('--labels', type=str)
+    parser.add_argument('--format', type=str, default='ssd', choices=['ssd', 'yolo'])
+    parser.add_argument('--engine', type=str, default='opencv', choices=['opencv', 'onnxruntime'])
+    parser.add_argument('--threshold', type=float, default=0.5)
+    parser.add_argument('--threads', type=int, default=2)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[320], help='model input sizes to compare')
+    parser.add_argument('--batches', type=int, nargs='+', default=[1, 4], help='batch sizes to compare')
+    parser.add_argument('--batch-runs', type=int, default=30, help='batches timed for each combination')
+    parser.add_argument('--service', type=str, default='on', choices=['on', 'off'], help='also time the DetectionService')
+    parser.add_argument('--fps', type=float, default=24, help='camera frames per second for the service run')
+    parser.add_argument('--cpu', type=float, default=0.5, help="the service's CPU budget (share of one core)")
+    parser.add_argument('--seconds', type=float, default=10, help='length of the service run')
+    parser.add_argument('--output', type=str, help='save the results as JSON')
+    parser.add_argument('--compare', type=str, help='JSON from an earlier --output run to compare with')
+    parser.add_argument('--tolerance', type=float, default=15, help='percent worse that counts as a regression')
+    args = parser.parse_args()
+
+    cv2.setNumThreads(args.threads)
+    jpegs = make_jpegs(args)
+    print(f"🖼️  {len(jpegs)} pictures at {args.width} px, model {args.model} ({args.format}, {args.engine})")
+    results = {}
+    for size in args.sizes:
+        for batch in args.batches:
+            run = model_run(args, jpegs, size, batch)
+            print(f"   size {size:4}  batch {batch:2}  p50 {run['batch_p50_ms']:8.2f} ms  p95 {run['batch_p95_ms']:8.2f} ms  "
+                  f"{run['fps']:7.1f} fps  cpu {run['cpu_percent']:5.1f}%  found {run['found_per_frame']}/frame")
+            results[f"model_{size}_batch{batch}_p50_ms"] = run["batch_p50_ms"]
+            results[f"model_{size}_batch{batch}_p95_ms"] = run["batch_p95_ms"]
+            results[f"model_{size}_batch{batch}_frame_ms"] = round(1000 / run["fps"], 2) if run["fps"] else None
+    if args.service == "on":
+        size = args.sizes[0]
+        print(f"⏱️  service: {args.seconds:.0f} s at {args.fps:.0f} fps, budget {100 * args.cpu:.0f}% of a core, "
+              f"size {size}, batch {args.batches[0]}")
+        run = service_run(args, jpegs, size)
+        print(f"   looked at {run['detected_fps']} frames/s, skipped {run['skipped_percent']}%, "
+              f"cpu {run['cpu_percent']}%, {run['avg_batch_ms']} ms per batch")
+        results["service_detected_fps"] = run["detected_fps"]
+        results["service_batch_ms"] = run["avg_batch_ms"]
+        results["service_cpu_percent"] = run["cpu_percent"]
+        if run["published_latency_p95_ms"] is not None:
+            results["service_published_latency_p95_ms"] = run["published_latency_p95_ms"]
+
+    report = {"machine": describe_machine(), "settings": vars(args), "results": results}
+    print()
+    for name, value in results.items():
+        print(f"{name:44} {value if value is not None else '-':>10}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Saved to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} result(s) more than {args.tolerance:.0f}% worse than {args.compare}")
+            sys.exit(1)
+        print(f"\n✅ Nothing more than {args.tolerance:.0f}% worse than {args.compare}")
+
+if __name__ == '__main__':
+    main()
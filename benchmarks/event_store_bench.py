@@ -0,0 +1,159 @@
+# === Event History Benchmark ===
+# Fills an event database (eventUtils.py) with a synthetic year of bell presses, motion events
+# and AI answers, then times what the web app's timeline does:
+#   - fill:        how many events per second the batched writer saves
+#   - record:      what Record() costs the bell button (it only queues the event)
+#   - newest page: /events (the first 50)
+#   - deep page:   /events?before=<some old id>, anywhere in the year
+#   - kind page:   /events?kind=bell&before=<id> (bells are rare, so this skips many rows)
+#   - day:         /events?since=<day>&until=<day + 24 h>
+#   - thumbnail:   /events/<id>/thumb.jpg
+#   - offset page: the same deep page with OFFSET instead of "before", to show why it isn't used
+# Every query is also timed while events keep being written (WAL lets readers go on).
+# Use --path to put the database on the SD card; by default it goes in a temporary folder.
+#
+#   python3 benchmarks/event_store_bench.py
+#   python3 benchmarks/event_store_bench.py --events 500000 --path /home/pi/bench/events.db
+#   python3 benchmarks/event_store_bench.py --output events.json    (then --compare events.json)
+import argparse, json, os, random, shutil, sys, tempfile, threading, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import cv2
+import eventUtils
+from fakeDevices import FakePicamera2
+from suite import compare, describe_machine, percentile
+
+KINDS = [("motion", 0.80), ("bell", 0.05), ("ai", 0.15)]     # Share of each kind of event
+
+def make_thumbnail(width):
+    camera = FakePicamera2()
+    camera.start()
+    picture = camera.capture_array()
+    picture = cv2.resize(picture, (width, width * picture.shape[0] // picture.shape[1]), interpolation=cv2.INTER_AREA)
+    return cv2.imencode(".jpg", picture, [cv2.IMWRITE_JPEG_QUALITY, 70])[1].tobytes()
+
+def synthetic_detail(kind, rng):
+    if kind == "motion":
+        return {"score": round(rng.uniform(0.02, 0.4), 3)}
+    if kind == "ai":
+        return {"text": "A person in a blue jacket is standing at the door holding a small package."}
+    return None
+
+def fill(store, args, start):
+    # A year of events, in time order, as fast as the writer takes them
+    rng = random.Random(1)
+    kinds, weights = zip(*KINDS)
+    step = args.days * 86400 / args.events
+    record_times = []
+    started = time.perf_counter()
+    for index in range(args.events):
+        kind = rng.choices(kinds, weights)[0]
+        called = time.perf_counter()
+        store.Record(kind, synthetic_detail(kind, rng), timestamp=start + index * step)
+        record_times.append(time.perf_counter() - called)
+        if index % 10000 == 9999:
+            store.Flush(timeout=120)          # Keeps the queue (and memory) small
+    store.Flush(timeout=120)
+    return args.events / (time.perf_counter() - started), record_times
+
+def time_queries(store, args, start, newest_id, rng):
+    day = lambda: start + rng.randrange(args.days) * 86400
+    queries = {
+        "newest_page": lambda: store.Respond("/events", {}),
+        "deep_page": lambda: store.Respond(f"/events?before={rng.randrange(1, newest_id)}", {}),
+        "kind_page": lambda: store.Respond(f"/events?kind=bell&before={rng.randrange(1, newest_id)}", {}),
+        "day": lambda: store.Respond(f"/events?since={(since := day())}&until={since + 86400}", {}),
+        "thumbnail": lambda: store.Respond(f"/events/{rng.randrange(1, newest_id)}/thumb.jpg", {}),
+        "offset_page": lambda: offset_page(store, rng.randrange(newest_id)),
+    }
+    results = {}
+    for name, query in queries.items():
+        times = []
+        for _ in range(args.queries):
+            started = time.perf_counter()
+            query()
+            times.append(time.perf_counter() - started)
+        results[name] = times
+    return results
+
+def offset_page(store, skip):
+    with store._reader() as db:
+        return db.execute("SELECT id, time, kind, detail, thumb FROM events ORDER BY id DESC LIMIT 50 OFFSET ?",
+                          (skip,)).fetchall()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--events', type=int, default=200_000, help='events in the synthetic year')
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--thumbs', type=float, default=0.1, help='share of events with a thumbnail')
+    parser.add_argument('--thumb-width', type=int, default=160)
+    parser.add_argument('--queries', type=int, default=200, help='times each query is repeated')
+    parser.add_argument('--write-rate', type=float, default=50, help='events per second written during the "busy" queries')
+    parser.add_argument('--path', type=str, help='database file (default: a temporary folder, deleted afterwards)')
+    parser.add_argument('--output', type=str, help='save the results as JSON')
+    parser.add_argument('--compare', type=str, help='JSON from an earlier --output run to compare with')
+    parser.add_argument('--tolerance', type=float, default=15, help='percent worse that counts as a regression')
+    args = parser.parse_args()
+
+    folder = None
+    path = args.path
+    if not path:
+        folder = tempfile.mkdtemp(prefix="event-bench-")
+        path = os.path.join(folder, "events.db")
+    elif os.path.exists(path):
+        sys.exit(f"{path} already exists; give a new file")
+    thumb = make_thumbnail(args.thumb_width)
+    rng = random.Random(2)
+    store = eventUtils.EventStore(path, picture=lambda: thumb if rng.random() < args.thumbs else None,
+                                  batch_seconds=0.05, max_pending=20_000)
+    store.Begin()
+    start = time.time() - args.days * 86400
+    print(f"⏱️  writing {args.events} events over {args.days} days ({len(thumb)} byte thumbnails on {args.thumbs:.0%})")
+    rate, record_times = fill(store, args, start)
+    size = sum(os.path.getsize(path + suffix) for suffix in ("", "-wal") if os.path.exists(path + suffix))
+    newest_id = store.Query(limit=1)["events"][0]["id"]
+
+    print(f"   {rate:.0f} events/s saved, database {size / 1e6:.1f} MB")
+    results = {"fill_events_per_second": round(rate),
+               "record_call_p95_ms": round(1000 * percentile(record_times, 0.95), 4)}
+    print(f"⏱️  {args.queries} of each query")
+    quiet = time_queries(store, args, start, newest_id, random.Random(3))
+
+    # The same again while the writer keeps saving events
+    writing = threading.Event()
+    def keep_writing():
+        while not writing.wait(1 / args.write_rate):
+            store.Record("motion", {"score": 0.1})
+    writing_thread = threading.Thread(target=keep_writing, daemon=True)
+    writing_thread.start()
+    busy = time_queries(store, args, start, newest_id, random.Random(3))
+    writing.set()
+    writing_thread.join()
+    store.Close()
+    if folder:
+        shutil.rmtree(folder)
+
+    for name in quiet:
+        results[f"{name}_p50_ms"] = round(1000 * percentile(quiet[name], 0.50), 3)
+        results[f"{name}_p95_ms"] = round(1000 * percentile(quiet[name], 0.95), 3)
+        results[f"{name}_while_writing_p95_ms"] = round(1000 * percentile(busy[name], 0.95), 3)
+
+    report = {"machine": describe_machine(), "settings": vars(args), "results": results}
+    print()
+    for name, value in results.items():
+        print(f"{name:44} {value:>10}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Saved to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} result(s) more than {args.tolerance:.0f}% worse than {args.compare}")
+            sys.exit(1)
+        print(f"\n✅ Nothing more than {args.tolerance:.0f}% worse than {args.compare}")
+
+if __name__ == '__main__':
+    main()
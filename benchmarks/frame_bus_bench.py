@@ -0,0 +1,121 @@
+# === Frame Bus Benchmark ===
+# Add-on programs can get camera frames two ways: decode the JPEGs from /stream.mjpg, or read the
+# raw pictures from the shared-memory frame bus (frameBusUtils.py). This compares them:
+#   - the server's cost of writing one frame into the bus
+#   - each reader process: frames received, delay from write to read, and CPU per frame for
+#     reading from the bus vs. decoding the same JPEG (what an MJPEG reader has to do)
+#   - with --stress, the server writes as fast as it can and every reader checks that no picture
+#     was torn (half old frame, half new): each test picture is one flat color, so any mix shows
+# Readers are separate programs (this script started again with --as-reader), so they run on
+# other cores like real add-ons.
+#
+#   python3 benchmarks/frame_bus_bench.py --readers 3
+#   python3 benchmarks/frame_bus_bench.py --stress --readers 3 --seconds 5
+import argparse, json, os, subprocess, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import cv2
+import numpy as np
+import frameBusUtils
+from fakeDevices import FakePicamera2
+
+BUS_NAME = "orion-doorbell-frames-bench"
+
+def percentile(values, fraction):
+    return sorted(values)[min(len(values) - 1, int(fraction * len(values)))] if values else 0.0
+
+def reader(index, seconds, stress):
+    bus = frameBusUtils.FrameBusReader(BUS_NAME, poll_interval=0.001)
+    sequence, frames, delays, torn, gaps = 0, 0, [], 0, 0
+    read_seconds = decode_seconds = 0.0
+    cpu_started = time.process_time()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        if bus.WaitForFrame(sequence, timeout=0.5, copy=False) is None:
+            continue
+        started = time.perf_counter()
+        frame = bus.Latest()                            # The read itself: header check and copy of the picture
+        read_seconds += time.perf_counter() - started
+        if frame is None:
+            continue
+        delays.append(time.time() - frame.timestamp)
+        if sequence and frame.sequence > sequence + 1:
+            gaps += frame.sequence - sequence - 1       # Frames written while we were busy (only the newest counts)
+        sequence = frame.sequence
+        frames += 1
+        if stress:
+            if frame.picture.min() != frame.picture.max():
+                torn += 1
+        elif frame.jpeg:
+            started = time.perf_counter()
+            cv2.imdecode(np.frombuffer(frame.jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+            decode_seconds += time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+    bus.Close()
+    print(json.dumps({"reader": index, "frames": frames, "skipped": gaps, "torn": torn, "retries": bus.retries,
+                      "delay_p50_ms": 1000 * percentile(delays, 0.5), "delay_p95_ms": 1000 * percentile(delays, 0.95),
+                      "read_ms": 1000 * read_seconds / max(1, frames), "decode_ms": 1000 * decode_seconds / max(1, frames),
+                      "cpu_percent": 100 * cpu / seconds}))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--readers', type=int, default=2, help='number of reader processes')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--fps', type=int, default=24)
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    parser.add_argument('--stress', action='store_true', help='write as fast as possible and check for torn pictures')
+    parser.add_argument('--as-reader', type=int, help=argparse.SUPPRESS)     # Used for the reader programs
+    args = parser.parse_args()
+    if args.as_reader is not None:
+        reader(args.as_reader, args.seconds, args.stress)
+        return
+
+    bus = frameBusUtils.FrameBus(args.width, args.height, name=BUS_NAME)
+    bus.Begin()
+    command = [sys.executable, os.path.abspath(__file__), "--seconds", str(args.seconds + 1)] + (["--stress"] if args.stress else [])
+    processes = [subprocess.Popen(command + ["--as-reader", str(i)], stdout=subprocess.PIPE, text=True)
+                 for i in range(args.readers)]
+    while not bus.readers_present:                    # Wait for the first heartbeat
+        time.sleep(0.05)
+
+    camera = FakePicamera2()
+    camera.configure(camera.create_video_configuration(main={"size": (args.width, args.height)}))
+    camera.start()
+    flat = np.empty((args.height, args.width, 3), dtype=np.uint8)
+    publish_times, written = [], 0
+    deadline = time.monotonic() + args.seconds
+    next_frame = time.monotonic()
+    while time.monotonic() < deadline:
+        if args.stress:
+            flat[...] = written % 256
+            picture, jpeg = flat, None
+        else:
+            picture = camera.capture_array()
+            _, jpeg = cv2.imencode(".jpg", picture, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        started = time.perf_counter()
+        bus.Publish(picture, jpeg)
+        publish_times.append(time.perf_counter() - started)
+        written += 1
+        if not args.stress:
+            next_frame += 1 / args.fps
+            time.sleep(max(0.0, next_frame - time.monotonic()))
+
+    reports = [json.loads(process.communicate()[0].strip().splitlines()[-1]) for process in processes]
+    bus.Close()
+
+    print(f"server:  {written} frames of {args.width}x{args.height} written "
+          f"({written / args.seconds:.0f}/s), {1e6 * percentile(publish_times, 0.5):.0f} µs each "
+          f"(p95 {1e6 * percentile(publish_times, 0.95):.0f} µs)")
+    for report in reports:
+        line = (f"reader {report['reader']}: {report['frames']} frames ({report['skipped']} skipped), "
+                f"delay p50 {report['delay_p50_ms']:.2f} ms p95 {report['delay_p95_ms']:.2f} ms, "
+                f"{report['retries']} retries, {report['cpu_percent']:.1f}% CPU")
+        if args.stress:
+            line += f", {report['torn']} torn pictures"
+        else:
+            line += f", per frame: bus read {report['read_ms']:.2f} ms vs JPEG decode {report['decode_ms']:.2f} ms"
+        print(line)
+
+if __name__ == '__main__':
+    main()
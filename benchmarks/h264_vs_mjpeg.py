@@ -0,0 +1,186 @@
+# === H.264 vs MJPEG Stream Benchmark ===
+# Plays a recorded YUV video (raw I420 frames) in real time into both live streams, serves them
+# with the asyncio web server and measures, for viewers joining at random moments:
+#   - startup latency: request sent -> first picture the browser could show
+#   - bandwidth: bytes per second received while watching
+# No camera needed. H.264 is encoded with PyAV's libx264 here (the Pi uses its own encoder,
+# so sizes are close but not identical). Without --yuv, a made-up porch scene is used.
+#
+#   python3 benchmarks/h264_vs_mjpeg.py --seconds 20
+#   python3 benchmarks/h264_vs_mjpeg.py --yuv porch_640x480.yuv --size 640x480 --fps 24
+import argparse, asyncio, io, os, random, statistics, struct, sys, threading, time
+import numpy as np
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import streamUtils, webUtils, asyncServerUtils, h264Utils
+
+try:
+    import av
+except ImportError:
+    av = None
+
+def synthetic_porch(width, height, frames, fps):
+    # A still, textured scene with sensor noise, and somebody walking past for two seconds
+    rng = np.random.default_rng(1)
+    background = cv2.GaussianBlur(rng.integers(0, 255, (height, width), dtype=np.uint8), (0, 0), 6)
+    background = cv2.normalize(background, None, 40, 220, cv2.NORM_MINMAX)
+    for index in range(frames):
+        y = background.astype(np.int16) + rng.integers(-3, 4, background.shape, dtype=np.int16)
+        walking = index % (fps * 8)
+        if walking < fps * 2:
+            x = int(walking / (fps * 2) * (width + 80)) - 80
+            cv2.rectangle(y, (x, height // 4), (x + 80, height - 20), 30, -1)
+        y = np.clip(y, 0, 255).astype(np.uint8)
+        yield np.vstack([y, np.full((height // 2, width), 128, dtype=np.uint8)])   # I420 with gray color
+
+def yuv_file(path, width, height):
+    size = width * height * 3 // 2
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(size)
+            if len(data) < size:
+                return
+            yield np.frombuffer(data, dtype=np.uint8).reshape(height * 3 // 2, width)
+
+def feed(frames, fps, mjpeg, h264, quality, bitrate, keyframe_seconds, width, height, stop):
+    encoder = av.CodecContext.create("libx264", "w")
+    encoder.width, encoder.height, encoder.pix_fmt = width, height, "yuv420p"
+    encoder.framerate = fps
+    encoder.bit_rate = bitrate
+    encoder.options = {"preset": "ultrafast", "tune": "zerolatency", "repeat-headers": "1",
+                       "keyint": str(max(1, round(fps * keyframe_seconds)))}
+    scheduler = streamUtils.FrameScheduler(fps)
+    for index, i420 in enumerate(frames):
+        if stop.is_set():
+            return
+        time.sleep(scheduler.TimeUntilNextFrame())
+        scheduler.MarkFrame()
+        _, jpeg = cv2.imencode(".jpg", cv2.cvtColor(i420, cv2.COLOR_YUV2BGR_I420), [cv2.IMWRITE_JPEG_QUALITY, quality])
+        mjpeg.Publish(jpeg.tobytes())
+        frame = av.VideoFrame(width, height, "yuv420p")
+        for plane, data in zip(frame.planes, (i420[:height], i420[height:height + height // 4], i420[height + height // 4:])):
+            plane.update(data.tobytes())
+        frame.pts = index
+        for packet in encoder.encode(frame):
+            h264.write(bytes(packet))
+
+async def mjpeg_viewer(port, seconds, results):
+    started = time.monotonic()
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /stream.mjpg?quality=full HTTP/1.1\r\n\r\n")
+    received = len(await reader.readuntil(b"\r\n\r\n"))
+    first = None
+    deadline = started + seconds
+    try:
+        while time.monotonic() < deadline:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), deadline - time.monotonic())
+            length = int(head.split(b"Content-Length: ")[1].split(b"\r\n")[0])
+            await asyncio.wait_for(reader.readexactly(length + 2), deadline - time.monotonic())
+            received += len(head) + length + 2
+            first = first or time.monotonic() - started     # A whole JPEG: something to show
+    except asyncio.TimeoutError:
+        pass
+    writer.close()
+    results.append((first, received / (time.monotonic() - started)))
+
+async def mp4_viewer(port, seconds, results, captures):
+    started = time.monotonic()
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /stream.mp4 HTTP/1.1\r\n\r\n")
+    await reader.readuntil(b"\r\n\r\n")
+    data = bytearray()
+    first = None
+    deadline = started + seconds
+    try:
+        while time.monotonic() < deadline:
+            data += await asyncio.wait_for(reader.read(65536), deadline - time.monotonic())
+            if first is None and has_playable_fragment(data):
+                first = time.monotonic() - started          # Init segment + a whole keyframe fragment
+    except asyncio.TimeoutError:
+        pass
+    writer.close()
+    results.append((first, len(data) / (time.monotonic() - started)))
+    captures.append(bytes(data))
+
+def has_playable_fragment(data):
+    # Walk the top-level MP4 boxes: a complete "mdat" after the "moov" means one frame can be shown
+    offset, seen_moov = 0, False
+    while offset + 8 <= len(data):
+        size, kind = struct.unpack_from(">I4s", data, offset)
+        if offset + size > len(data):
+            return False
+        seen_moov = seen_moov or kind == b"moov"
+        if kind == b"mdat" and seen_moov:
+            return True
+        offset += size
+    return False
+
+async def run_viewers(port, viewers, seconds, join_window):
+    mjpeg, mp4, captures = [], [], []
+    async def join(viewer, *args):
+        await asyncio.sleep(random.uniform(0, join_window))    # Join at a random moment in the GOP
+        await viewer(port, seconds, *args)
+    await asyncio.gather(*[join(mjpeg_viewer, mjpeg) for _ in range(viewers)],
+                         *[join(mp4_viewer, mp4, captures) for _ in range(viewers)])
+    return mjpeg, mp4, captures
+
+def summary(name, results):
+    latencies = [first * 1000 for first, _ in results if first is not None]
+    rates = [rate * 8 / 1000 for _, rate in results]
+    print(f"{name:6} startup ms: median {statistics.median(latencies):6.0f}  max {max(latencies):6.0f}   "
+          f"bandwidth: median {statistics.median(rates):7.0f} kbit/s")
+    return statistics.median(rates)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--yuv', type=str, help='raw I420 video file (default: a made-up porch scene)')
+    parser.add_argument('--save-yuv', type=str, help='write the made-up scene to this file for later runs')
+    parser.add_argument('--size', type=str, default='640x480')
+    parser.add_argument('--fps', type=int, default=24)
+    parser.add_argument('--seconds', type=float, default=16, help='how long each viewer watches')
+    parser.add_argument('--viewers', type=int, default=8, help='viewers per stream type')
+    parser.add_argument('--quality', type=int, default=85, help='MJPEG quality')
+    parser.add_argument('--bitrate', type=int, default=1_000_000, help='H.264 bitrate (bits per second)')
+    parser.add_argument('--keyframe-seconds', type=float, default=1.0)
+    parser.add_argument('--port', type=int, default=8766)
+    args = parser.parse_args()
+    if av is None:
+        sys.exit("PyAV is needed for the H.264 encoder: pip install av")
+    width, height = map(int, args.size.split("x"))
+
+    total_frames = int(args.fps * (args.seconds + 4))
+    if args.yuv:
+        frames = yuv_file(args.yuv, width, height)
+    else:
+        frames = list(synthetic_porch(width, height, total_frames, args.fps))
+        if args.save_yuv:
+            with open(args.save_yuv, "wb") as f:
+                for frame in frames:
+                    f.write(frame.tobytes())
+
+    mjpeg = streamUtils.FrameBroadcaster()
+    h264 = h264Utils.H264Stream(width, height, args.fps, ring_size=int(3 * args.fps * args.keyframe_seconds))
+    server = asyncServerUtils.AsyncStreamServer(webUtils.Router(), {"/stream.mjpg": mjpeg}, args.port,
+                                                mp4_streams={"/stream.mp4": h264})
+    sys.stdout = open(os.devnull, "w")          # Hide the server's "stream requested" messages
+    threading.Thread(target=server.ServeForever, daemon=True).start()
+    stop = threading.Event()
+    threading.Thread(target=feed, daemon=True,
+                     args=(frames, args.fps, mjpeg, h264, args.quality, args.bitrate,
+                           args.keyframe_seconds, width, height, stop)).start()
+    time.sleep(1.0)                             # Let both streams get going
+    mjpeg_results, mp4_results, captures = asyncio.run(
+        run_viewers(args.port, args.viewers, args.seconds, join_window=2 * args.keyframe_seconds))
+    stop.set()
+    sys.stdout = sys.__stdout__
+
+    # Check that what the H.264 viewers received really decodes
+    decoded = sum(1 for _ in av.open(io.BytesIO(captures[0]), format="mp4").decode(video=0))
+    print(f"video:  {width}x{height} @ {args.fps} fps, {'file ' + args.yuv if args.yuv else 'synthetic porch scene'}")
+    mjpeg_rate = summary("MJPEG", mjpeg_results)
+    mp4_rate = summary("H.264", mp4_results)
+    print(f"H.264 uses {mjpeg_rate / mp4_rate:.1f}x less bandwidth; one viewer decoded {decoded} frames")
+
+if __name__ == '__main__':
+    main()
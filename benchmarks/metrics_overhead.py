@@ -0,0 +1,127 @@
+# === Metrics Overhead Benchmark ===
+# Checks that the built-in metrics stay cheap (the goal is under 1% of the CPU):
+#   1. the cost of one recorded value (timer, counter), with metrics on and off
+#   2. a real streaming run: fake camera at 24 fps -> OpenCV JPEGs -> asyncio web server ->
+#      several viewers on "full" and "medium" quality. Every value recorded during the run is
+#      counted, and (values x cost per value) is compared with the CPU the run used
+#   3. how long building the /metrics page takes
+#   4. how much the sampling profiler slows a busy Python thread while it is on
+# No camera needed.
+#
+#   python3 benchmarks/metrics_overhead.py --seconds 10 --viewers 4
+import argparse, asyncio, contextlib, os, sys, threading, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import cv2
+import metricsUtils, cameraUtils, streamUtils, webUtils, asyncServerUtils, qualityUtils
+from fakeDevices import FakePicamera2
+
+class JpegOutput(streamUtils.FrameBroadcaster):
+    def EncodeFrame(self, frame, quality=85):
+        _, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        self.Publish(jpeg.tobytes())
+
+def cost_per_call(function, calls=200_000):
+    started = time.perf_counter()
+    for _ in range(calls):
+        function()
+    return (time.perf_counter() - started) / calls
+
+def recorded_values():
+    # How many timed values were recorded so far (every histogram observation)
+    total = 0
+    for family in list(metricsUtils.REGISTRY.families.values()):
+        if family.kind == "histogram":
+            total += sum(child.count for _, child in family.Samples())
+    return total
+
+async def viewer(port, tier, seconds, counts):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET /stream.mjpg?quality={tier} HTTP/1.1\r\n\r\n".encode())
+    await reader.readuntil(b"\r\n\r\n")
+    deadline = time.monotonic() + seconds
+    try:
+        while time.monotonic() < deadline:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), deadline - time.monotonic())
+            length = int(head.split(b"Content-Length: ")[1].split(b"\r\n")[0])
+            await reader.readexactly(length + 2)
+            counts.append(1)
+    except asyncio.TimeoutError:
+        pass
+    writer.close()
+
+def streaming_run(seconds, viewers, port):
+    output = JpegOutput()
+    worker = cameraUtils.CameraWorker(FakePicamera2(fps=24), output, fps=24, encoder="cv2")
+    server = asyncServerUtils.AsyncStreamServer(webUtils.Router(), {"/stream.mjpg": output}, port,
+                                                tier_encoder=qualityUtils.TierEncoder())
+    counts = []
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        threading.Thread(target=server.ServeForever, daemon=True).start()
+        worker.Begin()
+        worker.Start()
+        time.sleep(0.5)
+        values_before = recorded_values()
+        cpu_before = time.process_time()
+        tiers = ["full", "medium"] * viewers
+        async def watch():
+            await asyncio.gather(*(viewer(port, tiers[i], seconds, counts) for i in range(viewers)))
+        asyncio.run(watch())
+        cpu = time.process_time() - cpu_before
+        values = recorded_values() - values_before
+        worker.Shutdown()
+    return cpu, values, len(counts)
+
+def busy_loop(seconds):
+    # Pure Python work, the kind the profiler's sampling competes with for the GIL
+    done, deadline = 0, time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        sum(i * i for i in range(200))
+        done += 1
+    return done
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=float, default=10, help='length of the streaming run')
+    parser.add_argument('--viewers', type=int, default=4)
+    parser.add_argument('--profile-interval-ms', type=float, default=10)
+    parser.add_argument('--port', type=int, default=8767)
+    args = parser.parse_args()
+
+    histogram = metricsUtils.STAGE_SECONDS.Labels("benchmark")
+    counter = metricsUtils.REGISTRY.Counter("doorbell_benchmark_total", "benchmark").Labels()
+    observe = cost_per_call(lambda: histogram.Observe(0.003))
+    timed = cost_per_call(lambda: histogram.Observe(time.perf_counter() - time.perf_counter()))
+    increment = cost_per_call(lambda: counter.Inc(1000))
+    metricsUtils.REGISTRY.enabled = False
+    observe_off = cost_per_call(lambda: histogram.Observe(0.003))
+    metricsUtils.REGISTRY.enabled = True
+    print(f"one timer value:   {1e9 * observe:5.0f} ns ({1e9 * timed:.0f} ns with the two clock reads), "
+          f"{1e9 * observe_off:.0f} ns with --metrics off")
+    print(f"one counter value: {1e9 * increment:5.0f} ns")
+
+    cpu, values, frames = streaming_run(args.seconds, args.viewers, args.port)
+    # Counters are bumped about twice per timed value in the hot paths (frames + bytes)
+    overhead = values * (timed + 2 * increment)
+    print(f"streaming run:     {frames} frames to {args.viewers} viewers in {args.seconds:.0f} s, "
+          f"{values / args.seconds:.0f} timed values/s, CPU {100 * cpu / args.seconds:.1f}% of a core")
+    print(f"metrics overhead:  {1000 * overhead / args.seconds:.3f} ms CPU per second = "
+          f"{100 * overhead / max(cpu, 1e-9):.3f}% of the run's CPU")
+
+    pages = 200
+    started = time.perf_counter()
+    for _ in range(pages):
+        body = metricsUtils.REGISTRY.Render()
+    print(f"/metrics page:     {1000 * (time.perf_counter() - started) / pages:.2f} ms to build "
+          f"({len(body)} bytes, {body.count(chr(10))} lines)")
+
+    quiet = busy_loop(2.0)
+    profiler = metricsUtils.SamplingProfiler(args.profile_interval_ms / 1000)
+    profiler.Start()
+    profiled = busy_loop(2.0)
+    report = profiler.Stop()
+    print(f"profiler on:       busy thread {100 * (1 - profiled / quiet):+.1f}% slower while sampling every "
+          f"{args.profile_interval_ms:.0f} ms ({report.splitlines()[0].lstrip('# ')})")
+
+if __name__ == '__main__':
+    main()
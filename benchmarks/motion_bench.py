@@ -0,0 +1,82 @@
+# === Motion Detector Benchmark ===
+# Runs the software motion detector over a recorded sequence of frames (no camera needed)
+# and reports how long each frame takes and which frames would count as motion.
+#
+#   python3 benchmarks/motion_bench.py                      # made-up test sequence
+#   python3 benchmarks/motion_bench.py --frames ./porch/    # folder of images, played in name order
+#   python3 benchmarks/motion_bench.py --frames clip.npy    # NumPy array shaped (frames, height, width)
+#   python3 benchmarks/motion_bench.py --threshold 0.01 0.02 0.05   # compare several thresholds
+import argparse, os, sys, time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import motionUtils
+
+def synthetic_frames(count=300, size=(120, 160), seed=1):
+    # A noisy, still porch with slow light changes, and a "person" walking through frames 150-200
+    rng = np.random.default_rng(seed)
+    height, width = size
+    scene = rng.integers(40, 200, size, dtype=np.uint8).astype(np.int16)
+    frames = []
+    for i in range(count):
+        frame = scene + int(10 * np.sin(i / 40))                       # Sunlight slowly changing
+        frame = frame + rng.integers(-6, 7, size, dtype=np.int16)      # Sensor noise
+        if 150 <= i < 200:
+            x = (i - 150) * (width - 30) // 50
+            frame[30:100, x:x + 30] = 230                              # Something bright moving across
+        frames.append(np.clip(frame, 0, 255).astype(np.uint8))
+    return frames
+
+def load_frames(path, size):
+    if path.endswith(".npy"):
+        return list(np.load(path))
+    import cv2
+    frames = []
+    for name in sorted(os.listdir(path)):
+        image = cv2.imread(os.path.join(path, name), cv2.IMREAD_GRAYSCALE)
+        if image is not None:
+            frames.append(cv2.resize(image, (size[1], size[0]), interpolation=cv2.INTER_AREA))
+    return frames
+
+def run(frames, threshold, args):
+    detector = motionUtils.MotionDetector(threshold, args.pixel_threshold, args.learning_rate)
+    times, scores, hits = [], [], []
+    for index, frame in enumerate(frames):
+        started = time.perf_counter()
+        score, regions = detector.Process(frame)
+        times.append(time.perf_counter() - started)
+        scores.append(score)
+        if detector.IsMotion(score):
+            hits.append(index)
+    times_ms = np.array(times) * 1000
+    print(f"threshold {threshold:<6} frames {len(frames)}  "
+          f"mean {times_ms.mean():.2f} ms  p95 {np.percentile(times_ms, 95):.2f} ms  max {times_ms.max():.2f} ms  "
+          f"max score {max(scores):.3f}  motion frames {len(hits)}")
+    if hits and args.verbose:
+        print("   motion at frames:", hits)
+    return hits
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=str, help='folder of images or a .npy file (default: made-up sequence)')
+    parser.add_argument('--width', type=int, default=160)
+    parser.add_argument('--height', type=int, default=120)
+    parser.add_argument('--threshold', type=float, nargs='+', default=[0.02])
+    parser.add_argument('--pixel-threshold', type=int, default=25)
+    parser.add_argument('--learning-rate', type=float, default=0.05)
+    parser.add_argument('--verbose', action='store_true', help='list the frames that counted as motion')
+    args = parser.parse_args()
+
+    size = (args.height, args.width)
+    frames = load_frames(args.frames, size) if args.frames else synthetic_frames(size=size)
+    print(f"🎞️ {len(frames)} frames of {frames[0].shape[1]}x{frames[0].shape[0]}")
+    for threshold in args.threshold:
+        hits = run(frames, threshold, args)
+        if not args.frames:
+            # The made-up sequence has motion only in frames 150-199, so we can score the detector
+            expected = set(range(150, 200))
+            found = set(hits)
+            print(f"   caught {len(found & expected)}/50 motion frames, {len(found - expected)} flagged outside it (false alarms or fading trails)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+# === Start-up Benchmark ===
+# How soon after "python3 ring_server.py" the doorbell is usable, measured on a fresh program
+# each time (so the time to import the libraries counts, like after a power cut):
+#   - import: what "import ring_server" costs, and which of its imports take the longest
+#     (from python -X importtime; OpenCV, NumPy and the camera library should not be in it)
+#   - http: the web port accepts connections
+#   - ready: /ready answers 200, i.e. camera, chime, audio, sensors (and AI) are all set up,
+#     with the time each part was ready
+# Results can be saved and compared like benchmarks/suite.py (--output, --compare, --tolerance).
+#
+#   python3 benchmarks/startup_bench.py --runs 5
+#   python3 benchmarks/startup_bench.py --output startup.json
+#   python3 benchmarks/startup_bench.py --compare startup.json --backend pi
+import argparse, contextlib, json, os, signal, socket, statistics, subprocess, sys, time, urllib.error, urllib.request
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+from suite import compare, describe_machine
+
+HEAVY_LIBRARIES = ["cv2", "numpy", "requests", "av", "picamera2", "gpiozero", "pyaudio", "pulsectl"]
+
+def import_times():
+    # python -X importtime prints "import time: self [us] | cumulative | name" (deeper imports are indented)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import ring_server"],
+                            cwd=REPO, capture_output=True, text=True)
+    # A module is printed after everything it imported, so ring_server's own imports are the
+    # least-indented lines since the previous top-level one
+    rows, total = [], None
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth, name, ms = len(name) - len(name.lstrip()) - 1, name.strip(), int(cumulative) / 1000
+        if depth == 0 and name == "ring_server":
+            total = ms
+            break
+        rows = [] if depth == 0 else rows + [(depth, name, ms)]
+    children = sorted(((ms, name) for depth, name, ms in rows if depth == 2), reverse=True)
+    loaded = [name for name in HEAVY_LIBRARIES if any(row[1] == name for row in rows)]
+    return total, children, loaded
+
+def start_once(args, port):
+    # Starts the server as its own program and times it until the port is open and /ready says 200
+    command = [sys.executable, "ring_server.py", "--backend", args.backend, "--port", str(port),
+               "--stats-interval", "0", "--ai", args.ai]
+    started = time.perf_counter()
+    server = subprocess.Popen(command, cwd=REPO, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    http = ready = None
+    status = {}
+    deadline = time.monotonic() + args.timeout
+    try:
+        while time.monotonic() < deadline and server.poll() is None:
+            if http is None:
+                with contextlib.suppress(OSError), socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                    http = time.perf_counter() - started
+            if http is not None:
+                try:
+                    with urllib.request.urlopen(f"http://127.0.0.1:{port}/ready", timeout=2) as response:
+                        status = json.load(response)
+                        ready = time.perf_counter() - started
+                        break
+                except urllib.error.HTTPError as e:
+                    status = json.load(e)          # 503 while starting: still has the parts' progress
+                except OSError:
+                    pass
+            time.sleep(0.005)
+    finally:
+        server.send_signal(signal.SIGINT)          # Same clean shutdown as Ctrl+C
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+    parts = {name: part["seconds"] for name, part in status.get("parts", {}).items() if part["state"] == "ready"}
+    return http, ready, parts
+
+def median_ms(values):
+    values = [value for value in values if value is not None]
+    return round(1000 * statistics.median(values), 2) if values else None
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5, help='fresh server starts to measure (the median is reported)')
+    parser.add_argument('--backend', type=str, default='fake', choices=['fake', 'pi'])
+    parser.add_argument('--ai', type=str, default='stub', choices=['off', 'stub'])
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--timeout', type=float, default=30, help='seconds to wait for /ready')
+    parser.add_argument('--output', type=str, help='save the results as JSON')
+    parser.add_argument('--compare', type=str, help='JSON from an earlier --output run to compare with')
+    parser.add_argument('--tolerance', type=float, default=10, help='percent worse that counts as a regression')
+    args = parser.parse_args()
+
+    results = {}
+    total, children, loaded = import_times()
+    print(f"📦 import ring_server: {total:.0f} ms")
+    for ms, name in children[:10]:
+        print(f"   {name:28} {ms:8.1f} ms")
+    print(f"   heavy libraries loaded at import: {', '.join(loaded) or 'none'}")
+    results["import_ring_server_ms"] = round(total, 2) if total is not None else None
+
+    runs = [start_once(args, args.port) for _ in range(args.runs)]
+    results["startup_http_open_ms"] = median_ms([http for http, ready, parts in runs])
+    results["startup_ready_ms"] = median_ms([ready for http, ready, parts in runs])
+    for name in sorted({name for _, _, parts in runs for name in parts}):
+        results[f"startup_{name}_ready_ms"] = median_ms([parts.get(name) for _, _, parts in runs])
+    if any(ready is None for _, ready, _ in runs):
+        print(f"⚠️ {sum(ready is None for _, ready, _ in runs)} of {args.runs} starts never got ready")
+
+    report = {"machine": describe_machine(), "settings": vars(args), "results": results}
+    print(f"\n🚀 median of {args.runs} starts (part times are counted from the start of main())")
+    for name, value in results.items():
+        print(f"{name:44} {value if value is not None else '-':>10}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Saved to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} result(s) more than {args.tolerance:.0f}% worse than {args.compare}")
+            sys.exit(1)
+        print(f"\n✅ Nothing more than {args.tolerance:.0f}% worse than {args.compare}")
+
+if __name__ == '__main__':
+    main()
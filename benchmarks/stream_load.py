@@ -0,0 +1,100 @@
+# === MJPEG Stream Load Test ===
+# Starts a web server in a separate process that streams ~50 KB fake frames at 24 fps,
+# connects many viewers at once and reports the frames per second each viewer got,
+# plus the server's memory (RSS) and thread count.
+#
+#   python3 benchmarks/stream_load.py --server asyncio --clients 60
+#   python3 benchmarks/stream_load.py --server threaded --clients 60   (imports ring_server: run it on the Pi)
+import argparse, asyncio, multiprocessing, os, statistics, sys, threading, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+def process_status(pid):
+    # Memory (kB) and thread count of a process, straight from Linux
+    status = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            status[name] = value.split()[0] if value.split() else ""
+    return int(status["VmRSS"]), int(status["Threads"])
+
+def run_server(kind, port, fps, frame_kb):
+    import streamUtils, webUtils
+    sys.stdout = open(os.devnull, "w")     # Hide the "stream requested" message of every viewer
+    output = streamUtils.FrameBroadcaster()
+    routes = webUtils.Router()
+
+    def camera():
+        # Publish a new (different) frame on time, like the real camera does
+        frame = bytearray(os.urandom(frame_kb * 1024))
+        scheduler = streamUtils.FrameScheduler(fps)
+        while True:
+            time.sleep(scheduler.TimeUntilNextFrame())
+            scheduler.MarkFrame()
+            frame[:4] = scheduler.frames.to_bytes(4, "big")
+            output.Publish(bytes(frame))
+    threading.Thread(target=camera, daemon=True).start()
+
+    if kind == "asyncio":
+        import asyncServerUtils
+        asyncServerUtils.AsyncStreamServer(routes, {"/stream.mjpg": output}, port).ServeForever()
+    else:
+        import ring_server
+        ring_server.output = output
+        ring_server.routes = routes
+        ring_server.StreamingServer(('', port), ring_server.StreamingHandler).serve_forever()
+
+async def viewer(port, seconds, counts, index):
+    # Reads the multipart stream and counts the frames that arrive
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /stream.mjpg HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    await reader.readuntil(b"\r\n\r\n")
+    deadline = time.monotonic() + seconds
+    try:
+        while time.monotonic() < deadline:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), deadline - time.monotonic())
+            length = int(head.split(b"Content-Length: ")[1].split(b"\r\n")[0])
+            await reader.readexactly(length + 2)
+            counts[index] += 1
+    except asyncio.TimeoutError:
+        pass
+    writer.close()
+
+async def run_clients(port, clients, seconds):
+    counts = [0] * clients
+    await asyncio.gather(*(viewer(port, seconds, counts, i) for i in range(clients)))
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--server', type=str, default='asyncio', choices=['asyncio', 'threaded'])
+    parser.add_argument('--clients', type=int, default=60, help='number of viewers at once')
+    parser.add_argument('--seconds', type=float, default=10, help='how long each viewer watches')
+    parser.add_argument('--fps', type=int, default=24)
+    parser.add_argument('--frame-kb', type=int, default=50, help='size of each fake JPEG')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    server = multiprocessing.Process(target=run_server, daemon=True,
+                                     args=(args.server, args.port, args.fps, args.frame_kb))
+    server.start()
+    time.sleep(1.0)    # Give the server a moment to start listening
+    rss_idle, threads_idle = process_status(server.pid)
+
+    # Measure the server halfway through, while every viewer is connected
+    peak = []
+    sampler = threading.Timer(args.seconds / 2, lambda: peak.append(process_status(server.pid)))
+    sampler.start()
+    counts = asyncio.run(run_clients(args.port, args.clients, args.seconds))
+    rss_busy, threads_busy = peak[0]
+    server.terminate()
+
+    per_client = [count / args.seconds for count in counts]
+    print(f"server:         {args.server}")
+    print(f"viewers:        {args.clients} for {args.seconds:.0f}s, {args.frame_kb} KB frames at {args.fps} fps")
+    print(f"fps per viewer: min {min(per_client):.1f}  median {statistics.median(per_client):.1f}  max {max(per_client):.1f}")
+    print(f"server RSS:     {rss_idle / 1024:.1f} MB idle -> {rss_busy / 1024:.1f} MB with viewers")
+    print(f"server threads: {threads_idle} idle -> {threads_busy} with viewers")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,311 @@
+# === Benchmark Suite (no Raspberry Pi needed) ===
+# Runs the whole doorbell server (ring_server.main) with --backend fake: a made-up or recorded
+# camera, a WAV file (or hiss) as the microphone, buttons pressed from code and the MQTT broker
+# inside this program. Then it measures what a person at the door or in the app would notice:
+#   - frames per second and end-to-end frame latency (camera capture -> JPEG at a viewer) for
+#     1, 4, 8, ... viewers of /stream.mjpg
+#   - audio publish latency: sound recorded by the microphone -> its packet arrives over MQTT
+#   - command round trips: camera "on" -> first frame, microphone "on" -> first sound packet,
+#     AI request -> answer (local stub server), button press -> chime starts
+#   - start-up: web port open and every part ready (see benchmarks/startup_bench.py for a fresh
+#     program, including the time to import the libraries)
+# The results can be saved as JSON (--output) and compared with an earlier run (--compare):
+# anything that got worse by more than --tolerance is listed, and the exit code is 1.
+#
+#   python3 benchmarks/suite.py --output baseline.json
+#   python3 benchmarks/suite.py --compare baseline.json --tolerance 15
+#   python3 benchmarks/suite.py --viewers 1,4,16 --server asyncio --fake-video porch.mp4
+import argparse, asyncio, contextlib, json, os, platform, socket, subprocess, sys, threading, time
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO)
+import audioUtils, fakeDevices, ring_server
+
+# Which way is better for each kind of result (used by --compare)
+LOWER_IS_BETTER = ("_ms", "_cpu_percent")
+MIN_CHANGE = 1.0      # Changes smaller than this (1 ms, 1 fps, 1% CPU) are never called a regression
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def summary_ms(values, prefix):
+    if not values:
+        return {}
+    return {f"{prefix}_p50_ms": round(1000 * percentile(values, 0.50), 2),
+            f"{prefix}_p95_ms": round(1000 * percentile(values, 0.95), 2),
+            f"{prefix}_max_ms": round(1000 * max(values), 2)}
+
+def log(*text):
+    print(*text, file=sys.__stderr__)    # The server's own messages are hidden while it runs (it prints a lot)
+
+
+# === Starting the Server ===
+def start_server(args):
+    argv = ["--backend", "fake", "--server", args.server, "--encoder", args.encoder, "--port", str(args.port),
+            "--fps", str(args.fps), "--width", str(args.width), "--height", str(args.height),
+            "--camera-standby", args.camera_standby, "--ai", "stub", "--stats-interval", "0", "--h264", "off"]
+    if args.fake_video:
+        argv += ["--fake-video", args.fake_video]
+    if args.fake_audio:
+        argv += ["--fake-audio", args.fake_audio]
+    thread = threading.Thread(target=ring_server.main, args=(argv,), name="ring-server", daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        with contextlib.suppress(OSError), socket.create_connection(("127.0.0.1", args.port), timeout=0.5):
+            break
+        time.sleep(0.1)
+    else:
+        sys.exit(f"the server did not start on port {args.port}")
+    # The camera, sound and sensors start in the background; the measurements need all of them
+    if not ring_server.startup.WaitFor(timeout=max(1.0, deadline - time.monotonic())):
+        sys.exit(f"the server did not get ready: {json.dumps(ring_server.startup.Status()['parts'])}")
+    return thread
+
+def startup_times():
+    parts = ring_server.startup.Status()["parts"]
+    return {"startup_http_ms": round(1000 * parts["http"]["seconds"], 2),
+            "startup_ready_ms": round(1000 * max(part["seconds"] for part in parts.values()), 2)}
+
+# Listens on the fake broker like the web app would, and remembers when each message arrived
+class AppListener:
+    def __init__(self, topics):
+        self.condition = threading.Condition()
+        self.messages = []               # (arrival time, topic, payload)
+        self.client = fakeDevices.FakeMqttClient()
+        self.client.on_message = self._on_message
+        self.client.connect()
+        for topic in topics:
+            self.client.subscribe(topic)
+        self.client.loop_start()
+
+    def _on_message(self, client, userdata, message):
+        with self.condition:
+            self.messages.append((time.perf_counter(), message.topic, message.payload))
+            self.condition.notify_all()
+
+    def Send(self, topic, payload):
+        self.client.publish(topic, payload)
+
+    def WaitFor(self, topic, after, test=lambda payload: True, timeout=10):
+        # Arrival time of the first matching message that came after "after" (None on timeout)
+        def found():
+            for arrived, message_topic, payload in self.messages:
+                if arrived >= after and message_topic == topic and test(payload):
+                    return arrived
+        with self.condition:
+            self.condition.wait_for(lambda: found() is not None, timeout)
+            return found()
+
+    def Clear(self):
+        with self.condition:
+            self.messages.clear()
+
+    def Close(self):
+        self.client.disconnect()
+        self.client.loop_stop()
+
+
+# === Frames: fps and latency for N viewers ===
+async def viewer(port, seconds, capture_times, latencies, counts):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /stream.mjpg HTTP/1.1\r\nHost: doorbell\r\n\r\n")
+    await reader.readuntil(b"\r\n\r\n")
+    deadline = time.monotonic() + seconds
+    frames = 0
+    try:
+        while time.monotonic() < deadline:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), deadline - time.monotonic())
+            length = int(head.split(b"Content-Length: ")[1].split(b"\r\n")[0])
+            jpeg = await reader.readexactly(length + 2)
+            arrived = time.perf_counter()
+            captured = capture_times.get(hash(jpeg[:-2]))
+            if captured and frames:     # The first frame may be an old one, left over from before
+                latencies.append(arrived - captured)
+            frames += 1
+    except asyncio.TimeoutError:
+        pass
+    counts.append(frames)
+    writer.close()
+
+def frame_run(args, viewers, capture_times):
+    latencies, counts = [], []
+    async def watch():
+        await asyncio.gather(*(viewer(args.port, args.seconds, capture_times, latencies, counts)
+                               for _ in range(viewers)))
+    cpu_before = time.process_time()
+    asyncio.run(watch())
+    cpu = time.process_time() - cpu_before
+    result = {f"viewers_{viewers}_fps": round(sum(counts) / len(counts) / args.seconds, 2),
+              f"viewers_{viewers}_cpu_percent": round(100 * cpu / args.seconds, 1)}
+    result.update(summary_ms(latencies, f"viewers_{viewers}_frame_latency"))
+    return result
+
+def remember_capture_times(capture_times):
+    # Every frame goes through output.Publish on the camera's thread right after it was captured and
+    # encoded, so the newest capture time belongs to it. Noted before viewers are woken up.
+    output, publish = ring_server.output, ring_server.output.Publish
+    def remembering_publish(frame):
+        capture_times[hash(frame)] = ring_server.camera.last_capture_time
+        if len(capture_times) > 500:
+            capture_times.pop(next(iter(capture_times)))
+        return publish(frame)
+    output.Publish = remembering_publish
+
+
+# === Audio: publish latency ===
+def audio_run(args, app):
+    header = audioUtils.AUDIO_PACKET_HEADER
+    frame_seconds = 20 / 1000                      # --audio-frame-ms default
+    app.Clear()
+    sent_at = time.perf_counter()
+    app.Send(ring_server.REMOTE_APP_MICROPHONE_CONTROL_TOPIC, "on")
+    first = app.WaitFor("ring/audioresponse", sent_at)
+    time.sleep(args.seconds)
+    app.Send(ring_server.REMOTE_APP_MICROPHONE_CONTROL_TOPIC, "off")
+    time.sleep(0.5)
+    microphone = ring_server.audio_streamer.input.input_stream    # The fake microphone stream that was used
+    latencies = []
+    for arrived, topic, payload in list(app.messages):
+        if topic != "ring/audioresponse" or len(payload) < header.size:
+            continue
+        sequence = header.unpack_from(payload)[4]
+        # Packet n holds the sound recorded between n and n+1 frame lengths after the microphone opened
+        recorded = microphone.opened_at + (sequence + 1) * frame_seconds
+        latencies.append(arrived - recorded)
+    result = {"microphone_on_to_first_packet_ms": round(1000 * (first - sent_at), 2) if first else None}
+    result.update(summary_ms(latencies, "audio_publish_latency"))
+    return result
+
+
+# === Commands: round trips ===
+def camera_round_trip(app, frame_arrived):
+    # Frames are only made while somebody watches, so a viewer is counted for the whole test
+    ring_server.output.AddViewer()
+    app.Send(ring_server.REMOTE_APP_CAMERA_ONOFF_CONTROL_TOPIC, "off")
+    time.sleep(1.0)
+    frame_arrived.clear()
+    sent_at = time.perf_counter()
+    app.Send(ring_server.REMOTE_APP_CAMERA_ONOFF_CONTROL_TOPIC, "on")
+    arrived = frame_arrived.wait(10)
+    ring_server.output.RemoveViewer()
+    return round(1000 * (frame_arrived.time - sent_at), 2) if arrived else None
+
+def ai_round_trip(app):
+    app.Clear()
+    sent_at = time.perf_counter()
+    app.Send(ring_server.GPT_REQUEST_TOPIC, "describe")
+    answered = app.WaitFor(ring_server.GPT_RESPONSE_TOPIC, sent_at, lambda payload: not payload.startswith(b"waiting"))
+    return round(1000 * (answered - sent_at), 2) if answered else None
+
+def chime_round_trip():
+    ring_server.button.Press()
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline and not ring_server.chime.Stats().get("plays"):
+        time.sleep(0.05)
+    return ring_server.chime.Stats().get("last_ms")
+
+class FrameArrived(threading.Event):
+    # Set (with the time) when the camera publishes a frame
+    def __call__(self, sequence):
+        if not self.is_set():
+            self.time = time.perf_counter()
+            self.set()
+
+
+# === Regression Report ===
+def compare(results, baseline, tolerance):
+    # Lists every result that is also in the baseline; returns the ones that got worse
+    regressions = []
+    print(f"\n{'result':44} {'baseline':>10} {'now':>10} {'change':>8}")
+    for name, old in baseline["results"].items():
+        new = results.get(name)
+        if old is None or new is None:
+            continue
+        change = 100 * (new - old) / old if old else 0.0
+        worse = abs(new - old) >= MIN_CHANGE and (change > tolerance if name.endswith(LOWER_IS_BETTER)
+                                                   else change < -tolerance)
+        if worse:
+            regressions.append(name)
+        print(f"{name:44} {old:10.2f} {new:10.2f} {change:+7.1f}%{'  ❌ worse' if worse else ''}")
+    return regressions
+
+def describe_machine():
+    try:
+        commit = subprocess.run(["git", "-C", REPO, "describe", "--always", "--dirty"],
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "machine": platform.machine(),
+            "cpus": os.cpu_count(), "created": time.strftime("%Y-%m-%d %H:%M:%S")}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--viewers', type=str, default='1,4,8', help='comma-separated viewer counts')
+    parser.add_argument('--seconds', type=float, default=5, help='length of each frame and audio run')
+    parser.add_argument('--server', type=str, default='asyncio', choices=['threaded', 'asyncio'])
+    parser.add_argument('--encoder', type=str, default='cv2', choices=['jpeg', 'cv2'])
+    parser.add_argument('--fps', type=int, default=24)
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    parser.add_argument('--camera-standby', type=str, default='configured', choices=['off', 'configured', 'warm'])
+    parser.add_argument('--port', type=int, default=8770)
+    parser.add_argument('--fake-video', type=str, help='video file or folder of pictures to use as the camera')
+    parser.add_argument('--fake-audio', type=str, help='WAV file to use as the microphone')
+    parser.add_argument('--output', type=str, help='save the results as JSON')
+    parser.add_argument('--compare', type=str, help='JSON results of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=10, help='percent worse that counts as a regression')
+    args = parser.parse_args()
+    for name in ("output", "compare", "fake_video", "fake_audio"):     # Paths are relative to where we started...
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+    os.chdir(REPO)     # ...but the server finds its web files and sounds relative to the repository
+
+    results = {}
+    quiet = open(os.devnull, "w")
+    with contextlib.redirect_stdout(quiet), contextlib.redirect_stderr(quiet):
+        server = start_server(args)
+        app = AppListener([ring_server.GPT_RESPONSE_TOPIC, "ring/audioresponse"])
+        capture_times, frame_arrived = {}, FrameArrived()
+        remember_capture_times(capture_times)
+        ring_server.output.AddFrameListener(frame_arrived)
+        results.update(startup_times())
+
+        log("⏱️  camera on -> first frame")
+        results["camera_on_to_first_frame_ms"] = camera_round_trip(app, frame_arrived)
+        time.sleep(0.5)
+        for viewers in [int(count) for count in args.viewers.split(",")]:
+            log(f"⏱️  {viewers} viewer(s) for {args.seconds:.0f} s")
+            results.update(frame_run(args, viewers, capture_times))
+        log(f"⏱️  microphone for {args.seconds:.0f} s")
+        results.update(audio_run(args, app))
+        log("⏱️  AI request -> answer")
+        results["ai_request_to_answer_ms"] = ai_round_trip(app)
+        log("⏱️  button press -> chime")
+        results["button_press_to_chime_ms"] = chime_round_trip()
+
+        app.Close()
+        ring_server.shutdown()
+        server.join(timeout=5)
+
+    report = {"machine": describe_machine(), "settings": vars(args), "results": results}
+    for name, value in results.items():
+        print(f"{name:44} {value if value is not None else '-':>10}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Saved to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} result(s) more than {args.tolerance:.0f}% worse than {args.compare}")
+            sys.exit(1)
+        print(f"\n✅ Nothing more than {args.tolerance:.0f}% worse than {args.compare}")
+
+if __name__ == '__main__':
+    main()
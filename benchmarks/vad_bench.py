@@ -0,0 +1,145 @@
+# === Voice Detection Benchmark ===
+# Feeds recorded WAV files through the real microphone streaming code (AudioPlayback), as fast
+# as possible instead of in real time, and compares sending everything with voice detection on:
+#   - CPU: milliseconds of processing per second of audio (the detector alone, and the whole path)
+#   - bandwidth: bytes published to MQTT, and how much of it voice detection saved
+#   - how many speech start/stop events were reported
+# Without --wav, a made-up recording is used: porch background noise with three short
+# spoken-sounding phrases (voiced syllables and "s" sounds). No microphone or PyAudio needed:
+# the sound comes from the files.
+#
+#   python3 benchmarks/vad_bench.py
+#   python3 benchmarks/vad_bench.py --wav door_talk.wav --wav street_noise.wav
+import argparse, os, sys, time, wave
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import audioUtils, fakeDevices
+
+def synthetic_recording(sample_rate, seconds=30):
+    rng = np.random.default_rng(3)
+    length = int(sample_rate * seconds)
+    t = np.arange(length) / sample_rate
+    sound = rng.normal(0, 40, length) + 25 * np.sin(2 * np.pi * 50 * t)     # Hiss and a little mains hum
+    for start, duration, pitch in ((4.0, 2.5, 130), (12.0, 3.5, 210), (22.5, 2.0, 160)):
+        phrase = slice(int(start * sample_rate), int((start + duration) * sample_rate))
+        when = t[phrase] - start
+        # Syllables about 4 times a second; each one a pitched voice with a few harmonics
+        envelope = np.clip(np.sin(2 * np.pi * 2.0 * when), 0, None) ** 0.7
+        f0 = pitch * (1 + 0.05 * np.sin(2 * np.pi * 1.5 * when))
+        phase = 2 * np.pi * np.cumsum(f0) / sample_rate
+        voice = sum(np.sin(k * phase) / k for k in range(1, 8))
+        # Quiet "s" sounds in the gaps between syllables: very many zero crossings
+        hiss = np.diff(rng.normal(0, 1, len(when) + 1)) * (envelope < 0.05) * (np.sin(2 * np.pi * 0.9 * when) > 0.3)
+        sound[phrase] += 3000 * envelope * voice + 250 * hiss
+    return np.clip(sound, -32768, 32767).astype(np.int16), sample_rate
+
+def read_wav(path):
+    with wave.open(path, "rb") as f:
+        if f.getsampwidth() != 2:
+            sys.exit(f"{path}: only 16-bit WAV files are supported")
+        samples = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+        if f.getnchannels() > 1:
+            samples = samples.reshape(-1, f.getnchannels()).mean(axis=1).astype(np.int16)   # Mix down to mono
+        return samples, f.getframerate()
+
+def write_wav(path, samples, sample_rate):
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(samples.tobytes())
+
+
+# Stands in for the microphone: hands out the recording chunk by chunk, then stops the playback
+class RecordingInput:
+    def __init__(self, samples, sample_rate, chunk_size=1024):
+        self._sample_rate = sample_rate
+        self.chunks = [samples[i:i + chunk_size].tobytes() for i in range(0, len(samples) - chunk_size + 1, chunk_size)]
+        self.playback = None
+        self.sample_size = 2
+
+    def SampleSize(self):
+        return self.sample_size
+
+    def ReadData(self):
+        if len(self.chunks) == 1:
+            self.playback.SetIsPlaying(False)     # Last chunk: the streaming loop ends after this one
+        return self.chunks.pop(0)
+
+# Stands in for MQTT: counts what would have been sent
+class CountingClient:
+    def __init__(self):
+        self.bytes = {}
+        self.messages = {}
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.bytes[topic] = self.bytes.get(topic, 0) + len(payload)
+        self.messages[topic] = self.messages.get(topic, 0) + 1
+
+def run(samples, sample_rate, mode, vad, args):
+    audioUtils.UseAudioBackend(fakeDevices.FakeAudioBackend())    # The recording replaces the microphone below
+    playback = audioUtils.AudioPlayback(sample_rate)
+    playback.input = RecordingInput(samples, sample_rate)
+    playback.input.playback = playback
+    client = CountingClient()
+    playback.SetMQTTClient(client, "audio")
+    if mode == "stream":
+        playback.SetStreamMode(args.rate, args.frame_ms, args.codec)
+    if vad:
+        playback.SetVoiceDetection("vad", start_db=args.start_db, hangover_ms=args.hangover_ms)
+    playback.SetIsPlaying(True)
+    stdout, sys.stdout = sys.stdout, open(os.devnull, "w")     # Hide the per-packet/per-event messages
+    started = time.process_time()
+    playback._playback()
+    cpu = time.process_time() - started
+    sys.stdout = stdout
+    return cpu, client, playback.Stats()
+
+def detector_cost(samples, sample_rate, args, chunk=1024, repeats=3):
+    best = None
+    for _ in range(repeats):
+        detector = audioUtils.VoiceActivityDetector(sample_rate, start_db=args.start_db, hangover_ms=args.hangover_ms)
+        chunks = [samples[i:i + chunk].tobytes() for i in range(0, len(samples) - chunk + 1, chunk)]
+        started = time.process_time()
+        speech = sum(detector.Process(data) for data in chunks)
+        cpu = time.process_time() - started
+        best = cpu if best is None else min(best, cpu)
+    return best, speech / max(1, len(chunks))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--wav', type=str, action='append', default=[], help='16-bit WAV recording (repeatable)')
+    parser.add_argument('--save-wav', type=str, help='write the made-up recording to this file')
+    parser.add_argument('--mode', type=str, default='both', choices=['stream', 'wav', 'both'], help='which audio path to test')
+    parser.add_argument('--rate', type=int, default=16000, help='streamed sample rate (Hz)')
+    parser.add_argument('--frame-ms', type=int, default=20)
+    parser.add_argument('--codec', type=str, default='adpcm', choices=['adpcm', 'pcm'])
+    parser.add_argument('--start-db', type=float, default=9.0)
+    parser.add_argument('--hangover-ms', type=int, default=400)
+    args = parser.parse_args()
+
+    recordings = [(path, *read_wav(path)) for path in args.wav]
+    if not recordings:
+        samples, sample_rate = synthetic_recording(44100)
+        if args.save_wav:
+            write_wav(args.save_wav, samples, sample_rate)
+        recordings = [("synthetic porch + 3 phrases", samples, sample_rate)]
+    modes = ["stream", "wav"] if args.mode == "both" else [args.mode]
+
+    for name, samples, sample_rate in recordings:
+        seconds = len(samples) / sample_rate
+        detector_cpu, speech_share = detector_cost(samples, sample_rate, args)
+        print(f"{name}: {seconds:.1f} s at {sample_rate} Hz, speech in {100 * speech_share:.0f}% of chunks")
+        print(f"  detector alone: {1000 * detector_cpu / seconds:.3f} ms CPU per second of audio")
+        for mode in modes:
+            cpu_off, client_off, _ = run(samples, sample_rate, mode, False, args)
+            cpu_on, client_on, stats = run(samples, sample_rate, mode, True, args)
+            sent_off, sent_on = client_off.bytes.get("audio", 0), client_on.bytes.get("audio", 0)
+            print(f"  {mode:6} path  CPU {1000 * cpu_off / seconds:6.2f} -> {1000 * cpu_on / seconds:6.2f} ms/s   "
+                  f"sent {sent_off * 8 / seconds / 1000:6.1f} -> {sent_on * 8 / seconds / 1000:6.1f} kbit/s "
+                  f"({100 * (1 - sent_on / max(1, sent_off)):.0f}% saved)   "
+                  f"{stats['keepalives']} keep-alives, {client_on.messages.get('vad', 0)} speech events")
+
+if __name__ == '__main__':
+    main()
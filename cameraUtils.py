@@ -0,0 +1,372 @@
+import queue
+import threading
+import time
+from collections import deque
+import streamUtils
+import metricsUtils
+
+# Timings for the capture loop (see /metrics)
+CAPTURE_SECONDS = metricsUtils.STAGE_SECONDS.Labels("capture")
+ENCODE_SECONDS = metricsUtils.STAGE_SECONDS.Labels("encode")
+MOTION_SECONDS = metricsUtils.STAGE_SECONDS.Labels("motion")
+CAPTURE_ERRORS = metricsUtils.REGISTRY.Counter("doorbell_capture_errors_total", "Camera captures that failed").Labels()
+FIRST_FRAME_SECONDS = metricsUtils.REGISTRY.Histogram(
+    "doorbell_camera_first_frame_seconds", "Trigger (bell, motion, app) to the first JPEG in the stream, by how warm the camera was",
+    labels=("start",), buckets=(0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.5, 5.0))
+
+# === Camera Worker ===
+# One long-lived background thread owns the camera. Everybody else (MQTT messages,
+# the doorbell button, the motion sensor) just drops a command into its queue:
+#   "start"       - configure and start the camera
+#   "stop"        - stop the camera
+#   "reconfigure" - change size / fps / quality / encoder (restarts the camera if it is on)
+#   "viewers"     - the number of viewers changed (adjusts the frame rate and encoder)
+#   "motion"      - watch the small "lores" stream for a few seconds to confirm motion
+#   "still"       - take one picture (turning the camera on just for that if it is off)
+#   "release"     - (internal) a motion check or still finished; stop the camera if nobody else wants it
+#   "shutdown"    - stop the camera and end the thread
+# The thread sleeps on the queue, so it uses no CPU while the camera is off.
+#
+# What "off" means is the standby policy (idle power against how fast the first picture appears):
+#   "off"        - the sensor is stopped and forgets its setup; every start configures it again
+#   "configured" - the sensor is stopped but keeps its setup; a start skips configure()
+#   "warm"       - the sensor keeps running at standby_fps (nothing is encoded or sent), so
+#                  exposure stays settled and a start only raises the frame rate
+class CameraWorker:
+    def __init__(self, camera, output, encoder_factory=None,
+                 width=640, height=480, fps=24, quality=85, encoder="cv2", idle_fps=None,
+                 motion_detector=None, lores_size=(160, 120), motion_fps=10, extra_encoders=None,
+                 still_warmup_frames=6, standby="off", standby_fps=2):
+        self.camera = camera                    # The Picamera2 object (or a stand-in for testing)
+        self.output = output                    # The StreamingOutput that receives the JPEG frames
+        self.encoder_factory = encoder_factory  # Makes (encoder, output) pairs for Picamera2's own encoders
+        self.settings = {"width": width, "height": height, "fps": fps, "quality": quality, "encoder": encoder,
+                         "idle_fps": idle_fps,     # Slower frame rate used when only background viewers are watching
+                         "standby": standby, "standby_fps": standby_fps}   # Standby policy (see above)
+        self.current_fps = fps                  # Frame rate the camera is set to right now
+        self.motion_detector = motion_detector  # Optional motionUtils.MotionDetector that checks the lores stream
+        self.lores_size = lores_size            # Size of the small extra stream used for motion checks
+        self.motion_interval = 1.0 / motion_fps
+        self.motion_check = None                # The motion check in progress (or None)
+        self.still_warmup_frames = still_warmup_frames   # Frames skipped after a cold start so exposure can settle
+        self.wanted_on = False                  # Did somebody ask for the camera to be on (not just a motion check)?
+        self.scheduler = streamUtils.FrameScheduler(fps)
+        self.commands = queue.Queue()
+        self.running = False                    # Is the camera started right now (streaming, as far as everybody else knows)?
+        self.configured = False                 # Has the sensor been configured for the current settings?
+        self.sensor_on = False                  # Is the sensor delivering frames (streaming, or warm standby)?
+        self.pending_start = None               # (trigger time, how warm) until the first JPEG after a start appears
+        self.stats_lock = threading.Lock()
+        self.first_frame_times = deque(maxlen=50)   # Recent (how warm, seconds) from trigger to first JPEG
+        # More Picamera2 encoders with their own viewers, e.g. [(h264_stream, make_h264_encoder)].
+        # Each one only runs while its own output has viewers.
+        self.extra_encoders = list(extra_encoders or [])
+        self.active_encoders = {}               # output -> the Picamera2 encoder attached for it right now
+        self.thread = threading.Thread(target=self._run, name="camera-worker", daemon=True)
+        # Wake up whenever a viewer connects or leaves
+        for watched in [output] + [extra_output for extra_output, _ in self.extra_encoders]:
+            watched.AddViewerListener(lambda count: self.commands.put(("viewers", count)))
+        output.AddFrameListener(self._frame_published)
+
+    # === Commands (safe to call from any thread) ===
+    def Begin(self):
+        self.thread.start()
+
+    def Start(self, trigger_time=None):
+        # trigger_time: time.perf_counter() of the bell press (or other trigger) that asked for the
+        # camera, to measure how long the first picture takes. Defaults to now.
+        self.commands.put(("start", trigger_time or time.perf_counter()))
+
+    def Stop(self):
+        self.commands.put(("stop", None))
+
+    def CheckMotion(self, seconds, callback):
+        # Watch for real motion for up to `seconds`; callback(score, regions) runs (on the worker thread)
+        # as soon as it is confirmed. Nothing is called if no motion is found.
+        self.commands.put(("motion", (seconds, callback)))
+
+    def CaptureStill(self, callback):
+        # Take one picture; callback(picture) runs on the worker thread with a BGR NumPy array (or None on error)
+        self.commands.put(("still", callback))
+
+    def Reconfigure(self, **changes):
+        self.commands.put(("reconfigure", changes))
+
+    def Shutdown(self, timeout=5):
+        self.commands.put(("shutdown", None))
+        if self.thread.is_alive():
+            self.thread.join(timeout)
+
+    def IsRunning(self):
+        return self.running
+
+    def Stats(self):
+        with self.stats_lock:
+            times = list(self.first_frame_times)
+        stats = {"standby": self.settings["standby"], "sensor_on": self.sensor_on, "starts": len(times)}
+        if times:
+            seconds = [value for _, value in times]
+            stats.update({"last_start": times[-1][0], "last_ms": round(1000 * seconds[-1], 1),
+                          "avg_ms": round(1000 * sum(seconds) / len(seconds), 1),
+                          "max_ms": round(1000 * max(seconds), 1)})
+        return stats
+
+    # === The Worker Thread ===
+    def _run(self):
+        self._enter_standby()
+        while True:
+            try:
+                command, value = self.commands.get(timeout=self._time_until_work())
+            except queue.Empty:
+                self._do_work()
+                continue
+
+            if command == "start":
+                self.wanted_on = True
+                self._start(value)
+            elif command == "stop":
+                self.wanted_on = False
+                self._stop()
+            elif command == "reconfigure":
+                was_running = self.running
+                self._stop()
+                self._power_off()            # The new settings need a fresh configure()
+                self.settings.update(value)
+                self.scheduler = streamUtils.FrameScheduler(self.settings["fps"])
+                if was_running:
+                    self._start()
+                else:
+                    self._enter_standby()
+            elif command == "viewers":
+                self._apply_frame_rate()
+                self._update_encoder()
+            elif command == "motion":
+                self._begin_motion_check(*value)
+            elif command == "still":
+                self._capture_still(value)
+            elif command == "release":
+                if not self.wanted_on and not self.motion_check:
+                    self._stop()             # A motion check or still is done and nobody else asked for the camera
+            elif command == "shutdown":
+                self._stop()
+                self._power_off()
+                print("🛑 Camera worker stopped")
+                return
+
+    def _capturing(self):
+        # Only the cv2 encoder captures frames itself, and only while someone is watching
+        return self.running and self.settings["encoder"] == "cv2" and self.output.viewers > 0
+
+    def _time_until_work(self):
+        # How long the queue may sleep before a frame capture or motion check is due.
+        # None means there is nothing to do until the next command arrives.
+        waits = []
+        if self._capturing():
+            waits.append(self.scheduler.TimeUntilNextFrame())
+        if self.motion_check:
+            waits.append(max(0.0, self.motion_check["next"] - time.monotonic()))
+        return min(waits) if waits else None
+
+    def _do_work(self):
+        if self.motion_check and time.monotonic() >= self.motion_check["next"]:
+            self._check_motion()
+        if self._capturing() and self.scheduler.TimeUntilNextFrame() == 0:
+            self._capture_frame()
+
+    # === Motion Confirmation ===
+    def _begin_motion_check(self, seconds, callback):
+        if self.motion_detector is None:
+            callback(None, [])               # No detector: every trigger counts as motion
+            return
+        if self.motion_check:                # Already checking: just keep looking a little longer
+            self.motion_check["until"] = time.monotonic() + seconds
+            return
+        self._start()                        # The camera must be on to look (does nothing if it already is)
+        self.motion_detector.Reset()
+        now = time.monotonic()
+        self.motion_check = {"until": now + seconds, "next": now, "callback": callback, "best": 0.0}
+
+    def _check_motion(self):
+        check = self.motion_check
+        check["next"] += self.motion_interval
+        try:
+            # The lores stream is YUV420: its first rows are the brightness (Y) plane, a free grayscale picture
+            started = time.perf_counter()
+            lores = self.camera.capture_array("lores")
+            score, regions = self.motion_detector.Process(lores[:self.lores_size[1]])
+            MOTION_SECONDS.Observe(time.perf_counter() - started)
+        except Exception as e:
+            print("⚠️ Motion check error:", e)
+            score, regions = 0.0, []
+        check["best"] = max(check["best"], score)
+
+        if self.motion_detector.IsMotion(score):
+            self.motion_check = None
+            print(f"✅ Motion confirmed (score {score:.3f}, {len(regions)} regions)")
+            check["callback"](score, regions)
+        elif time.monotonic() >= check["until"]:
+            self.motion_check = None
+            print(f"🛑 Motion not confirmed (best score {check['best']:.3f})")
+        else:
+            return
+        # The check is over. Queue a "release" so any "start" the callback just sent is handled first.
+        self.commands.put(("release", None))
+
+    # === Single Still Picture ===
+    def _capture_still(self, callback):
+        was_running = self.running
+        cold = not self.sensor_on                # A warm standby sensor has its exposure settled already
+        picture = None
+        try:
+            self._start()                        # Does nothing if the camera is already on
+            if cold:
+                for _ in range(self.still_warmup_frames):
+                    self.camera.capture_array()  # Let auto-exposure settle (the first frames are often dark)
+            picture = self.camera.capture_array()
+        except Exception as e:
+            print("⚠️ Still capture error:", e)
+        callback(picture)
+        if not was_running:
+            self.commands.put(("release", None))   # Turn the camera off again unless somebody wants it on
+
+    def _capture_frame(self):
+        try:
+            self.scheduler.MarkFrame()
+            # The camera is set up with "RGB888", which is already the BGR pixel order OpenCV expects,
+            # so no color conversion (and no extra copy of the picture) is needed here
+            started = time.perf_counter()
+            frame = self.camera.capture_array()     # This gives the image as a NumPy array (used by OpenCV)
+            captured = time.perf_counter()
+            self.output.EncodeFrame(frame, self.settings["quality"])   # Turn it into a JPEG for the website
+            CAPTURE_SECONDS.Observe(captured - started)
+            ENCODE_SECONDS.Observe(time.perf_counter() - captured)
+        except Exception as e:
+            CAPTURE_ERRORS.Inc()
+            print("⚠️ Frame capture error:", e)     # If something goes wrong (e.g., camera error), show a warning
+
+    def _start(self, trigger_time=None):
+        if self.running:
+            return
+        settings = self.settings
+        self.current_fps = self._target_fps()
+        warmth = self._power_up(self.current_fps)
+        self.running = True
+        if trigger_time is not None and self.output.viewers > 0:
+            self.pending_start = (trigger_time, warmth)   # Timed until the first JPEG (only if somebody is watching)
+        self.scheduler.SetFps(self.current_fps)
+        self.scheduler.Reset()
+        self._update_encoder()
+        print(f"📸 Camera started ({settings['encoder']} encoder, {settings['width']}x{settings['height']} @ {settings['fps']} fps, {warmth} start)")
+
+    def _stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self.motion_check = None
+        self.pending_start = None
+        self._update_encoder()
+        self._enter_standby()
+        if self.settings["encoder"] == "cv2":
+            stats = self.scheduler.Stats()
+            print(f"🛑 Camera stopped ({stats['achieved_fps']} fps, jitter {stats['jitter_ms']} ms)")
+        else:
+            print("🛑 Camera stopped")
+
+    # === Sensor Power (see the standby policy at the top) ===
+    def _power_up(self, fps):
+        # Get the sensor delivering `fps` frames per second, doing only the steps that are still needed.
+        # Returns how warm it was: "warm" (already running), "configured" or "cold".
+        warmth = "warm" if self.sensor_on else "configured" if self.configured else "cold"
+        frame_time = int(1_000_000 / fps)
+        if not self.configured:
+            settings = self.settings
+            # "RGB888" stores pixels in the blue-green-red order that both OpenCV and the JPEG encoders expect,
+            # which fixes the colors once here instead of converting every single frame.
+            # The small "lores" stream is only added when motion checks need it.
+            lores = {"size": self.lores_size, "format": "YUV420"} if self.motion_detector else None
+            self.camera.configure(self.camera.create_video_configuration(
+                main={"size": (settings["width"], settings["height"]), "format": "RGB888"}, lores=lores))
+            self.configured = True
+        if self.sensor_on:
+            self.camera.set_controls({"FrameDurationLimits": (frame_time, frame_time)})   # Only the frame rate changes
+            return warmth
+        self.camera.start()
+        self.sensor_on = True
+
+        # Manually adjust camera settings:
+        # - AwbMode 0: Turns off automatic white balance
+        # - ColourGains: Boosts red and blue to fix color tones
+        # - FrameDurationLimits: Makes the sensor deliver frames at the chosen fps (in microseconds per frame)
+        self.camera.set_controls({
+            "AwbMode": 0,
+            "ColourGains": (1.5, 2),
+            "FrameDurationLimits": (frame_time, frame_time)
+        })
+        return warmth
+
+    def _enter_standby(self):
+        # The camera is not needed right now: power down as far as the standby policy allows
+        policy = self.settings["standby"]
+        if policy == "warm":
+            self._power_up(min(self.settings["standby_fps"], self.settings["fps"]))
+        elif policy == "configured":
+            if self.sensor_on:
+                self.camera.stop()
+                self.sensor_on = False
+            if not self.configured:
+                self._power_up(self.settings["fps"])    # configure() once, then stop again
+                self.camera.stop()
+                self.sensor_on = False
+        else:
+            self._power_off()
+
+    def _power_off(self):
+        if self.sensor_on:
+            self.camera.stop()
+            self.sensor_on = False
+        self.configured = False
+
+    def _frame_published(self, sequence):
+        # Called for every new JPEG (on the thread that made it). Only the first one after a start counts.
+        pending = self.pending_start
+        if pending is None:
+            return
+        self.pending_start = None
+        trigger_time, warmth = pending
+        seconds = time.perf_counter() - trigger_time
+        FIRST_FRAME_SECONDS.Labels(warmth).Observe(seconds)
+        with self.stats_lock:
+            self.first_frame_times.append((warmth, seconds))
+        print(f"📸 First picture {1000 * seconds:.0f} ms after the trigger ({warmth} start)")
+
+    def _target_fps(self):
+        # Full speed for people watching; the slower idle rate if only background viewers are left
+        live_viewers = self.output.live_viewers + sum(extra_output.live_viewers for extra_output, _ in self.extra_encoders)
+        if self.settings["idle_fps"] and live_viewers == 0:
+            return min(self.settings["fps"], self.settings["idle_fps"])
+        return self.settings["fps"]
+
+    def _apply_frame_rate(self):
+        fps = self._target_fps()
+        if fps == self.current_fps:
+            return
+        self.current_fps = fps
+        self.scheduler.SetFps(fps)
+        if self.running:
+            frame_time = int(1_000_000 / fps)
+            self.camera.set_controls({"FrameDurationLimits": (frame_time, frame_time)})
+
+    def _update_encoder(self):
+        # Picamera2's encoders only run while the camera is on AND somebody is watching their output
+        slots = list(self.extra_encoders)
+        if self.settings["encoder"] != "cv2" and self.encoder_factory is not None:
+            slots.insert(0, (self.output, self.encoder_factory))
+        for slot_output, factory in slots:
+            wanted = self.running and slot_output.viewers > 0
+            active = slot_output in self.active_encoders
+            if wanted and not active:
+                encoder, encoder_output = factory(self.settings)
+                self.camera.start_encoder(encoder, encoder_output)
+                self.active_encoders[slot_output] = encoder
+            elif not wanted and active:
+                self.camera.stop_encoder(self.active_encoders.pop(slot_output))
@@ -0,0 +1,132 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+# === Event Clip Recorder ===
+# Keeps the last few seconds of camera frames in memory (the "pre-roll"), always.
+# When the doorbell is pressed or motion is detected, it saves the pre-roll plus the
+# next few seconds (the "post-roll") to a clip file, so you can see what happened
+# *before* the event too.
+#
+# Clips are saved as .mjpeg files (JPEG frames one after another), which VLC and
+# "ffplay -f mjpeg clip.mjpeg" can play. Saving happens on a separate writer thread
+# in large sequential writes, so the SD card is never written one frame at a time
+# and the camera never waits for the disk.
+class ClipRecorder:
+    def __init__(self, output, folder="./clips", preroll_seconds=5, postroll_seconds=10,
+                 clip_fps=8, max_clip_seconds=60, max_preroll_bytes=8 * 1024 * 1024):
+        self.output = output                        # The FrameBroadcaster we take frames from
+        self.folder = folder                        # Where finished clips are saved
+        self.preroll_seconds = preroll_seconds
+        self.postroll_seconds = postroll_seconds
+        self.frame_interval = 1.0 / clip_fps        # Clips keep fewer frames than the live stream
+        self.max_clip_seconds = max_clip_seconds    # Repeated events extend a clip, but never past this
+        self.max_preroll_bytes = max_preroll_bytes  # Hard memory limit for the pre-roll
+        self.preroll = deque()                      # (timestamp, jpeg) pairs, oldest first
+        self.preroll_bytes = 0
+        self.clip = None                            # The clip being collected right now (or None)
+        self.lock = threading.Lock()
+        self.write_queue = queue.Queue(maxsize=4)   # Finished clips waiting to be saved
+        self.running = False
+
+    def Begin(self):
+        os.makedirs(self.folder, exist_ok=True)
+        self.running = True
+        self.output.AddViewer(background=True)      # Keep the camera producing (slow) frames for the pre-roll
+        threading.Thread(target=self._collect, name="clip-collector", daemon=True).start()
+        self.writer_thread = threading.Thread(target=self._write_clips, name="clip-writer", daemon=True)
+        self.writer_thread.start()
+        print(f"🎞️ Clip recorder ready ({self.preroll_seconds}s pre-roll, {self.postroll_seconds}s post-roll)")
+
+    def Close(self):
+        self.running = False
+        self.output.RemoveViewer(background=True)
+        with self.lock:
+            self._finish_clip()                     # Save whatever was being collected
+        self.write_queue.put(None)                  # Tell the writer to finish up
+        self.writer_thread.join(timeout=10)
+
+    def Trigger(self, reason):
+        # Called when the bell is pressed or motion is seen. Returns right away.
+        now = time.time()
+        with self.lock:
+            if self.clip:
+                # Already recording: keep going a bit longer instead of starting a second clip
+                self.clip["end"] = min(now + self.postroll_seconds, self.clip["start"] + self.max_clip_seconds)
+                self.clip["reasons"].add(reason)
+                return
+            frames = list(self.preroll)
+            start = frames[0][0] if frames else now
+            self.clip = {"start": start, "end": now + self.postroll_seconds, "trigger": now,
+                         "reasons": {reason}, "frames": frames}
+        print(f"🎞️ Recording {reason} clip")
+
+    # === Collector Thread: takes frames from the live stream ===
+    def _collect(self):
+        sequence = 0
+        last_kept = 0.0
+        while self.running:
+            sequence, frame = self.output.WaitForFrame(sequence, timeout=1)
+            now = time.time()
+            with self.lock:
+                if self.clip and now >= self.clip["end"]:
+                    self._finish_clip()
+                if frame is None or now - last_kept < self.frame_interval:
+                    continue
+                last_kept = now
+                self._add_to_preroll(now, frame)
+                if self.clip:
+                    self.clip["frames"].append((now, frame))
+
+    def _add_to_preroll(self, timestamp, frame):
+        self.preroll.append((timestamp, frame))
+        self.preroll_bytes += len(frame)
+        # Drop frames that are too old, or that push us over the memory limit
+        while self.preroll and (timestamp - self.preroll[0][0] > self.preroll_seconds
+                                or self.preroll_bytes > self.max_preroll_bytes):
+            _, old = self.preroll.popleft()
+            self.preroll_bytes -= len(old)
+
+    def _finish_clip(self):
+        # Must be called with self.lock held
+        clip, self.clip = self.clip, None
+        if not clip or not clip["frames"]:
+            return
+        try:
+            self.write_queue.put_nowait(clip)
+        except queue.Full:
+            print("⚠️ Clip writer is behind — dropping clip")
+
+    # === Writer Thread: saves finished clips to disk ===
+    def _write_clips(self):
+        while True:
+            clip = self.write_queue.get()
+            if clip is None:
+                return
+            stamp = time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime(clip["trigger"]))
+            name = f"{stamp}_{'+'.join(sorted(clip['reasons']))}.mjpeg"
+            path = os.path.join(self.folder, name)
+            try:
+                self._save(path, clip["frames"])
+                seconds = clip["frames"][-1][0] - clip["frames"][0][0]
+                print(f"💾 Saved clip {name} ({len(clip['frames'])} frames, {seconds:.1f}s)")
+            except OSError as e:
+                print(f"❌ Could not save clip {name}: {e}")
+
+    def _save(self, path, frames, batch_bytes=1024 * 1024):
+        # Write to a temporary name first, so a power cut never leaves a half-written clip behind
+        temp_path = path + ".part"
+        with open(temp_path, "wb", buffering=0) as f:
+            batch, batch_size = [], 0
+            for _, frame in frames:
+                batch.append(frame)
+                batch_size += len(frame)
+                if batch_size >= batch_bytes:          # One big write per ~1 MB
+                    f.write(b"".join(batch))
+                    batch, batch_size = [], 0
+            if batch:
+                f.write(b"".join(batch))
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
@@ -0,0 +1,244 @@
+import base64
+import json
+import threading
+import time
+from collections import OrderedDict
+from http import server
+import socketserver
+import cv2
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# === Picture Description ("Ask GPT") ===
+# One background worker describes the camera picture with an AI model and publishes the answer.
+#   - Taps that arrive while a description is already on its way just wait for that answer
+#     (five taps during a delivery = one upload, not five).
+#   - Answers are remembered by a "perceptual hash" (a tiny fingerprint of what the picture
+#     looks like), so asking again about an unchanged porch costs nothing.
+#   - The backend (who actually describes the picture) is pluggable: OpenAI, or a local stub
+#     server for testing without internet or an API key.
+
+DEFAULT_PROMPT = "Describe the image in detail in 2-3 sentences."
+
+def PerceptualHash(jpeg):
+    # "Difference hash": shrink to 9x8 gray pixels and record whether each pixel is brighter than
+    # its right-hand neighbor. Similar-looking pictures get hashes that differ in only a few bits.
+    gray = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if gray is None:
+        return None
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+def HashDistance(a, b):
+    return bin(a ^ b).count("1")
+
+
+# === Backends ===
+# A backend has Describe(jpeg) -> (text, usage), where usage is {"input_tokens": .., "output_tokens": ..}.
+
+# Talks to an OpenAI-style chat completions API through one long-lived session:
+# the connection is reused between requests, every request has a timeout, and
+# short outages (429 / 5xx / dropped connections) are retried with backoff.
+class OpenAIBackend:
+    def __init__(self, api_key, url="https://api.openai.com/v1/chat/completions", model="gpt-4o",
+                 prompt=DEFAULT_PROMPT, max_tokens=400, timeout=20, retries=2):
+        self.url = url
+        self.model = model
+        self.prompt = prompt
+        self.max_tokens = max_tokens
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"})
+        retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=frozenset({"POST"}))
+        self.session.mount("http://", HTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=2))
+        self.session.mount("https://", HTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=2))
+
+    def Describe(self, jpeg):
+        img_b64 = base64.b64encode(jpeg).decode('utf-8')
+        payload = {
+            "model": self.model,
+            "messages": [{
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": self.prompt},
+                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{img_b64}"}}
+                ]
+            }],
+            "max_tokens": self.max_tokens
+        }
+        response = self.session.post(self.url, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        result = response.json()
+        usage = result.get("usage", {})
+        return result['choices'][0]['message']['content'], {"input_tokens": usage.get("prompt_tokens", 0),
+                                                          "output_tokens": usage.get("completion_tokens", 0)}
+
+
+# === Local Stub Server ===
+# Answers like the OpenAI chat completions API, without internet or an API key.
+# Point OpenAIBackend at http://127.0.0.1:<port>/v1/chat/completions to test the whole path.
+class StubDescribeServer:
+    def __init__(self, port=0, delay=0.5, answer="A quiet front porch. Nobody is at the door."):
+        stub = self
+
+        class Handler(server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"     # Keep-alive, so connection reuse can be tested
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                stub.requests += 1
+                time.sleep(stub.delay)        # Pretend to think
+                image_bytes = len(request["messages"][0]["content"][1]["image_url"]["url"])
+                body = json.dumps({
+                    "choices": [{"message": {"role": "assistant", "content": stub.answer}}],
+                    "usage": {"prompt_tokens": 85 + image_bytes // 1000, "completion_tokens": len(stub.answer.split())},
+                }).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        class Server(socketserver.ThreadingMixIn, server.HTTPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        self.delay = delay
+        self.answer = answer
+        self.requests = 0                     # How many descriptions were asked for
+        self.httpd = Server(("127.0.0.1", port), Handler)
+        self.port = self.httpd.server_address[1]
+        self.url = f"http://127.0.0.1:{self.port}/v1/chat/completions"
+
+    def Begin(self):
+        threading.Thread(target=self.httpd.serve_forever, name="describe-stub", daemon=True).start()
+
+    def Close(self):
+        self.httpd.shutdown()
+
+
+# === Describe Service ===
+class DescribeService:
+    def __init__(self, get_picture, backend, publish, cache_size=32, cache_seconds=300,
+                 hash_distance=4, input_cost_per_1k=0.0025, output_cost_per_1k=0.01):
+        self.get_picture = get_picture          # Function that returns a JPEG (e.g. snapshots.Get)
+        self.backend = backend
+        self.publish = publish                  # Function that sends a text answer to the app
+        self.answer_listeners = []              # Also told about every real answer (not errors), e.g. the event history
+        self.cache = OrderedDict()              # hash -> (time, answer), newest last
+        self.cache_size = cache_size
+        self.cache_seconds = cache_seconds      # Answers older than this are not reused (the light changes...)
+        self.hash_distance = hash_distance      # Hashes this close (in bits) count as "the same picture"
+        self.input_cost_per_1k = input_cost_per_1k     # Dollars per 1000 tokens sent / received, for the cost estimate
+        self.output_cost_per_1k = output_cost_per_1k
+        self.condition = threading.Condition()
+        self.wanted = False                     # Has somebody asked since the current description started?
+        self.closed = False
+        # Numbers for monitoring
+        self.stats = {"requests": 0, "joined": 0, "cache_hits": 0, "backend_calls": 0, "errors": 0,
+                      "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0,
+                      "last_ms": 0.0, "avg_ms": 0.0, "max_ms": 0.0}
+        self.total_seconds = 0.0
+        self.thread = threading.Thread(target=self._run, name="describe", daemon=True)
+
+    def Begin(self):
+        self.thread.start()
+
+    def AddAnswerListener(self, listener):
+        # listener(answer, jpeg) runs on the describe worker after each answer is published (jpeg = the picture described)
+        self.answer_listeners.append(listener)
+
+    def Close(self, timeout=2):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join(timeout)
+
+    def Request(self):
+        # Ask for a description. Returns right away; the answer is published when it is ready.
+        with self.condition:
+            self.stats["requests"] += 1
+            if self.wanted:
+                self.stats["joined"] += 1       # Already waiting for one: this tap shares its answer
+                return
+            self.wanted = True
+            self.condition.notify()
+
+    def Stats(self):
+        with self.condition:
+            return dict(self.stats)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.wanted or self.closed)
+                if self.closed:
+                    return
+            self._describe()
+            with self.condition:
+                self.wanted = False   # Taps during the description got this answer too
+
+    def _describe(self):
+        self.publish("waiting for the AI to Answer...")
+        try:
+            jpeg = self.get_picture()
+            if jpeg is None:
+                raise RuntimeError("the camera could not take a picture")
+            fingerprint = PerceptualHash(jpeg)
+            answer = self._cached(fingerprint)
+            if answer is not None:
+                with self.condition:
+                    self.stats["cache_hits"] += 1
+                print("🤖 GPT (unchanged picture):", answer)
+                self._answer(answer, jpeg)
+                return
+            started = time.perf_counter()
+            answer, usage = self.backend.Describe(jpeg)
+            self._record(time.perf_counter() - started, usage)
+            if fingerprint is not None:
+                self.cache[fingerprint] = (time.monotonic(), answer)
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+            print("🤖 GPT:", answer)
+            self._answer(answer, jpeg)
+        except Exception as e:    # If something goes wrong, show and send an error message
+            with self.condition:
+                self.stats["errors"] += 1
+            error_msg = f"❌ GPT error: {e}"
+            print(error_msg)
+            self.publish(error_msg)
+
+    def _answer(self, answer, jpeg):
+        self.publish(answer)
+        for listener in self.answer_listeners:
+            listener(answer, jpeg)
+
+    def _cached(self, fingerprint):
+        if fingerprint is None:
+            return None
+        now = time.monotonic()
+        for known, (when, answer) in reversed(self.cache.items()):
+            if now - when < self.cache_seconds and HashDistance(known, fingerprint) <= self.hash_distance:
+                self.cache.move_to_end(known)
+                return answer
+        return None
+
+    def _record(self, seconds, usage):
+        with self.condition:
+            stats = self.stats
+            stats["backend_calls"] += 1
+            self.total_seconds += seconds
+            stats["last_ms"] = round(1000 * seconds, 1)
+            stats["avg_ms"] = round(1000 * self.total_seconds / stats["backend_calls"], 1)
+            stats["max_ms"] = max(stats["max_ms"], stats["last_ms"])
+            stats["input_tokens"] += usage.get("input_tokens", 0)
+            stats["output_tokens"] += usage.get("output_tokens", 0)
+            stats["cost_usd"] = round(stats["input_tokens"] / 1000 * self.input_cost_per_1k
+                                      + stats["output_tokens"] / 1000 * self.output_cost_per_1k, 4)
@@ -0,0 +1,340 @@
+import contextlib
+import multiprocessing
+import os
+import threading
+import time
+from collections import Counter, deque
+import cv2
+import numpy as np
+import metricsUtils
+
+try:
+    import onnxruntime              # Optional: often faster than OpenCV's DNN module for ONNX models
+except ImportError:
+    onnxruntime = None
+
+# === On-Device Person / Package Detection ===
+# Asking the cloud AI takes a round trip for every question. This runs a small detection model
+# right here, on the frames the camera already makes, and publishes what it finds (label, box,
+# confidence) over MQTT; the MJPEG stream can draw the boxes too (/stream.mjpg?overlay=on).
+#
+#   - The model runs in its own process (a separate Python, so it never holds up the stream's
+#     GIL), at low priority, and sees smaller pictures: the JPEG is decoded at 1/2, 1/4 or 1/8
+#     size straight away (see qualityUtils.REDUCED_DECODE), then shrunk to the model's input.
+#   - While the model is busy, only the newest frames are kept (up to `batch` of them, run
+#     together in one pass), so it never falls behind the camera.
+#   - CPU budget: after each pass the worker reports the CPU time it used, and the next pass
+#     waits long enough that the detector uses at most `cpu_budget` of one core on average.
+#     A slow model on a busy Pi simply looks at fewer frames.
+#   - It counts as a background viewer of the stream (like the clip recorder), so the camera
+#     keeps making frames for it while nobody watches /stream.mjpg.
+#
+# Models ("--detect-model"):
+#   hog        - OpenCV's built-in HOG people detector (OpenCV 4.x, no model file, people only)
+#   <file>     - a detection model for OpenCV's DNN module (or ONNX Runtime, --detect-engine):
+#                  format "ssd":  SSD-style output [1, 1, N, 7] (e.g. MobileNet-SSD Caffe/TF)
+#                  format "yolo": YOLOv8/YOLO11 ONNX export, output [batch, 4 + classes, anchors]
+#                with --detect-labels naming the classes (one per line, in the model's order)
+DETECT_SECONDS = metricsUtils.STAGE_SECONDS.Labels("detect")
+DETECTIONS_FOUND = metricsUtils.REGISTRY.Counter("doorbell_detections_total", "Objects found by the local detector", labels=("label",))
+
+# How pictures are turned into model input for each output format
+FORMAT_DEFAULTS = {
+    "ssd":  {"scale": 1 / 127.5, "mean": (127.5, 127.5, 127.5), "swap_rb": False},
+    "yolo": {"scale": 1 / 255.0, "mean": (0, 0, 0), "swap_rb": True},
+}
+
+def ModelSettings(model="hog", config=None, labels=None, format="ssd", engine="opencv", size=320,
+                  threshold=0.5, classes=(), threads=2, camera_width=640, nice=10):
+    # Everything the worker process needs, as a plain dictionary (it is sent to the new process)
+    decode_scale = 1
+    while decode_scale < 8 and camera_width // (decode_scale * 2) >= size:
+        decode_scale *= 2           # Decode as small as possible while still at least `size` wide
+    return {"model": model, "config": config, "labels": labels, "format": format, "engine": engine,
+            "size": size, "threshold": threshold, "classes": [name for name in classes if name],
+            "threads": threads, "decode_scale": decode_scale, "nice": nice}
+
+def LoadLabels(path):
+    if not path:
+        return []
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+def Detection(label, confidence, x, y, width, height):
+    # Boxes are fractions of the picture (0-1), so they fit any size the picture is shown at
+    clip = lambda value: round(min(1.0, max(0.0, float(value))), 4)
+    return {"label": label, "confidence": round(float(confidence), 3),
+            "box": [clip(x), clip(y), clip(width), clip(height)]}
+
+
+# === Models (these run inside the worker process) ===
+class HogPersonModel:
+    def __init__(self, settings):
+        if not hasattr(cv2, "HOGDescriptor"):
+            raise RuntimeError("this OpenCV has no HOG people detector; give a model file with --detect-model")
+        self.hog = cv2.HOGDescriptor()
+        self.hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+        self.size = settings["size"]
+        self.threshold = settings["threshold"]
+
+    def Detect(self, pictures):
+        results = []
+        for picture in pictures:           # HOG looks at one picture at a time
+            height = round(picture.shape[0] * self.size / picture.shape[1])
+            small = cv2.resize(picture, (self.size, height), interpolation=cv2.INTER_AREA)
+            boxes, weights = self.hog.detectMultiScale(small, winStride=(8, 8))
+            results.append([Detection("person", weight, x / self.size, y / height, w / self.size, h / height)
+                            for (x, y, w, h), weight in zip(boxes, np.ravel(weights)) if weight >= self.threshold])
+        return results
+
+class DnnModel:
+    def __init__(self, settings):
+        self.size = settings["size"]
+        self.threshold = settings["threshold"]
+        self.format = settings["format"]
+        self.input = FORMAT_DEFAULTS[self.format]
+        self.labels = LoadLabels(settings["labels"])
+        self.session = None
+        if settings["engine"] == "onnxruntime":
+            if onnxruntime is None:
+                raise RuntimeError("onnxruntime is not installed (pip install onnxruntime)")
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = settings["threads"]
+            self.session = onnxruntime.InferenceSession(settings["model"], options, providers=["CPUExecutionProvider"])
+            self.input_name = self.session.get_inputs()[0].name
+        else:
+            self.net = cv2.dnn.readNet(settings["model"], settings["config"] or "")
+
+    def Detect(self, pictures):
+        # All pictures go through the model in one pass (a batch)
+        blob = cv2.dnn.blobFromImages(pictures, scalefactor=self.input["scale"], size=(self.size, self.size),
+                                      mean=self.input["mean"], swapRB=self.input["swap_rb"], crop=False)
+        if self.session:
+            output = self.session.run(None, {self.input_name: blob})[0]
+        else:
+            self.net.setInput(blob)
+            output = self.net.forward()
+        if self.format == "ssd":
+            return self._ssd(output, len(pictures))
+        return [self._yolo(picture_output) for picture_output in output]
+
+    def _label(self, class_id):
+        return self.labels[class_id] if class_id < len(self.labels) else f"class_{class_id}"
+
+    def _ssd(self, output, count):
+        # Rows of [picture, class, confidence, left, top, right, bottom] (already 0-1)
+        results = [[] for _ in range(count)]
+        for picture, class_id, confidence, left, top, right, bottom in output.reshape(-1, 7):
+            if confidence >= self.threshold and 0 <= int(picture) < count:
+                results[int(picture)].append(Detection(self._label(int(class_id)), confidence,
+                                                       left, top, right - left, bottom - top))
+        return results
+
+    def _yolo(self, output):
+        # One column per anchor: center x, center y, width, height (input pixels), then a score per class
+        rows = output.T
+        class_ids = rows[:, 4:].argmax(axis=1)
+        scores = rows[np.arange(len(rows)), 4 + class_ids]
+        keep = scores >= self.threshold
+        rows, class_ids, scores = rows[keep], class_ids[keep], scores[keep]
+        boxes = [[float(x - w / 2), float(y - h / 2), float(w), float(h)] for x, y, w, h in rows[:, :4]]
+        chosen = cv2.dnn.NMSBoxes(boxes, scores.tolist(), self.threshold, 0.45) if boxes else []
+        return [Detection(self._label(int(class_ids[i])), scores[i], *(value / self.size for value in boxes[i]))
+                for i in np.ravel(chosen)]
+
+def MakeModel(settings):
+    return HogPersonModel(settings) if settings["model"] == "hog" else DnnModel(settings)
+
+# Reads JPEGs already shrunk by 1/2, 1/4 or 1/8 (much faster than decoding, then resizing)
+REDUCED_DECODE = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2,
+                  4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+def DecodeAndDetect(model, settings, jpegs):
+    pictures = [cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), REDUCED_DECODE[settings["decode_scale"]])
+                for jpeg in jpegs]
+    readable = [picture for picture in pictures if picture is not None]
+    found = iter(model.Detect(readable) if readable else [])
+    wanted = set(settings["classes"])          # Empty: keep every label
+    results = []
+    for picture in pictures:
+        detections = next(found) if picture is not None else []
+        results.append([d for d in detections if not wanted or d["label"] in wanted])
+    return results
+
+def _worker(connection, settings):
+    # The detector process: loads the model, then answers batches of JPEGs until told to stop
+    with contextlib.suppress(OSError):
+        os.nice(settings["nice"])        # The live stream and the chime come first
+    cv2.setNumThreads(settings["threads"])
+    try:
+        model = MakeModel(settings)
+    except Exception as e:
+        connection.send(("error", str(e)))
+        return
+    connection.send(("ready", None))
+    while True:
+        try:
+            batch = connection.recv()
+        except (EOFError, OSError):
+            return
+        if batch is None:
+            return
+        cpu_started, started = time.process_time(), time.perf_counter()
+        try:
+            found = DecodeAndDetect(model, settings, [jpeg for _, _, jpeg in batch])
+        except Exception as e:
+            print("⚠️ Detector error:", e)
+            found = [[] for _ in batch]
+        connection.send(("result", [(sequence, timestamp, detections) for (sequence, timestamp, _), detections
+                                    in zip(batch, found)], time.process_time() - cpu_started, time.perf_counter() - started))
+
+
+# === Detection Service (in the server) ===
+class DetectionService:
+    def __init__(self, output, settings, publish=None, cpu_budget=0.5, batch=1, overlay_seconds=1.0, start_timeout=60):
+        self.output = output                  # The StreamingOutput with the camera's JPEGs
+        self.settings = settings              # From ModelSettings()
+        self.publish = publish                # publish(message) for every change in what is seen
+        self.cpu_budget = cpu_budget          # Most of one CPU core the detector may use on average (0.5 = half)
+        self.batch = batch                    # Frames run through the model together
+        self.overlay_seconds = overlay_seconds  # Boxes older than this are not drawn any more
+        self.start_timeout = start_timeout
+        self.condition = threading.Condition()
+        self.waiting = deque(maxlen=batch)    # Newest frames not sent to the worker yet
+        self.busy = False
+        self.next_allowed = 0.0               # Budget: the next batch may not start before this
+        self.running = False
+        self.latest = (0.0, [])               # (time, detections) of the newest result
+        self.last_published = []
+        # Numbers for monitoring
+        self.frames_seen = 0
+        self.stats = {"detected_frames": 0, "batches": 0, "cpu_seconds": 0.0, "seconds": 0.0,
+                      "last_latency_ms": 0.0, "found": Counter()}
+        self.started = time.monotonic()
+
+    def Begin(self):
+        context = multiprocessing.get_context("spawn")     # A fresh Python: no copies of our threads or camera
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=_worker, args=(child, self.settings), name="detector", daemon=True)
+        self.process.start()
+        child.close()
+        if not self.connection.poll(self.start_timeout):
+            self.process.terminate()
+            raise RuntimeError("the detector did not start in time")
+        kind, detail = self.connection.recv()
+        if kind == "error":
+            self.process.join(1)
+            raise RuntimeError(f"the detector could not load its model: {detail}")
+        self.running = True
+        self.started = time.monotonic()
+        self.output.AddViewer(background=True)      # The camera only makes frames while somebody watches
+        threading.Thread(target=self._feed, name="detect-feed", daemon=True).start()
+        threading.Thread(target=self._receive, name="detect-receive", daemon=True).start()
+        model = self.settings["model"] if self.settings["model"] == "hog" else os.path.basename(self.settings["model"])
+        print(f"🧠 Detector ready ({model}, {self.settings['size']} px, up to {100 * self.cpu_budget:.0f}% of a core)")
+
+    def Close(self):
+        if self.running:
+            self.output.RemoveViewer(background=True)
+        self.running = False
+        with contextlib.suppress(OSError, ValueError):
+            self.connection.send(None)
+        self.process.join(2)
+        if self.process.is_alive():
+            self.process.terminate()
+
+    def Current(self):
+        # What the detector saw in the last `overlay_seconds` (for the stream overlay)
+        found_at, detections = self.latest
+        return detections if time.time() - found_at < self.overlay_seconds else []
+
+    def Draw(self, picture, detections):
+        DrawDetections(picture, detections)
+
+    def Describe(self):
+        # A short sentence for the app's "describe" button when the cloud AI is off
+        found_at, detections = self.latest
+        if not self.running or time.time() - found_at > 5:
+            return "The local detector has no recent picture (is the camera on?)"
+        if not detections:
+            return "The local detector sees nobody at the door."
+        counts = Counter(d["label"] for d in detections)
+        return "The local detector sees " + ", ".join(f"{count} {label}" for label, count in counts.items()) + "."
+
+    def Stats(self):
+        with self.condition:
+            stats = dict(self.stats, found=dict(self.stats["found"]))
+            seen = self.frames_seen
+        batches = stats["batches"]
+        return {"frames_seen": seen, "frames_detected": stats["detected_frames"],
+                "skipped": max(0, seen - stats["detected_frames"]), "batches": batches,
+                "avg_batch_ms": round(1000 * stats["seconds"] / batches, 2) if batches else 0.0,
+                "cpu_percent": round(100 * stats["cpu_seconds"] / max(1e-6, time.monotonic() - self.started), 1),
+                "last_latency_ms": stats["last_latency_ms"], "found": stats["found"]}
+
+    # === Feeder Thread: hands the newest frames to the worker when it is free ===
+    def _feed(self):
+        sequence = self.output.Latest()[0]
+        while self.running:
+            sequence, frame = self.output.WaitForFrame(sequence, timeout=1)
+            if frame is None:
+                continue
+            with self.condition:
+                self.frames_seen += 1
+                self.waiting.append((sequence, time.time(), frame))
+                if self.busy or time.monotonic() < self.next_allowed:
+                    continue                  # Busy or over budget: older frames drop out of `waiting`
+                batch = list(self.waiting)
+                self.waiting.clear()
+                self.busy = True
+            try:
+                self.connection.send(batch)
+            except (OSError, ValueError):
+                return
+
+    # === Receiver Thread: takes the worker's answers ===
+    def _receive(self):
+        while self.running:
+            try:
+                kind, results, cpu_seconds, seconds = self.connection.recv()
+            except (EOFError, OSError, ValueError):
+                if self.running:
+                    print("❌ Detector process stopped")
+                return
+            now = time.time()
+            DETECT_SECONDS.Observe(seconds)
+            with self.condition:
+                self.busy = False
+                # Wait so that, on average, CPU time / wall time stays within the budget
+                self.next_allowed = time.monotonic() + max(0.0, cpu_seconds / self.cpu_budget - seconds)
+                self.stats["batches"] += 1
+                self.stats["detected_frames"] += len(results)
+                self.stats["cpu_seconds"] += cpu_seconds
+                self.stats["seconds"] += seconds
+                sequence, timestamp, detections = results[-1]    # The newest frame of the batch
+                self.stats["last_latency_ms"] = round(1000 * (now - timestamp), 1)
+                self.stats["found"].update(d["label"] for d in detections)
+            self.latest = (timestamp, detections)
+            for detection in detections:
+                DETECTIONS_FOUND.Labels(detection["label"]).Inc()
+            # Tell the app when something is seen, and once more when it is gone
+            if self.publish and (detections or self.last_published):
+                self.publish({"sequence": sequence, "time": timestamp, "detections": detections,
+                              "latency_ms": self.stats["last_latency_ms"]})
+            self.last_published = detections
+
+
+# === Drawing the Boxes ===
+COLORS = {"person": (0, 200, 255), "package": (255, 160, 0)}      # BGR; other labels are green
+
+def DrawDetections(picture, detections):
+    height, width = picture.shape[:2]
+    thickness = max(1, width // 320)
+    for detection in detections:
+        x, y, w, h = detection["box"]
+        left, top = int(x * width), int(y * height)
+        right, bottom = int((x + w) * width), int((y + h) * height)
+        color = COLORS.get(detection["label"], (0, 220, 0))
+        cv2.rectangle(picture, (left, top), (right, bottom), color, thickness)
+        cv2.putText(picture, f"{detection['label']} {100 * detection['confidence']:.0f}%", (left + 2, max(12, top - 4)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.4 * thickness, color, thickness)
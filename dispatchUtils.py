@@ -0,0 +1,121 @@
+import threading
+import time
+from collections import deque
+
+# === Topic Worker ===
+# Runs the handler for one MQTT topic on its own background thread, one message at a time,
+# so slow work (starting the camera, changing the volume, asking the AI) never blocks
+# the MQTT thread or the other topics.
+#
+# What happens when messages arrive faster than the handler can keep up ("policy"):
+#   "queue"  - keep them in order, but at most max_pending; the oldest is dropped when full
+#   "latest" - only the newest waiting message matters (e.g. camera on/off: the last click wins)
+#   "merge"  - combine waiting messages with merge(old, new) (e.g. five "Vol +" clicks -> +5)
+#   "inline" - run the handler right away on the MQTT thread (only for handlers that never block)
+class TopicWorker:
+    def __init__(self, name, handler, policy="queue", max_pending=8, merge=None):
+        self.name = name
+        self.handler = handler
+        self.policy = policy
+        self.max_pending = max_pending
+        self.merge = merge
+        self.pending = deque()
+        self.condition = threading.Condition()
+        self.closed = False
+        # Numbers for monitoring
+        self.handled = 0            # Messages the handler finished
+        self.dropped = 0            # Messages thrown away because the queue was full
+        self.coalesced = 0          # Messages replaced by a newer one or merged into another
+        self.errors = 0             # Handler calls that raised an exception
+        self.total_seconds = 0.0    # Time spent in the handler
+        self.max_seconds = 0.0      # Slowest single handler call
+        self.thread = None
+        if policy != "inline":
+            self.thread = threading.Thread(target=self._run, name=f"topic-{name}", daemon=True)
+            self.thread.start()
+
+    def Submit(self, payload):
+        if self.policy == "inline":
+            self._handle(payload)
+            return
+        with self.condition:
+            if self.policy == "latest" and self.pending:
+                self.pending.clear()
+                self.coalesced += 1
+            elif self.policy == "merge" and self.pending:
+                self.pending[-1] = self.merge(self.pending[-1], payload)
+                self.coalesced += 1
+                return
+            elif len(self.pending) >= self.max_pending:
+                self.pending.popleft()
+                self.dropped += 1
+            self.pending.append(payload)
+            self.condition.notify()
+
+    def Close(self, timeout=2):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        if self.thread:
+            self.thread.join(timeout)
+
+    def Stats(self):
+        with self.condition:
+            return {
+                "depth": len(self.pending),
+                "handled": self.handled,
+                "dropped": self.dropped,
+                "coalesced": self.coalesced,
+                "errors": self.errors,
+                "avg_ms": round(1000 * self.total_seconds / self.handled, 2) if self.handled else 0.0,
+                "max_ms": round(1000 * self.max_seconds, 2),
+            }
+
+    def _run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending or self.closed)
+                if self.closed:
+                    return
+                payload = self.pending.popleft()
+            self._handle(payload)
+
+    def _handle(self, payload):
+        started = time.perf_counter()
+        failed = False
+        try:
+            self.handler(payload)
+        except Exception as e:
+            failed = True
+            print(f"❌ Error handling {self.name}:", e)
+        elapsed = time.perf_counter() - started
+        with self.condition:            # Inline handlers run on several threads at once
+            self.errors += failed
+            self.handled += 1
+            self.total_seconds += elapsed
+            self.max_seconds = max(self.max_seconds, elapsed)
+
+
+# === Command Dispatcher ===
+# Sends each MQTT message to the worker registered for its topic
+class CommandDispatcher:
+    def __init__(self):
+        self.workers = {}
+
+    def Register(self, topic, handler, name=None, **options):
+        self.workers[topic] = TopicWorker(name or topic, handler, **options)
+
+    def Dispatch(self, topic, payload):
+        # Returns False if nobody handles this topic
+        worker = self.workers.get(topic)
+        if worker is None:
+            return False
+        worker.Submit(payload)
+        return True
+
+    def Stats(self):
+        return {worker.name: worker.Stats() for worker in self.workers.values()}
+
+    def Close(self):
+        for worker in self.workers.values():
+            worker.Close()
@@ -0,0 +1,276 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit, parse_qs
+import metricsUtils
+
+# === Event History ===
+# Every bell press, motion event and AI description is saved, with a small thumbnail, so the
+# web app can show a timeline (/events) long after the messages on the terminal are gone.
+#
+# The events live in an SQLite database file:
+#   - WAL mode: the web app can read the history while new events are written (no waiting),
+#     and a write is one append to the log instead of rewriting pages all over the SD card
+#   - events are indexed by time and by kind, and pages are fetched "before id N" (not with
+#     OFFSET), so page 1000 is as quick as page 1 even with hundreds of thousands of events
+#   - thumbnails are in their own table, so scrolling through events never reads them
+#
+# Record() only takes the picture of that moment (the newest live frame, if the stream is
+# running) and puts the event in a queue, then returns right away (it's called by the bell
+# button). A writer thread shrinks the pictures to thumbnails and saves everything that arrived
+# within `batch_seconds` in one transaction: one SD card write for a burst of events.
+EVENT_WRITE_SECONDS = metricsUtils.STAGE_SECONDS.Labels("event_write")
+EVENTS_SAVED = metricsUtils.REGISTRY.Counter("doorbell_events_total", "Events saved in the event history", labels=("kind",))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,          -- Grows with every event, so newer events have bigger ids
+    time REAL NOT NULL,              -- Unix time (seconds)
+    kind TEXT NOT NULL,              -- "bell", "motion", "ai", ...
+    detail TEXT,                     -- JSON with anything else (motion score, the AI's answer...)
+    thumb INTEGER NOT NULL DEFAULT 0 -- 1 if the thumbs table has a picture for this event
+);
+CREATE INDEX IF NOT EXISTS events_time ON events(time);
+CREATE INDEX IF NOT EXISTS events_kind ON events(kind);   -- Also sorted by id inside each kind
+CREATE TABLE IF NOT EXISTS thumbs (
+    id INTEGER PRIMARY KEY,          -- The event's id
+    jpeg BLOB NOT NULL
+);
+"""
+
+class EventStore:
+    def __init__(self, path="./events/events.db", picture=None, thumbnail=None, batch_seconds=0.5,
+                 max_pending=1000, keep_days=0, page_size=50, max_page_size=500):
+        self.path = path
+        self.picture = picture                # Returns a JPEG of what the camera sees right now, or None; must be quick
+        self.thumbnail = thumbnail            # Shrinks that JPEG to a thumbnail (on the writer thread); None = keep it as it is
+        self.batch_seconds = batch_seconds    # Events arriving this close together are saved together
+        self.max_pending = max_pending        # Events waiting for the writer beyond this are dropped
+        self.keep_days = keep_days            # Events older than this are deleted (0 = keep everything)
+        self.page_size = page_size
+        self.max_page_size = max_page_size
+        self.pending = queue.Queue()
+        self.readers = queue.SimpleQueue()    # Read-only database connections, shared by the web handlers
+        self.listeners = []
+        self.writer_thread = None
+        self.last_cleanup = 0.0
+        self.lock = threading.Lock()          # Protects the numbers below
+        self.recorded = 0                     # Numbers for monitoring
+        self.saved = 0
+        self.failed = 0                       # Lost because the database couldn't be written
+        self.dropped = 0                      # Not recorded because too many were waiting
+        self.batches = 0
+        self.write_seconds = 0.0
+
+    def Begin(self):
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")      # With WAL: safe after a crash, far fewer SD card syncs
+        self.db.executescript(SCHEMA)
+        self.db.commit()
+        self.writer_thread = threading.Thread(target=self._write_events, name="event-writer", daemon=True)
+        self.writer_thread.start()
+        count = self.db.execute("SELECT max(id) FROM events").fetchone()[0] or 0
+        print(f"🗂️ Event history ready ({self.path}, last event #{count})")
+
+    def Close(self):
+        if self.writer_thread:
+            self.pending.put(None)                        # Save what is still waiting, then stop
+            self.writer_thread.join(timeout=10)
+            self.writer_thread = None
+            self.db.close()
+        while not self.readers.empty():
+            self.readers.get().close()
+
+    def AddListener(self, listener):
+        # listener(events) runs on the writer thread after each batch is saved (a list of event dicts)
+        self.listeners.append(listener)
+
+    def Record(self, kind, detail=None, timestamp=None, jpeg=None):
+        # Called from the button, motion and AI handlers. Returns right away.
+        # jpeg: the picture that belongs to the event (e.g. the one the AI described); by default
+        # the camera's picture of this moment, if there is one
+        with self.lock:
+            if self.pending.qsize() >= self.max_pending:
+                self.dropped += 1
+                return False
+            self.recorded += 1
+        if jpeg is None and self.picture:
+            try:
+                jpeg = self.picture()
+            except Exception as e:
+                print("⚠️ Event picture error:", e)
+        self.pending.put((timestamp or time.time(), kind, detail, jpeg))
+        return True
+
+    def Flush(self, timeout=10):
+        # Waits until every recorded event is saved (for the benchmarks, and before reading right after)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self.lock:
+                if self.saved + self.failed >= self.recorded:
+                    return True
+            time.sleep(0.01)
+        return False
+
+    # === Reading ===
+    def Query(self, before=None, kind=None, since=None, until=None, limit=None):
+        # Newest first. before = the "next" value of the previous page (an event id).
+        # Returns {"events": [...], "next": id to pass as `before` for the next page, or None}
+        limit = max(1, min(limit or self.page_size, self.max_page_size))
+        conditions, values = [], []
+        for condition, value in (("id < ?", before), ("kind = ?", kind), ("time >= ?", since), ("time < ?", until)):
+            if value is not None:
+                conditions.append(condition)
+                values.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._reader() as db:
+            rows = db.execute(f"SELECT id, time, kind, detail, thumb FROM events {where} ORDER BY id DESC LIMIT ?",
+                              values + [limit]).fetchall()
+        events = [self._event(*row) for row in rows]
+        return {"events": events, "next": events[-1]["id"] if len(events) == limit else None}
+
+    def Thumbnail(self, event_id):
+        with self._reader() as db:
+            row = db.execute("SELECT jpeg FROM thumbs WHERE id = ?", (event_id,)).fetchone()
+        return row[0] if row else None
+
+    def Respond(self, url_path, request_headers):
+        # Web handler for /events?before=&kind=&since=&until=&limit= and /events/<id>/thumb.jpg
+        parts = urlsplit(url_path)
+        path = parts.path.rstrip("/")
+        if path == "/events":
+            query = {name: values[0] for name, values in parse_qs(parts.query).items()}
+            try:
+                page = self.Query(before=_number(query.get("before"), int), kind=query.get("kind") or None,
+                                  since=_number(query.get("since"), float), until=_number(query.get("until"), float),
+                                  limit=_number(query.get("limit"), int))
+            except ValueError:
+                return _text(400, b"Bad query\n")
+            body = json.dumps(page).encode()
+            return 200, [("Content-Type", "application/json"), ("Cache-Control", "no-cache"),
+                         ("Content-Length", str(len(body)))], body
+        pieces = path.split("/")                  # ["", "events", "<id>", "thumb.jpg"]
+        if len(pieces) == 4 and pieces[3] == "thumb.jpg" and pieces[2].isdigit():
+            jpeg = self.Thumbnail(int(pieces[2]))
+            if jpeg is None:
+                return _text(404, b"No thumbnail\n")
+            # A saved event never changes, so browsers can keep its picture for good
+            return 200, [("Content-Type", "image/jpeg"), ("Cache-Control", "max-age=31536000, immutable"),
+                         ("Content-Length", str(len(jpeg)))], jpeg
+        return _text(404, b"Not found\n")
+
+    def Stats(self):
+        with self.lock:
+            return {"recorded": self.recorded, "saved": self.saved, "failed": self.failed, "dropped": self.dropped,
+                    "waiting": self.pending.qsize(), "batches": self.batches,
+                    "avg_batch_ms": round(1000 * self.write_seconds / self.batches, 2) if self.batches else 0.0}
+
+    def _reader(self):
+        return _ReaderConnection(self)
+
+    def _event(self, event_id, timestamp, kind, detail, thumb):
+        return {"id": event_id, "time": timestamp, "kind": kind,
+                "detail": json.loads(detail) if detail else None,
+                "thumb": f"/events/{event_id}/thumb.jpg" if thumb else None}
+
+    # === Writer Thread ===
+    def _write_events(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                return
+            batch, stop = [item], False
+            deadline = time.monotonic() + self.batch_seconds
+            while True:                           # Collect everything else that arrives in the next moment
+                try:
+                    item = self.pending.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._save(batch)
+            if stop:
+                return
+
+    def _save(self, batch):
+        rows = []
+        for timestamp, kind, detail, jpeg in batch:
+            try:
+                if jpeg is not None and self.thumbnail:
+                    jpeg = self.thumbnail(jpeg)
+            except Exception as e:
+                print("⚠️ Event thumbnail error:", e)
+                jpeg = None
+            rows.append((timestamp, kind, json.dumps(detail) if detail is not None else None, jpeg))
+        started = time.perf_counter()
+        events = []
+        try:
+            with self.db:                         # One transaction for the whole batch
+                for timestamp, kind, detail, jpeg in rows:
+                    event_id = self.db.execute("INSERT INTO events (time, kind, detail, thumb) VALUES (?, ?, ?, ?)",
+                                               (timestamp, kind, detail, int(jpeg is not None))).lastrowid
+                    if jpeg is not None:
+                        self.db.execute("INSERT INTO thumbs (id, jpeg) VALUES (?, ?)", (event_id, jpeg))
+                    events.append(self._event(event_id, timestamp, kind, detail, jpeg is not None))
+                self._clean_up()
+        except sqlite3.Error as e:
+            print("❌ Event history write error:", e)
+            with self.lock:
+                self.failed += len(rows)
+            return
+        elapsed = time.perf_counter() - started
+        EVENT_WRITE_SECONDS.Observe(elapsed)
+        with self.lock:
+            self.saved += len(events)
+            self.batches += 1
+            self.write_seconds += elapsed
+        for event in events:
+            EVENTS_SAVED.Labels(event["kind"]).Inc()
+        for listener in self.listeners:
+            try:
+                listener(events)
+            except Exception as e:
+                print("⚠️ Event listener error:", e)
+
+    def _clean_up(self):
+        # Old events are deleted at most once an hour (inside the current transaction)
+        if not self.keep_days or time.monotonic() - self.last_cleanup < 3600:
+            return
+        self.last_cleanup = time.monotonic()
+        cutoff = time.time() - self.keep_days * 86400
+        newest_old = self.db.execute("SELECT max(id) FROM events WHERE time < ?", (cutoff,)).fetchone()[0]
+        if newest_old is not None:
+            self.db.execute("DELETE FROM thumbs WHERE id <= ?", (newest_old,))
+            self.db.execute("DELETE FROM events WHERE id <= ?", (newest_old,))
+
+
+# Lends a read-only connection for one query (each thread can't share one SQLite connection at once)
+class _ReaderConnection:
+    def __init__(self, store):
+        self.store = store
+
+    def __enter__(self):
+        try:
+            self.db = self.store.readers.get_nowait()
+        except queue.Empty:
+            self.db = sqlite3.connect(f"file:{self.store.path}?mode=ro", uri=True, check_same_thread=False)
+        return self.db
+
+    def __exit__(self, *exc):
+        self.store.readers.put(self.db)
+
+
+def _number(text, kind):
+    return kind(text) if text not in (None, "") else None
+
+def _text(status, body):
+    return status, [("Content-Type", "text/plain"), ("Content-Length", str(len(body)))], body
@@ -0,0 +1,395 @@
+import os
+import queue
+import threading
+import time
+import wave
+
+# === Stand-in Devices for Testing Without a Raspberry Pi ===
+# These classes behave like the real hardware closely enough for the server code
+# to run on a laptop, so the fast paths can be benchmarked and tested anywhere.
+# OpenCV and NumPy are imported where they are used, so the fake MQTT broker and buttons are
+# ready without waiting for them (like the real ones; see "Fast Start" in ring_server.py).
+
+# === Fake Camera (acts like Picamera2) ===
+# Makes up a moving test picture instead of reading a real camera sensor, or plays back
+# recorded frames (a video file, or a folder of pictures) over and over.
+# configure_seconds / start_seconds pretend the sensor takes that long to set up and to start
+# (a real camera needs a few hundred milliseconds), for comparing the camera standby policies.
+class FakePicamera2:
+    def __init__(self, fps=30, source=None, configure_seconds=0.0, start_seconds=0.0):
+        self.config = {"main": {"size": (640, 480), "format": "RGB888"}}
+        self.controls = {}
+        self.started = False
+        self.frame_interval = 1.0 / fps
+        self.frame_count = 0
+        self.encoders = {}              # Running fake encoders: id(encoder) -> (thread, stop event)
+        self.recording = LoadFrames(source) if source else None
+        self.last_capture_time = 0.0    # time.perf_counter() of the newest capture (for latency measurements)
+        self.configure_seconds = configure_seconds
+        self.start_seconds = start_seconds
+        self.configure_count = 0        # How many times configure() / start() were called
+        self.start_count = 0
+
+    def create_video_configuration(self, main=None, lores=None, **kwargs):
+        config = {"main": dict(main or {"size": (640, 480)})}
+        if lores:
+            config["lores"] = dict(lores)
+        return config
+
+    def configure(self, config):
+        if self.started:
+            raise RuntimeError("Camera must be stopped before configuring")
+        time.sleep(self.configure_seconds)
+        self.configure_count += 1
+        self.config = config
+
+    def start(self):
+        time.sleep(self.start_seconds)
+        self.start_count += 1
+        self.started = True
+
+    def stop(self):
+        self.started = False
+
+    def close(self):
+        self.stop()
+
+    def set_controls(self, controls):
+        self.controls.update(controls)
+        if "FrameDurationLimits" in controls:
+            self.frame_interval = controls["FrameDurationLimits"][0] / 1_000_000
+
+    def capture_array(self, name="main"):
+        import cv2, numpy as np
+        if not self.started:
+            raise RuntimeError("Camera is not running")
+        width, height = self.config[name]["size"]
+        self.frame_count += 1
+        self.last_capture_time = time.perf_counter()
+        if self.config[name].get("format") == "YUV420":
+            # Brightness (Y) plane on top, half-size color planes packed underneath
+            frame = np.full((height * 3 // 2, width), 128, dtype=np.uint8)
+            frame[:height] = ((np.arange(width) + self.frame_count * 4) % 256).astype(np.uint8)[None, :]
+            return frame
+        if self.recording:
+            picture = self.recording[self.frame_count % len(self.recording)]
+            if picture.shape[1] != width or picture.shape[0] != height:
+                picture = cv2.resize(picture, (width, height), interpolation=cv2.INTER_AREA)
+            return picture
+        # A gradient that slides sideways a little every frame
+        row = (np.arange(width, dtype=np.uint16) + self.frame_count * 4) % 256
+        frame = np.empty((height, width, 3), dtype=np.uint8)
+        frame[:] = row.astype(np.uint8)[None, :, None]
+        return frame
+
+    # Picamera2 encoders write finished frames to an output; we write tiny placeholder frames
+    # (a JPEG, or an H.264 keyframe for encoders named like "H264Encoder")
+    def start_encoder(self, encoder=None, output=None, **kwargs):
+        stop = threading.Event()
+        h264 = "H264" in type(encoder).__name__
+        quality = getattr(encoder, "q", None)     # FakeJpegEncoder: make real JPEGs of the picture
+        thread = threading.Thread(target=self._encode_loop, args=(output, stop, h264, quality), daemon=True)
+        self.encoders[id(encoder)] = (thread, stop)
+        thread.start()
+
+    def stop_encoder(self, encoders=None):
+        if encoders is None:
+            keys = list(self.encoders)
+        else:
+            keys = [id(encoder) for encoder in (encoders if isinstance(encoders, list) else [encoders])]
+        for key in keys:
+            thread, stop = self.encoders.pop(key, (None, None))
+            if thread:
+                stop.set()
+                thread.join()
+
+    def _encode_loop(self, output, stop, h264, quality):
+        import cv2
+        while not stop.wait(self.frame_interval):
+            if quality is not None and self.started:
+                _, jpeg = cv2.imencode(".jpg", self.capture_array(), [cv2.IMWRITE_JPEG_QUALITY, quality])
+                output.write(jpeg.tobytes())
+                continue
+            self.frame_count += 1
+            if h264:
+                output.write(b"\x00\x00\x00\x01\x67\x42\xc0\x1e" + b"\x00\x00\x00\x01\x68\xce\x3c\x80"
+                             + b"\x00\x00\x00\x01\x65" + self.frame_count.to_bytes(4, "big"))
+            else:
+                output.write(b"\xff\xd8" + self.frame_count.to_bytes(4, "big") + b"\xff\xd9")
+
+def LoadFrames(source, limit=240):
+    # Recorded frames for the fake camera: a video file, or a folder of pictures (in name order)
+    import cv2
+    frames = []
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source))[:limit]:
+            picture = cv2.imread(os.path.join(source, name), cv2.IMREAD_COLOR)
+            if picture is not None:
+                frames.append(picture)
+    else:
+        video = cv2.VideoCapture(source)
+        while len(frames) < limit:
+            ok, picture = video.read()
+            if not ok:
+                break
+            frames.append(picture)
+        video.release()
+    if not frames:
+        raise ValueError(f"no pictures found in {source}")
+    return frames
+
+
+# === Fake Picamera2 Encoders and Output ===
+# Same names and arguments as picamera2.encoders / picamera2.outputs, so the server code
+# can hand them to FakePicamera2.start_encoder() unchanged
+class FakeJpegEncoder:
+    def __init__(self, q=85):
+        self.q = q
+
+class FakeMJPEGEncoder(FakeJpegEncoder):
+    def __init__(self):
+        super().__init__(q=80)
+
+class FakeH264Encoder:
+    def __init__(self, bitrate=None, repeat=False, iperiod=None):
+        self.bitrate = bitrate
+        self.repeat = repeat
+        self.iperiod = iperiod
+
+def FakeFileOutput(output):
+    return output        # Our outputs already have write() and flush()
+
+
+# === Fake Button and Motion Sensor (act like gpiozero's) ===
+# gpiozero calls when_pressed / when_motion on a thread of its own; Press() and Trigger() do the same
+class FakeButton:
+    def __init__(self, pin):
+        self.pin = pin
+        self.when_pressed = None
+
+    def Press(self):
+        if self.when_pressed:
+            threading.Thread(target=self.when_pressed, name=f"gpio-{self.pin}", daemon=True).start()
+
+class FakeMotionSensor:
+    def __init__(self, pin):
+        self.pin = pin
+        self.when_motion = None
+
+    def Trigger(self):
+        if self.when_motion:
+            threading.Thread(target=self.when_motion, name=f"gpio-{self.pin}", daemon=True).start()
+
+
+# === Fake Sound Card (acts like the pyaudio module) ===
+# Use it with audioUtils.UseAudioBackend(FakeAudioBackend("door.wav")).
+#   - the microphone plays a WAV file (mono, 16-bit) over and over, in real time,
+#     or quiet background noise if no file is given
+#   - the speaker takes sound at the speed a real one would, and throws it away
+class FakeAudioBackend:
+    paInt16 = 8
+    paContinue = 0
+
+    def __init__(self, wav=None):
+        self.samples = None
+        if wav:
+            import numpy as np
+            with wave.open(wav, "rb") as f:
+                samples = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+                if f.getnchannels() > 1:
+                    samples = samples.reshape(-1, f.getnchannels()).mean(axis=1).astype(np.int16)
+                self.samples = samples
+        self.streams = []                # Every stream opened so far (tests can look at them)
+
+    def PyAudio(self):
+        return FakePyAudio(self)
+
+class FakePyAudio:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def get_sample_size(self, format):
+        return 2
+
+    def open(self, format=None, channels=1, rate=44100, input=False, output=False,
+             frames_per_buffer=1024, stream_callback=None, **kwargs):
+        stream = FakeAudioStream(self.backend, rate, channels, frames_per_buffer, stream_callback)
+        self.backend.streams.append(stream)
+        return stream
+
+    def terminate(self):
+        pass
+
+class FakeAudioStream:
+    def __init__(self, backend, rate, channels, frames_per_buffer, callback):
+        self.backend = backend
+        self.rate = rate
+        self.channels = channels
+        self.frames_per_buffer = frames_per_buffer
+        self.callback = callback
+        self.opened_at = time.perf_counter()   # When sample 0 was "recorded"
+        self.position = 0                      # Samples read from the microphone so far
+        self.written = 0                       # Samples played on the speaker so far
+        self.stop = threading.Event()
+        self.thread = None
+
+    # Microphone
+    def read(self, frames, exception_on_overflow=True):
+        # Like a real microphone, a chunk is only ready once its last sample has been recorded
+        ready_at = self.opened_at + (self.position + frames) / self.rate
+        time.sleep(max(0.0, ready_at - time.perf_counter()))
+        import numpy as np
+        source = self.backend.samples
+        if source is None or not len(source):
+            chunk = np.random.default_rng(self.position).normal(0, 30, frames).astype(np.int16)
+        else:
+            indexes = np.arange(self.position, self.position + frames) % len(source)
+            chunk = source[indexes]
+        self.position += frames
+        return chunk.tobytes()
+
+    # Speaker, the simple way (write() returns once the sound "has been played")
+    def write(self, data):
+        frames = len(data) // (2 * self.channels)
+        self.written += frames
+        time.sleep(frames / self.rate)
+
+    # Speaker, the callback way: asks for the next buffer every frames_per_buffer samples
+    def start_stream(self):
+        if self.callback and self.thread is None:
+            self.thread = threading.Thread(target=self._run_callback, name="fake-audio", daemon=True)
+            self.thread.start()
+
+    def _run_callback(self):
+        interval = self.frames_per_buffer / self.rate
+        next_time = time.perf_counter()
+        while not self.stop.is_set():
+            self.callback(None, self.frames_per_buffer, {}, 0)
+            self.written += self.frames_per_buffer
+            next_time += interval
+            time.sleep(max(0.0, next_time - time.perf_counter()))
+
+    def get_output_latency(self):
+        return self.frames_per_buffer / self.rate
+
+    def stop_stream(self):
+        self.stop.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def close(self):
+        self.stop.set()
+
+
+# === Fake MQTT (acts like the Mosquitto broker and paho's client) ===
+# Everything stays inside this program. Each client delivers its messages on a thread of its
+# own (like paho's network thread), so handlers run the same way they do with the real broker.
+class FakeMqttBroker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clients = []
+        self.retained = {}
+
+    def Connect(self, client):
+        with self.lock:
+            self.clients.append(client)
+
+    def Disconnect(self, client):
+        with self.lock:
+            if client in self.clients:
+                self.clients.remove(client)
+
+    def Subscribe(self, client, pattern):
+        with self.lock:
+            retained = [(topic, payload) for topic, payload in self.retained.items() if TopicMatches(pattern, topic)]
+        for topic, payload in retained:
+            client._deliver(topic, payload)
+
+    def Publish(self, topic, payload, retain=False):
+        with self.lock:
+            if retain:
+                self.retained[topic] = payload
+            receivers = [client for client in self.clients
+                         if any(TopicMatches(pattern, topic) for pattern in client.subscriptions)]
+        for client in receivers:
+            client._deliver(topic, payload)
+
+def TopicMatches(pattern, topic):
+    # MQTT wildcards: "+" is one level, "#" is everything below
+    pattern_parts, topic_parts = pattern.split("/"), topic.split("/")
+    for index, part in enumerate(pattern_parts):
+        if part == "#":
+            return True
+        if index >= len(topic_parts) or (part != "+" and part != topic_parts[index]):
+            return False
+    return len(pattern_parts) == len(topic_parts)
+
+BROKER = FakeMqttBroker()        # The broker every FakeMqttClient uses unless given another one
+
+class FakeMqttMessage:
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+        self.timestamp = time.perf_counter()    # When it was published (for round-trip measurements)
+
+class FakeMqttClient:
+    def __init__(self, client_id="", transport="tcp", broker=None, **kwargs):
+        self.broker = broker or BROKER
+        self.on_message = None
+        self.on_connect = None
+        self.on_disconnect = None
+        self.subscriptions = set()
+        self.messages = queue.Queue()
+        self.connected = False
+        self.thread = None
+
+    def connect(self, host="127.0.0.1", port=1883, keepalive=60):
+        self.broker.Connect(self)
+        self.connected = True
+        self.messages.put(("connect", None))
+        return 0
+
+    def loop_start(self):
+        self.thread = threading.Thread(target=self._loop, name="fake-mqtt", daemon=True)
+        self.thread.start()
+
+    def loop_stop(self):
+        if self.thread:
+            self.messages.put(("stop", None))
+            self.thread.join(timeout=2)
+            self.thread = None
+
+    def disconnect(self):
+        if self.connected:
+            self.connected = False
+            self.broker.Disconnect(self)
+            self.messages.put(("disconnect", None))
+
+    def subscribe(self, topic, qos=0):
+        self.subscriptions.add(topic)
+        self.broker.Subscribe(self, topic)
+        return 0, 0
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        if isinstance(payload, str):
+            payload = payload.encode()
+        self.broker.Publish(topic, payload if payload is not None else b"", retain)
+
+    def _deliver(self, topic, payload):
+        self.messages.put(("message", FakeMqttMessage(topic, payload)))
+
+    def _loop(self):
+        while True:
+            kind, message = self.messages.get()
+            if kind == "stop":
+                return
+            try:
+                if kind == "connect" and self.on_connect:
+                    self.on_connect(self, None, {}, 0)
+                elif kind == "disconnect" and self.on_disconnect:
+                    self.on_disconnect(self, None, {}, 0)
+                elif kind == "message" and self.on_message:
+                    self.on_message(self, None, message)
+            except Exception as e:
+                print("❌ Fake MQTT callback error:", e)
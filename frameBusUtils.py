@@ -0,0 +1,280 @@
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+import numpy as np
+import metricsUtils
+
+# === Shared-Memory Frame Bus ===
+# Lets other programs on the doorbell (a plate reader, a package detector, a recorder...) use the
+# camera pictures without capturing again or decoding /stream.mjpg. The server writes every frame
+# into a block of shared memory (in /dev/shm); readers in other processes map the same memory,
+# so they get the raw picture (a NumPy array) and the JPEG without any copying through sockets,
+# and run on their own CPU cores instead of competing with the server for Python's GIL.
+#
+# The memory is a small ring of slots, one frame per slot (frame n goes into slot n % slots):
+#   bus header (64 bytes)  magic "ORFB" | version | slots | slot size | raw capacity | JPEG capacity
+#                          | newest frame number | newest reader heartbeat | closed flag
+#   slot header (64 bytes) lock | frame number | time | width | height | channels | raw length | JPEG length
+#   raw picture            height x width x channels bytes (BGR, like OpenCV)
+#   JPEG                   the same frame as sent to the web viewers
+#
+# Nobody ever waits for a lock. Each slot has a "seqlock" counter: the server makes it odd before
+# writing and even again afterwards. A reader notes the counter, copies the frame, and checks the
+# counter again: if it was odd, or changed meanwhile, the server was writing and the reader tries
+# again. A slow reader can never hold up the camera.
+#
+# The server only copies frames while somebody reads (readers write a heartbeat time into the
+# bus header), so the bus costs nothing when no add-on is running.
+
+DEFAULT_NAME = "orion-doorbell-frames"
+BUS_MAGIC = b"ORFB"
+BUS_VERSION = 1
+BUS_HEADER = struct.Struct("<4sHHIII")      # magic, version, slots, slot size, raw capacity, JPEG capacity
+NEWEST_OFFSET = 24                          # Frame number of the newest complete frame (8 bytes)
+HEARTBEAT_OFFSET = 32                       # time.time() of the newest reader heartbeat (8 bytes)
+CLOSED_OFFSET = 40                          # 1 once the server has stopped (1 byte)
+HEADER_SIZE = 64
+SLOT_LOCK = struct.Struct("<Q")
+SLOT_HEADER = struct.Struct("<QQdIIIII")    # lock, frame number, time, width, height, channels, raw length, JPEG length
+SLOT_HEADER_SIZE = 64
+READER_TIMEOUT = 2.0                        # Seconds without a heartbeat before the readers count as gone
+HEARTBEAT_INTERVAL = 0.5
+
+PUBLISH_SECONDS = metricsUtils.STAGE_SECONDS.Labels("frame_bus")
+BUS_FRAMES = metricsUtils.REGISTRY.Counter("doorbell_frame_bus_frames_total", "Frames written to the shared-memory frame bus").Labels()
+
+def _attach(name):
+    # Map an existing bus without Python's resource tracker deleting it when this process ends
+    try:
+        return shared_memory.SharedMemory(name, track=False)     # Python 3.13 and newer
+    except TypeError:
+        memory = shared_memory.SharedMemory(name)
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(memory._name, "shared_memory")
+        return memory
+
+
+# === Server Side ===
+class FrameBus:
+    def __init__(self, width, height, channels=3, slots=4, jpeg_capacity=None, name=DEFAULT_NAME):
+        self.name = name
+        self.slots = slots
+        self.raw_capacity = width * height * channels
+        self.jpeg_capacity = jpeg_capacity or width * height      # A JPEG is nearly always far smaller than this
+        self.slot_size = -(-(SLOT_HEADER_SIZE + self.raw_capacity + self.jpeg_capacity) // 64) * 64
+        self.memory = None
+        self.data = None                       # The whole block as a NumPy byte array (for fast copies)
+        self.sequence = 0                      # Number of the newest frame written
+        self.locks = [0] * slots               # Each slot's seqlock counter (even = not being written)
+        self.readers_present = False
+        self.reader_listeners = []             # Functions to call with True/False when readers come or go
+        self.skipped = {"raw_too_big": 0, "jpeg_too_big": 0}
+        self.closed = False
+        self.thread = threading.Thread(target=self._watch_readers, name="frame-bus", daemon=True)
+
+    def Begin(self):
+        size = HEADER_SIZE + self.slots * self.slot_size
+        try:
+            self.memory = shared_memory.SharedMemory(self.name, create=True, size=size)
+        except FileExistsError:
+            # Left over from a server that did not shut down cleanly: start over
+            old = _attach(self.name)
+            old.close()
+            old.unlink()
+            self.memory = shared_memory.SharedMemory(self.name, create=True, size=size)
+        self.data = np.ndarray((size,), dtype=np.uint8, buffer=self.memory.buf)
+        BUS_HEADER.pack_into(self.memory.buf, 0, BUS_MAGIC, BUS_VERSION, self.slots, self.slot_size,
+                             self.raw_capacity, self.jpeg_capacity)
+        self.thread.start()
+        print(f"🚌 Frame bus ready: /dev/shm/{self.name} ({size // 1024} KB, {self.slots} slots)")
+
+    def Close(self):
+        if self.memory is None:
+            return
+        self.closed = True
+        self.memory.buf[CLOSED_OFFSET] = 1      # Readers let go and wait for a new bus
+        self.data = None
+        self.memory.close()
+        self.memory.unlink()
+        self.memory = None
+
+    def AddReaderListener(self, listener):
+        self.reader_listeners.append(listener)
+
+    def Publish(self, picture=None, jpeg=None, timestamp=None):
+        # picture: BGR NumPy array (or None), jpeg: the encoded frame (or None). Called on the camera's thread.
+        if not self.readers_present or self.data is None:
+            return
+        started = time.perf_counter()
+        self.sequence += 1
+        slot = self.sequence % self.slots
+        base = HEADER_SIZE + slot * self.slot_size
+        buf = self.memory.buf
+        lock = self.locks[slot] + 1
+        SLOT_LOCK.pack_into(buf, base, lock)                  # Odd: "being written, don't trust this slot"
+
+        height = width = channels = raw_length = jpeg_length = 0
+        raw_start = base + SLOT_HEADER_SIZE
+        if picture is not None:
+            if picture.nbytes <= self.raw_capacity and picture.dtype == np.uint8:
+                height, width = picture.shape[:2]
+                channels = picture.shape[2] if picture.ndim == 3 else 1
+                raw_length = picture.nbytes
+                self.data[raw_start:raw_start + raw_length].reshape(picture.shape)[...] = picture
+            else:
+                self.skipped["raw_too_big"] += 1               # e.g. the stream was made bigger than the bus
+        if jpeg is not None:
+            if len(jpeg) <= self.jpeg_capacity:
+                jpeg_length = len(jpeg)
+                jpeg_start = raw_start + self.raw_capacity
+                self.data[jpeg_start:jpeg_start + jpeg_length] = np.frombuffer(jpeg, dtype=np.uint8)
+            else:
+                self.skipped["jpeg_too_big"] += 1
+
+        SLOT_HEADER.pack_into(buf, base, lock, self.sequence, timestamp or time.time(),
+                              width, height, channels, raw_length, jpeg_length)
+        self.locks[slot] = lock + 1
+        SLOT_LOCK.pack_into(buf, base, lock + 1)              # Even again: the slot is complete
+        struct.pack_into("<Q", buf, NEWEST_OFFSET, self.sequence)
+        PUBLISH_SECONDS.Observe(time.perf_counter() - started)
+        BUS_FRAMES.Inc()
+
+    def Stats(self):
+        return {"readers": self.readers_present, "frames": self.sequence, **self.skipped}
+
+    def _watch_readers(self):
+        while not self.closed:
+            time.sleep(HEARTBEAT_INTERVAL)
+            try:
+                heartbeat = struct.unpack_from("<d", self.memory.buf, HEARTBEAT_OFFSET)[0]
+            except (AttributeError, TypeError):
+                return                            # Closed while we slept
+            present = time.time() - heartbeat < READER_TIMEOUT
+            if present != self.readers_present:
+                self.readers_present = present
+                print(f"🚌 Frame bus readers {'connected' if present else 'gone'}")
+                for listener in self.reader_listeners:
+                    listener(present)
+
+
+# === Client Side (for the add-on programs) ===
+# Only needs NumPy, so an add-on can copy this file next to itself:
+#
+#   import frameBusUtils
+#   bus = frameBusUtils.FrameBusReader()
+#   sequence = 0
+#   while True:
+#       frame = bus.WaitForFrame(sequence)
+#       if frame:
+#           sequence = frame.sequence
+#           look_for_packages(frame.picture)      # BGR NumPy array, like OpenCV's
+class BusFrame:
+    def __init__(self, reader, slot, lock, sequence, timestamp, picture, jpeg):
+        self.reader = reader
+        self.slot = slot
+        self.lock = lock
+        self.sequence = sequence      # Frame number (1, 2, 3, ...; the same numbers for every reader)
+        self.timestamp = timestamp    # time.time() when the server wrote it
+        self.picture = picture        # BGR NumPy array (None if the server only had a JPEG)
+        self.jpeg = jpeg              # JPEG bytes (memoryview without copy) or None
+
+    def Valid(self):
+        # For frames read with copy=False: True if the server has not started overwriting this
+        # frame yet. Check it after using the picture; if False, the result may be from a mixed picture.
+        return self.reader._slot_lock(self.slot) == self.lock
+
+class FrameBusReader:
+    def __init__(self, name=DEFAULT_NAME, poll_interval=0.002):
+        self.name = name
+        self.poll_interval = poll_interval     # How often WaitForFrame looks for a new frame
+        self.memory = None
+        self.data = None
+        self.last_heartbeat = 0.0
+        self.retries = 0                       # Reads that overlapped with the server writing (for monitoring)
+
+    def Close(self):
+        self.data = None
+        if self.memory:
+            try:
+                self.memory.close()
+            except BufferError:
+                pass                           # Frames read with copy=False still point into it; freed with them
+            self.memory = None
+
+    def Latest(self, copy=True):
+        # The newest frame, or None if there is none (or no server running).
+        # copy=False returns views straight into shared memory: no copy at all, but check frame.Valid()
+        # after using them, because the server overwrites a slot after `slots` more frames.
+        if not self._connected():
+            return None
+        self._heartbeat()
+        for _ in range(10):
+            newest = struct.unpack_from("<Q", self.memory.buf, NEWEST_OFFSET)[0]
+            if newest == 0:
+                return None
+            frame = self._read(newest % self.slots, copy)
+            if frame is not None:
+                return frame
+            self.retries += 1
+        return None
+
+    def WaitForFrame(self, last_sequence=0, timeout=1.0, copy=True):
+        # The newest frame if it is newer than last_sequence, waiting up to `timeout` seconds for one
+        deadline = time.monotonic() + timeout
+        while True:
+            frame = self.Latest(copy)
+            if frame is not None and frame.sequence > last_sequence:
+                return frame
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(self.poll_interval)
+
+    def _connected(self):
+        if self.memory is not None and self.memory.buf[CLOSED_OFFSET]:
+            self.Close()                       # The server stopped: wait for the next one
+        if self.memory is None:
+            try:
+                self.memory = _attach(self.name)
+            except FileNotFoundError:
+                return False
+            magic, version, self.slots, self.slot_size, self.raw_capacity, self.jpeg_capacity = \
+                BUS_HEADER.unpack_from(self.memory.buf, 0)
+            if magic != BUS_MAGIC or version != BUS_VERSION:
+                self.Close()
+                raise RuntimeError(f"/dev/shm/{self.name} is not a version {BUS_VERSION} frame bus")
+            self.data = np.ndarray((self.memory.size,), dtype=np.uint8, buffer=self.memory.buf)
+            self._heartbeat(force=True)
+        return True
+
+    def _heartbeat(self, force=False):
+        now = time.time()
+        if force or now - self.last_heartbeat > HEARTBEAT_INTERVAL:
+            self.last_heartbeat = now
+            struct.pack_into("<d", self.memory.buf, HEARTBEAT_OFFSET, now)
+
+    def _slot_lock(self, slot):
+        if self.memory is None:
+            return None
+        return SLOT_LOCK.unpack_from(self.memory.buf, HEADER_SIZE + slot * self.slot_size)[0]
+
+    def _read(self, slot, copy):
+        base = HEADER_SIZE + slot * self.slot_size
+        lock, sequence, timestamp, width, height, channels, raw_length, jpeg_length = \
+            SLOT_HEADER.unpack_from(self.memory.buf, base)
+        if lock % 2:
+            return None                        # Being written right now
+        raw_start = base + SLOT_HEADER_SIZE
+        jpeg_start = raw_start + self.raw_capacity
+        picture = jpeg = None
+        if raw_length:
+            shape = (height, width, channels) if channels > 1 else (height, width)
+            picture = self.data[raw_start:raw_start + raw_length].reshape(shape)
+        if jpeg_length:
+            jpeg = self.memory.buf[jpeg_start:jpeg_start + jpeg_length]
+        if copy:
+            picture = picture.copy() if picture is not None else None
+            jpeg = bytes(jpeg) if jpeg is not None else None
+        if self._slot_lock(slot) != lock:
+            return None                        # The server started writing while we read: try again
+        return BusFrame(self, slot, lock, sequence, timestamp, picture, jpeg)
@@ -0,0 +1,199 @@
+import struct
+import time
+import streamUtils
+
+# === H.264 Live Stream (fragmented MP4) ===
+# MJPEG sends a whole new picture for every frame. H.264 mostly sends what changed, which for a
+# porch where nothing moves is 10-20 times less data. Picamera2's H264Encoder hands us the raw
+# H.264 "NAL units" of each frame; here they are wrapped as fragmented MP4 (fMP4), which
+# browsers can play live through Media Source Extensions (see client_app.js):
+#   - one "init segment" (ftyp + moov) describing the video, sent first to every viewer
+#   - then one small fragment (moof + mdat) per frame
+# A new viewer must start at a keyframe (a full picture). The last few seconds of fragments
+# are kept, so a new viewer starts right away from the most recent keyframe instead of
+# waiting for the next one.
+
+NAL_IDR = 5           # Keyframe slice
+NAL_SPS = 7           # Sequence settings (size, profile, ...)
+NAL_PPS = 8           # Picture settings
+NAL_AUD = 9           # "Access unit delimiter": not needed inside MP4
+
+def SplitNals(data):
+    # Split Annex-B H.264 (NAL units separated by 00 00 01 or 00 00 00 01) into NAL units
+    nals = []
+    start = data.find(b"\x00\x00\x01")
+    while start != -1:
+        start += 3
+        end = data.find(b"\x00\x00\x01", start)
+        nal = data[start:end] if end != -1 else data[start:]
+        if end != -1 and nal.endswith(b"\x00"):
+            nal = nal[:-1]            # The extra zero of a 4-byte start code belongs to the next NAL
+        if nal:
+            nals.append(nal)
+        start = end
+    return nals
+
+def CodecString(sps):
+    # What browsers call this video, e.g. "avc1.42e01f" (profile, constraints, level from the SPS)
+    return "avc1." + sps[1:4].hex()
+
+
+# === MP4 Box Building ===
+def _box(kind, *payloads):
+    payload = b"".join(payloads)
+    return struct.pack(">I4s", 8 + len(payload), kind) + payload
+
+def _full_box(kind, version, flags, *payloads):
+    return _box(kind, struct.pack(">I", (version << 24) | flags), *payloads)
+
+UNITY_MATRIX = struct.pack(">9I", 0x00010000, 0, 0, 0, 0x00010000, 0, 0, 0, 0x40000000)
+
+class Mp4Muxer:
+    def __init__(self, width, height, timescale=90000):
+        self.width = width
+        self.height = height
+        self.timescale = timescale      # Ticks per second for timestamps (90 kHz is the video standard)
+        self.sequence = 0               # Fragment counter (mfhd)
+
+    def InitSegment(self, sps, pps):
+        avcc = bytes([1, sps[1], sps[2], sps[3], 0xFF, 0xE1]) + struct.pack(">H", len(sps)) + sps \
+             + bytes([1]) + struct.pack(">H", len(pps)) + pps
+        if sps[1] in (100, 110, 122, 144):
+            avcc += bytes([0xFD, 0xF8, 0xF8, 0])   # High profiles: 4:2:0, 8-bit, no SPS extensions
+        sample_entry = _box(b"avc1",
+                            bytes(6), struct.pack(">H", 1),                     # data reference index
+                            bytes(16), struct.pack(">HH", self.width, self.height),
+                            struct.pack(">II", 0x00480000, 0x00480000),         # 72 dpi
+                            bytes(4), struct.pack(">H", 1), bytes(32),
+                            struct.pack(">Hh", 0x18, -1),
+                            _box(b"avcC", avcc))
+        empty_table = struct.pack(">I", 0)
+        stbl = _box(b"stbl",
+                    _full_box(b"stsd", 0, 0, struct.pack(">I", 1), sample_entry),
+                    _full_box(b"stts", 0, 0, empty_table),
+                    _full_box(b"stsc", 0, 0, empty_table),
+                    _full_box(b"stsz", 0, 0, struct.pack(">II", 0, 0)),
+                    _full_box(b"stco", 0, 0, empty_table))
+        minf = _box(b"minf",
+                    _full_box(b"vmhd", 0, 1, bytes(8)),
+                    _box(b"dinf", _full_box(b"dref", 0, 0, struct.pack(">I", 1), _full_box(b"url ", 0, 1))),
+                    stbl)
+        mdia = _box(b"mdia",
+                    _full_box(b"mdhd", 0, 0, struct.pack(">IIIIHH", 0, 0, self.timescale, 0, 0x55C4, 0)),
+                    _full_box(b"hdlr", 0, 0, bytes(4), b"vide", bytes(12), b"VideoHandler\x00"),
+                    minf)
+        trak = _box(b"trak",
+                    _full_box(b"tkhd", 0, 3, struct.pack(">IIIII", 0, 0, 1, 0, 0), bytes(8),
+                              struct.pack(">hhhH", 0, 0, 0, 0), UNITY_MATRIX,
+                              struct.pack(">II", self.width << 16, self.height << 16)),
+                    mdia)
+        moov = _box(b"moov",
+                    _full_box(b"mvhd", 0, 0, struct.pack(">IIIIIH", 0, 0, 1000, 0, 0x00010000, 0x0100),
+                              bytes(10), UNITY_MATRIX, bytes(24), struct.pack(">I", 2)),
+                    trak,
+                    _box(b"mvex", _full_box(b"trex", 0, 0, struct.pack(">IIIII", 1, 1, 0, 0, 0))))
+        ftyp = _box(b"ftyp", b"iso5", struct.pack(">I", 512), b"iso5", b"iso6", b"avc1", b"mp41")
+        return ftyp + moov
+
+    def Fragment(self, nals, keyframe, decode_time, duration):
+        # One frame as moof + mdat. MP4 stores each NAL with a 4-byte length instead of a start code.
+        self.sequence += 1
+        sample = b"".join(struct.pack(">I", len(nal)) + nal for nal in nals)
+        sample_flags = 0x02000000 if keyframe else 0x01010000   # "doesn't depend on others" / "depends, not a sync sample"
+
+        def moof(data_offset):
+            return _box(b"moof",
+                        _full_box(b"mfhd", 0, 0, struct.pack(">I", self.sequence)),
+                        _box(b"traf",
+                             _full_box(b"tfhd", 0, 0x020000, struct.pack(">I", 1)),     # default-base-is-moof
+                             _full_box(b"tfdt", 1, 0, struct.pack(">Q", decode_time)),
+                             _full_box(b"trun", 0, 0x000701,
+                                       struct.pack(">IiIII", 1, data_offset, duration, len(sample), sample_flags))))
+        size = len(moof(0))
+        return moof(size + 8) + _box(b"mdat", sample)
+
+
+# === H.264 Stream Output ===
+# Picamera2's H264Encoder writes each encoded frame here (through FileOutput), just like the
+# JPEG encoders write into StreamingOutput. Every viewer gets items of (init segment, fragment, keyframe).
+class H264Stream(streamUtils.FrameBroadcaster):
+    def __init__(self, width=640, height=480, fps=24, ring_size=96):
+        super().__init__(ring_size)     # Room for a few seconds, so new viewers can start at the last keyframe
+        self.muxer = Mp4Muxer(width, height)
+        self.nominal_duration = self.muxer.timescale // fps
+        self.sps = self.pps = None
+        self.codec_settings = None      # The (SPS, PPS) the init segment was made from
+        self.init_segment = None
+        self.codec = None
+        self.decode_time = 0
+        self.last_frame_time = None
+        self.keyframe_sequence = 0      # Sequence number of the newest keyframe
+        self.bytes_sent = 0             # Total fragment bytes produced (for bitrate numbers)
+
+    def write(self, buf):
+        now = time.monotonic()
+        samples, keyframe = [], False
+        for nal in SplitNals(bytes(buf)):
+            kind = nal[0] & 0x1F
+            if kind == NAL_SPS:
+                self.sps = nal
+            elif kind == NAL_PPS:
+                self.pps = nal
+            elif kind != NAL_AUD:
+                samples.append(nal)
+                keyframe = keyframe or kind == NAL_IDR
+        if self.sps and self.pps and self.codec_settings != (self.sps, self.pps):
+            self.codec_settings = (self.sps, self.pps)
+            self.init_segment = self.muxer.InitSegment(self.sps, self.pps)
+            self.codec = CodecString(self.sps)
+        if not samples or self.init_segment is None:
+            return
+        # The camera delivers frames in real time, so the gap since the last frame is its length
+        restarted = self.last_frame_time is None or now - self.last_frame_time > 1.0
+        if restarted:
+            duration = self.nominal_duration    # The encoder was restarted: old frames are stale and can't be continued
+        else:
+            duration = max(1, round((now - self.last_frame_time) * self.muxer.timescale))
+        self.last_frame_time = now
+        fragment = self.muxer.Fragment(samples, keyframe, self.decode_time, duration)
+        self.decode_time += duration
+        self.bytes_sent += len(fragment)
+        sequence = self.Publish((self.init_segment, fragment, keyframe), reset=restarted)
+        if keyframe:
+            self.keyframe_sequence = sequence
+
+    def flush(self):
+        pass
+
+    def StartSequence(self):
+        # Where a new viewer starts: just before the newest keyframe if it is still kept,
+        # otherwise at the newest frame (the viewer then waits for the next keyframe)
+        with self.condition:
+            if self.last_frame_time is None or time.monotonic() - self.last_frame_time > 1.0:
+                return self.sequence    # The encoder is off: what is kept is stale, wait for new frames
+            if self.ring and self.keyframe_sequence >= self.ring[0][0]:
+                return self.keyframe_sequence - 1
+            return self.sequence
+
+
+# === One fMP4 Viewer ===
+# Decides what to send for each item: the init segment when it is new to this viewer,
+# and nothing until a keyframe if the viewer has missed frames (it fell behind).
+class Mp4Viewer:
+    def __init__(self):
+        self.sent_init = None
+        self.last_sequence = None
+        self.synced = False
+
+    def Take(self, sequence, item):
+        init_segment, fragment, keyframe = item
+        if self.last_sequence is not None and sequence != self.last_sequence + 1:
+            self.synced = False          # Skipped frames: the next frames can't be decoded without a keyframe
+        self.last_sequence = sequence
+        if not self.synced and not keyframe:
+            return None
+        self.synced = True
+        if init_segment is not self.sent_init:
+            self.sent_init = init_segment
+            return init_segment + fragment
+        return fragment
@@ -0,0 +1,352 @@
+import bisect
+import collections
+import os
+import sys
+import threading
+import time
+from urllib.parse import urlsplit, parse_qs
+
+# === Metrics (timers, counters and histograms) ===
+# The hot paths (capturing, encoding, sending frames, streaming audio, MQTT messages) record
+# how long each step takes and how often it happens. Nothing is printed: the numbers are kept
+# in memory and read when somebody asks, either
+#   - at /metrics, in the Prometheus text format (for Grafana, or just a browser), or
+#   - as JSON on an MQTT topic every few seconds (--metrics-mqtt on)
+# Recording one value is a lock and a few additions (about a microsecond), so even
+# hundreds of values per second cost far less than 1% of one CPU core.
+#
+# Timing a step looks like this:
+#   started = time.perf_counter()
+#   ...the work...
+#   ENCODE_SECONDS.Observe(time.perf_counter() - started)
+
+# Histogram buckets in seconds: fine steps around a frame time (42 ms at 24 fps)
+TIME_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.02, 0.042, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+class Counter:
+    # A number that only goes up (frames sent, bytes sent, errors...)
+    def __init__(self, registry):
+        self.registry = registry
+        self.lock = threading.Lock()
+        self.value = 0
+
+    def Inc(self, amount=1):
+        if self.registry.enabled:
+            with self.lock:
+                self.value += amount
+
+    def Snapshot(self):
+        return self.value
+
+
+class Histogram:
+    # Counts how many values fell into each bucket, plus their sum, so averages and
+    # percentiles can be worked out later (by Prometheus, or roughly by Snapshot)
+    def __init__(self, registry, bounds):
+        self.registry = registry
+        self.bounds = bounds
+        self.lock = threading.Lock()
+        self.counts = [0] * (len(bounds) + 1)     # The last bucket is "bigger than every bound"
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def Observe(self, value):
+        if self.registry.enabled:
+            index = bisect.bisect_left(self.bounds, value)
+            with self.lock:
+                self.counts[index] += 1
+                self.sum += value
+                self.count += 1
+                if value > self.max:
+                    self.max = value
+
+    def Percentile(self, fraction):
+        # Rough percentile: the upper edge of the bucket it falls in
+        with self.lock:
+            counts, total = list(self.counts), self.count
+        wanted, seen = fraction * total, 0
+        for bound, count in zip(self.bounds, counts):
+            seen += count
+            if seen >= wanted and total:
+                return min(bound, self.max)
+        return self.max
+
+    def Snapshot(self):
+        with self.lock:
+            count, total, largest = self.count, self.sum, self.max
+        return {"count": count,
+                "avg_ms": round(1000 * total / count, 3) if count else 0.0,
+                "p95_ms": round(1000 * self.Percentile(0.95), 3) if count else 0.0,
+                "max_ms": round(1000 * largest, 3)}
+
+
+class MetricFamily:
+    # One named metric, with one Counter/Histogram per combination of label values,
+    # e.g. doorbell_stage_seconds{stage="capture"} and doorbell_stage_seconds{stage="encode"}
+    def __init__(self, registry, kind, name, help, labels=(), buckets=TIME_BUCKETS, read=None):
+        self.registry = registry
+        self.kind = kind                  # "counter", "histogram" or "gauge"
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.read = read                  # Gauges: function returning the value (or {label value: value})
+        self.lock = threading.Lock()
+        self.children = {}
+
+    def Labels(self, *values):
+        # The Counter/Histogram for these label values (made the first time it is asked for).
+        # Hot paths should look this up once and keep it, not on every call.
+        with self.lock:
+            child = self.children.get(values)
+            if child is None:
+                if len(values) != len(self.labels):
+                    raise ValueError(f"{self.name} needs labels {self.labels}")
+                child = Counter(self.registry) if self.kind == "counter" else Histogram(self.registry, self.buckets)
+                self.children[values] = child
+            return child
+
+    # Metrics without labels can be used directly
+    def Inc(self, amount=1):
+        self.Labels().Inc(amount)
+
+    def Observe(self, value):
+        self.Labels().Observe(value)
+
+    def Samples(self):
+        # [(label values, Counter/Histogram or gauge value), ...]
+        if self.kind == "gauge":
+            try:
+                value = self.read()
+            except Exception:
+                return []                 # Whatever it reads isn't there (yet)
+            if isinstance(value, dict):
+                return [((key,) if not isinstance(key, tuple) else key, number) for key, number in value.items()]
+            return [((), value)] if value is not None else []
+        with self.lock:
+            return list(self.children.items())
+
+
+# === Registry ===
+# Every metric of the program, so they can all be read in one go
+class MetricsRegistry:
+    def __init__(self):
+        self.enabled = True               # False = recording does nothing (--metrics off)
+        self.lock = threading.Lock()
+        self.families = {}
+        self.started = time.time()
+
+    def _family(self, kind, name, help, **options):
+        # Asking twice for the same name gives the same metric, so modules can share one (like stage timers)
+        with self.lock:
+            family = self.families.get(name)
+            if family is None:
+                family = self.families[name] = MetricFamily(self, kind, name, help, **options)
+            elif family.kind != kind:
+                raise ValueError(f"metric {name} is already a {family.kind}")
+            return family
+
+    def Counter(self, name, help, labels=()):
+        return self._family("counter", name, help, labels=labels)
+
+    def Histogram(self, name, help, labels=(), buckets=TIME_BUCKETS):
+        return self._family("histogram", name, help, labels=labels, buckets=buckets)
+
+    def Gauge(self, name, help, read, labels=()):
+        # A value that is read only when somebody asks (viewers, fps, queue depth...): costs nothing in between
+        family = self._family("gauge", name, help, labels=labels, read=read)
+        family.read = read                # Re-registering (e.g. a new camera object) replaces the reader
+        return family
+
+    def Render(self):
+        # Prometheus text format, see https://prometheus.io/docs/instrumenting/exposition_formats/
+        lines = []
+        with self.lock:
+            families = list(self.families.values())
+        for family in families:
+            lines.append(f"# HELP {family.name} {family.help}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            for values, sample in family.Samples():
+                labels = _label_text(family.labels, values)
+                if family.kind == "histogram":
+                    with sample.lock:
+                        counts, total, count = list(sample.counts), sample.sum, sample.count
+                    cumulative = 0
+                    for bound, bucket_count in zip(family.buckets + (float("inf"),), counts):
+                        cumulative += bucket_count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{family.name}_bucket{_label_text(family.labels + ('le',), values + (le,))} {cumulative}")
+                    lines.append(f"{family.name}_sum{labels} {total!r}")
+                    lines.append(f"{family.name}_count{labels} {count}")
+                else:
+                    value = sample.Snapshot() if family.kind == "counter" else sample
+                    lines.append(f"{family.name}{labels} {value!r}")
+        return "\n".join(lines) + "\n"
+
+    def Snapshot(self):
+        # The same numbers as a dictionary, for JSON over MQTT
+        result = {}
+        with self.lock:
+            families = list(self.families.values())
+        for family in families:
+            for values, sample in family.Samples():
+                key = family.name + ("{" + ",".join(values) + "}" if values else "")
+                result[key] = sample if family.kind == "gauge" else sample.Snapshot()
+        return result
+
+    def Respond(self, url_path, request_headers):
+        # Web handler for /metrics
+        body = self.Render().encode()
+        return 200, [("Content-Type", "text/plain; version=0.0.4; charset=utf-8"),
+                     ("Cache-Control", "no-cache"),
+                     ("Content-Length", str(len(body)))], body
+
+def _label_text(names, values):
+    if not names:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+# The program's registry. Modules add their metrics to it when they are imported.
+REGISTRY = MetricsRegistry()
+
+# How long each step of the hot paths takes, by step name (capture, encode, send, audio_encode, ...)
+STAGE_SECONDS = REGISTRY.Histogram("doorbell_stage_seconds", "Time spent in each step of the hot paths", labels=("stage",))
+
+REGISTRY.Gauge("doorbell_process_cpu_seconds_total", "CPU time used by the whole program", time.process_time)
+REGISTRY.Gauge("doorbell_threads", "Python threads running", threading.active_count)
+REGISTRY.Gauge("doorbell_uptime_seconds", "Seconds since the program started", lambda: round(time.time() - REGISTRY.started, 1))
+
+
+# === Scheduling Delay Probe ===
+# A thread that asks to sleep for a short, known time and measures how late it wakes up.
+# The extra time is how long a ready Python thread had to wait to run: waiting for the GIL
+# (another thread busy in Python code, e.g. audio encoding) or for a free CPU core.
+# If frames drop while this is high, the cause is contention, not the camera or the network.
+class SchedulingDelayProbe:
+    def __init__(self, registry=REGISTRY, interval=0.05):
+        self.interval = interval
+        self.delay = registry.Histogram("doorbell_scheduling_delay_seconds",
+                                        "How late a sleeping Python thread wakes up (GIL and CPU contention)").Labels()
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name="metrics-probe", daemon=True)
+
+    def Begin(self):
+        self.thread.start()
+
+    def Close(self):
+        self.closed = True
+
+    def _run(self):
+        while not self.closed:
+            started = time.perf_counter()
+            time.sleep(self.interval)
+            self.delay.Observe(max(0.0, time.perf_counter() - started - self.interval))
+
+
+# === Sampling Profiler ===
+# Turned on only when asked for. While on, it looks at what every thread is doing every
+# `interval` seconds and counts the call stacks it sees. Functions that show up in many samples
+# are where the time goes. Nothing in the program has to be changed or restarted for this.
+# The report lists the busiest functions, then every stack in the "folded" format that
+# flame graph tools read (e.g. speedscope.app, or flamegraph.pl).
+class SamplingProfiler:
+    def __init__(self, interval=0.01, max_depth=40):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stop = threading.Event()
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.started = 0.0
+        self.cpu_started = 0.0
+
+    @property
+    def running(self):
+        return self.thread is not None
+
+    def Start(self):
+        # Returns False if it is already running
+        with self.lock:
+            if self.thread:
+                return False
+            self.stacks.clear()
+            self.samples = 0
+            self.started = time.monotonic()
+            self.cpu_started = time.process_time()
+            self.stop.clear()
+            self.thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+            self.thread.start()
+            return True
+
+    def Stop(self, top=25):
+        # Stops sampling and returns the report (text), or None if it wasn't running
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is None:
+            return None
+        self.stop.set()
+        thread.join()
+        return self._report(top)
+
+    def Profile(self, seconds):
+        if not self.Start():
+            return None
+        time.sleep(seconds)
+        return self.Stop()
+
+    def Respond(self, url_path, request_headers):
+        # Web handler for /profile:
+        #   /profile?seconds=10   - profile for 10 seconds, then answer with the report
+        #   /profile?action=start - start in the background;  /profile?action=stop - stop and get the report
+        query = parse_qs(urlsplit(url_path).query)
+        action = query.get("action", [""])[0]
+        if action == "start":
+            started = self.Start()
+            return _text(202 if started else 409, "profiling started\n" if started else "already profiling\n")
+        if action == "stop":
+            report = self.Stop()
+            return _text(200, report) if report else _text(409, "not profiling\n")
+        seconds = query.get("seconds", ["10"])[0]
+        seconds = min(float(seconds), 120.0) if seconds.replace(".", "", 1).isdigit() else 10.0
+        report = self.Profile(seconds)
+        return _text(200, report) if report else _text(409, "already profiling\n")
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self.stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def _report(self, top):
+        seconds = time.monotonic() - self.started
+        cpu = time.process_time() - self.cpu_started
+        # "Self" time: how often each function was the one actually running (the end of the stack).
+        # Threads waiting (sleep, select, locks, reading the microphone) show up under their waiting function.
+        own = collections.Counter()
+        for stack, count in self.stacks.items():
+            own[stack.rsplit(";", 1)[-1]] += count
+        lines = [f"# {self.samples} samples over {seconds:.1f} s every {1000 * self.interval:.0f} ms, "
+                 f"program CPU {100 * cpu / max(seconds, 1e-9):.1f}% of one core",
+                 "# busiest functions (samples, function):"]
+        lines += [f"#   {count:6d}  {name}" for name, count in own.most_common(top)]
+        lines.append("# folded stacks (thread;outer;...;inner samples):")
+        lines += [f"{stack} {count}" for stack, count in self.stacks.most_common()]
+        return "\n".join(lines) + "\n"
+
+def _text(status, text):
+    body = text.encode()
+    return status, [("Content-Type", "text/plain; charset=utf-8"), ("Content-Length", str(len(body)))], body
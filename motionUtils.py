@@ -0,0 +1,54 @@
+import numpy as np
+
+# === Software Motion Detector ===
+# Compares each small grayscale frame with a slowly-updating "background" picture.
+# Pixels that changed a lot count as motion. Works on tiny frames (like 160x120) using
+# NumPy, so each frame takes only a few milliseconds even on the Pi's CPU.
+#
+# Process() returns:
+#   score   - fraction of the picture that changed (0.0 = nothing, 1.0 = everything)
+#   regions - list of (x, y, width, height) boxes (in frame pixels) of grid cells with motion
+class MotionDetector:
+    def __init__(self, threshold=0.02, pixel_threshold=25, learning_rate=0.05,
+                 grid=(8, 6), cell_threshold=0.1, warmup_frames=3):
+        self.threshold = threshold              # Score needed to call it "real" motion
+        self.pixel_threshold = pixel_threshold  # How much a pixel's brightness must change (0-255) to count
+        self.learning_rate = learning_rate      # How fast the background adapts to slow changes (clouds, sun)
+        self.grid = grid                        # The frame is split into this many (columns, rows) cells for regions
+        self.cell_threshold = cell_threshold    # Fraction of a cell that must change for it to be a motion region
+        self.warmup_frames = warmup_frames      # Frames ignored right after a reset while the camera settles
+        self.Reset()
+
+    def Reset(self):
+        self.background = None
+        self.frames_seen = 0
+
+    def Process(self, gray):
+        frame = gray.astype(np.float32)
+        self.frames_seen += 1
+        if self.background is None or self.background.shape != frame.shape or self.frames_seen <= self.warmup_frames:
+            self.background = frame          # (Re)start the background from this frame
+            return 0.0, []
+
+        # Which pixels are very different from the background?
+        difference = np.abs(frame - self.background)
+        moving = difference > self.pixel_threshold
+        score = float(moving.mean())
+
+        # Let the background slowly follow the scene (running average), in place to avoid extra copies
+        self.background *= 1.0 - self.learning_rate
+        self.background += self.learning_rate * frame
+
+        return score, self._regions(moving) if score > 0 else []
+
+    def IsMotion(self, score):
+        return score >= self.threshold
+
+    def _regions(self, moving):
+        # Split the motion mask into grid cells and find the cells with enough changed pixels
+        columns, rows = self.grid
+        height, width = moving.shape
+        cell_h, cell_w = height // rows, width // columns
+        cells = moving[:cell_h * rows, :cell_w * columns].reshape(rows, cell_h, columns, cell_w).mean(axis=(1, 3))
+        return [(int(c * cell_w), int(r * cell_h), int(cell_w), int(cell_h))
+                for r, c in zip(*np.nonzero(cells >= self.cell_threshold))]
@@ -0,0 +1,181 @@
+import math
+import socket
+import threading
+import time
+from urllib.parse import urlsplit, parse_qs
+import metricsUtils
+
+# === Stream Quality Tiers ===
+# Not every viewer has the same connection: the hallway tablet on Wi-Fi can take the full
+# camera picture, a phone on cellular can't. Each viewer of /stream.mjpg watches one "tier":
+#   scale   - picture size compared with the camera's (1/2 = half the width and height)
+#   quality - JPEG quality for the re-encoded picture (None = send the camera's JPEG untouched)
+#   every   - only send every Nth frame (2 = half the frame rate)
+# Ask for one with /stream.mjpg?quality=medium, or leave it on "auto" to pick one from how
+# fast the connection takes the frames.
+QUALITY_TIERS = {
+    "full":    {"scale": 1, "quality": None, "every": 1},
+    "medium":  {"scale": 2, "quality": 70, "every": 1},
+    "low":     {"scale": 2, "quality": 50, "every": 2},
+    "minimal": {"scale": 4, "quality": 40, "every": 3},
+}
+TIER_ORDER = ["full", "medium", "low", "minimal"]   # Best to worst
+OVERLAY_QUALITY = 85                                # JPEG quality of "full" frames with boxes drawn on them
+
+TIER_ENCODE_SECONDS = metricsUtils.STAGE_SECONDS.Labels("tier_encode")
+
+# OpenCV and NumPy take a while to load and "full" viewers never need them, so they are
+# loaded the first time a smaller tier is asked for (the web server can start without them)
+cv2 = np = None
+REDUCED_DECODE = None
+
+def _load_opencv():
+    global cv2, np, REDUCED_DECODE
+    import cv2, numpy as np
+    # OpenCV can shrink a JPEG while decoding it, which is much faster than decoding + resizing
+    REDUCED_DECODE = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2,
+                      4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+# === Tier Encoder ===
+# Turns the camera's JPEG into the smaller version for a tier. Each tier keeps only its most
+# recent result, so however many viewers watch a tier, each frame is re-encoded at most once.
+# With an overlay (the detector's boxes, see detectUtils.py) viewers who want it get the boxes
+# drawn in: "<tier>+overlay" is re-encoded once per frame too, and only while there are boxes.
+class TierEncoder:
+    def __init__(self):
+        names = list(QUALITY_TIERS) + [name + "+overlay" for name in QUALITY_TIERS]
+        self.locks = {name: threading.Lock() for name in names}
+        self.cache = {name: (0, None) for name in names}            # tier -> (sequence, jpeg)
+        self.encodes = {name: 0 for name in names}                  # Numbers for monitoring
+        self.seconds = {name: 0.0 for name in names}
+        self.overlay = None
+        self.overlay_default = False
+
+    def SetOverlay(self, overlay, default=False):
+        # overlay.Current() gives the boxes to draw right now ([] = none); overlay.Draw(picture, boxes) draws them.
+        # default: whether viewers that don't say (no ?overlay=) get the boxes
+        self.overlay = overlay
+        self.overlay_default = default
+
+    def WantsOverlay(self, requested=None):
+        # requested: True / False from ?overlay=on|off, or None for the default
+        if self.overlay is None:
+            return False
+        return self.overlay_default if requested is None else requested
+
+    def Encode(self, tier, sequence, frame, overlay=None):
+        settings = QUALITY_TIERS[tier]
+        boxes = self.overlay.Current() if self.WantsOverlay(overlay) else []
+        if settings["quality"] is None and not boxes:
+            return frame                       # "full": the camera's own JPEG
+        name = tier + "+overlay" if boxes else tier
+        # Viewers of the same tier wait here while the first one encodes the frame, then share it
+        with self.locks[name]:
+            cached_sequence, jpeg = self.cache[name]
+            if cached_sequence == sequence:
+                return jpeg
+            if REDUCED_DECODE is None:
+                _load_opencv()
+            started = time.perf_counter()
+            picture = cv2.imdecode(np.frombuffer(frame, dtype=np.uint8), REDUCED_DECODE[settings["scale"]])
+            if picture is None:
+                return frame                   # Not a JPEG we can read: send it as it is
+            if boxes:
+                self.overlay.Draw(picture, boxes)
+            _, encoded = cv2.imencode('.jpg', picture, [cv2.IMWRITE_JPEG_QUALITY, settings["quality"] or OVERLAY_QUALITY])
+            jpeg = encoded.tobytes()
+            self.cache[name] = (sequence, jpeg)
+            elapsed = time.perf_counter() - started
+            self.encodes[name] += 1
+            self.seconds[name] += elapsed
+            TIER_ENCODE_SECONDS.Observe(elapsed)
+            return jpeg
+
+    def Stats(self):
+        return {tier: {"encodes": self.encodes[tier],
+                       "avg_ms": round(1000 * self.seconds[tier] / self.encodes[tier], 2) if self.encodes[tier] else 0.0}
+                for tier in self.encodes if QUALITY_TIERS.get(tier, {}).get("quality") is not None or self.encodes[tier]}
+
+
+# === Viewer Quality ===
+# Remembers which tier one viewer is on. In "auto" mode it watches how long sending each
+# frame takes compared with the time between frames ("busy"):
+#   - busy most of the time -> the connection can't keep up: step down a tier
+#   - hardly busy for a while -> there is room: try one tier up
+# If a step up is quickly followed by a step down, the next try waits twice as long,
+# so a connection right on the edge doesn't flip back and forth.
+class ViewerQuality:
+    def __init__(self, requested="auto", start="full", overlay=None,
+                 busy_high=0.8, busy_low=0.3, window=2.0, down_hold=1.0, up_hold=5.0, max_up_hold=60.0):
+        self.auto = requested not in QUALITY_TIERS
+        self.tier = start if self.auto else requested
+        self.overlay = overlay            # Detector boxes: True / False, or None for the server's default
+        self.busy_high = busy_high        # Step down when busier than this (fraction of the time)
+        self.busy_low = busy_low          # Step up when less busy than this
+        self.window = window              # Roughly how many seconds of history "busy" looks at
+        self.down_hold = down_hold        # Seconds to wait after a change before stepping down again
+        self.base_up_hold = up_hold       # Seconds of spare room needed before stepping up
+        self.up_hold = up_hold
+        self.max_up_hold = max_up_hold
+        self.busy = 0.0                   # Fraction of the recent time spent sending
+        self.send_seconds = 0.0           # Recent time spent sending (older frames count less and less)
+        self.wall_seconds = 0.0           # Recent time in total
+        self.last_finished = None         # When the previous frame finished sending
+        self.last_change = time.monotonic()
+        self.last_change_was_up = False
+
+    @classmethod
+    def FromPath(cls, path):
+        # /stream.mjpg?quality=low -> a viewer fixed on "low"; anything else is "auto"
+        # ...&overlay=on / off -> with or without the detector's boxes
+        query = parse_qs(urlsplit(path).query)
+        requested = query.get("quality", ["auto"])[0].lower()
+        overlay = {"on": True, "1": True, "off": False, "0": False}.get(query.get("overlay", [""])[0].lower())
+        return cls(requested, overlay=overlay)
+
+    def Wants(self, sequence):
+        # Lower tiers skip frames: only every Nth sequence number is sent
+        return sequence % QUALITY_TIERS[self.tier]["every"] == 0
+
+    def Sent(self, started, finished):
+        # Call after each frame with the time it started and finished sending (time.monotonic())
+        previous, self.last_finished = self.last_finished, finished
+        if not self.auto or previous is None:
+            return
+        # Sends are often uneven (a few instant ones while the buffer fills, then a long wait),
+        # so add up the time rather than averaging per-frame fractions, and let old time fade
+        # out by age (not by frame count)
+        elapsed = finished - previous
+        fade = math.exp(-elapsed / self.window)
+        self.send_seconds = fade * self.send_seconds + (finished - started)
+        self.wall_seconds = fade * self.wall_seconds + elapsed
+        self.busy = self.send_seconds / max(self.wall_seconds, 1e-6)
+        since_change = finished - self.last_change
+        level = TIER_ORDER.index(self.tier)
+        if self.busy > self.busy_high and since_change >= self.down_hold and level + 1 < len(TIER_ORDER):
+            if self.last_change_was_up and since_change < 2 * self.up_hold:
+                self.up_hold = min(self.up_hold * 2, self.max_up_hold)   # That step up was too much
+            self._change(TIER_ORDER[level + 1], finished, up=False)
+        elif self.busy < self.busy_low and since_change >= self.up_hold and level > 0:
+            if not self.last_change_was_up and since_change >= 2 * self.max_up_hold:
+                self.up_hold = self.base_up_hold                         # Stable for a long time: be brave again
+            self._change(TIER_ORDER[level - 1], finished, up=True)
+
+    def _change(self, tier, now, up):
+        self.tier = tier
+        self.last_change = now
+        self.last_change_was_up = up
+        # Start the new tier from "unsure"
+        self.wall_seconds = self.wall_seconds or 1e-6
+        self.send_seconds = self.wall_seconds * (self.busy_high + self.busy_low) / 2
+
+
+# A smaller socket send buffer makes a slow connection push back after a few frames instead
+# of after several megabytes, so ViewerQuality notices quickly (and the picture stays fresh)
+STREAM_SEND_BUFFER = 128 * 1024
+
+def LimitSendBuffer(sock):
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, STREAM_SEND_BUFFER)
+    except OSError:
+        pass
@@ -2,25 +2,30 @@
 
 # === These Python Libraries are needed to run the server ===
 # Installed via setup_orion_doorbell.sh
-import io, base64, sys, requests, threading, logging, socketserver    # Basic tools for input/output, networking, and logging
+import sys, threading, logging, socketserver, json    # Basic tools for networking, logging, and JSON messages
 from http import server                         # Allows this program to act like a small server
-import time, os, ssl, argparse, subprocess      # Tools for working with time, files, security, command-line arguments, and running other programs 
-from gpiozero import Button, MotionSensor       # For using buttons and motion sensors connected to the Raspberry Pi
-from picamera2 import Picamera2                 # Used to control Raspberry Pi camera
-import paho.mqtt.client as paho                 # For sending messages over the internet or local network (used for communication between devices)
-from threading import Condition                 # Used to safely share data between parts of the program that run at the same time
-import pygame, cv2, numpy as np                 # For playing sounds (pygame), working with images (cv2), and doing math with arrays (numpy)
+import time, os, ssl, argparse                  # Tools for working with time, files, security and command-line arguments
+import types                                    # For grouping the device classes of a backend (see load_backend)
 from dotenv import load_dotenv                  # Helps load settings from a hidden file (.env) like secret keys
-import re                                       # For reading and matching patterns in text
-import audioUtils                               # File made for playing and recording sound
+import streamUtils                              # File made for sharing camera frames with every web viewer
+import dispatchUtils                            # File made for handling MQTT commands on background workers
+import webUtils                                 # File made for serving the web app's files quickly
+import asyncServerUtils                         # File made for serving many viewers from one thread (--server asyncio)
+import qualityUtils                             # File made for giving slow connections a smaller, lighter stream
+import h264Utils                                # File made for the low-bandwidth H.264 live stream (/stream.mp4)
+import metricsUtils                             # File made for timing the busy parts of the program (/metrics, /profile)
+import startupUtils                             # File made for starting the slow parts in the background (/ready)
+
+# The heavy parts are imported when they are set up, on their own threads (see "Fast Start" in main):
+# OpenCV (cv2) and NumPy, and our files for sound (audioUtils), the camera (cameraUtils, snapshotUtils,
+# motionUtils, clipUtils, frameBusUtils), the AI (describeUtils), the speaker (audioDeviceUtils), the
+# event history (eventUtils) and the local detector (detectUtils)
+cv2 = None                                      # OpenCV, for the "cv2" encoder; imported with the camera
 
 # === Emojis for fun and alerts ===
 # These can be used to show messages like "✅ Success", "❌ Error", or "📡 Camera Streaming"
 #⚠️📸🛑❌🚫🕒✅👀🤖📩🎤🔈📡🔌🌐
 
-# === Prevent unnecessary messages from pygame ===
-os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
-
 # === Load secret settings from a .env file ===
 # This file is hidden but contains important information, like API keys
 load_dotenv()
@@ -35,76 +40,106 @@ manual_override = False                    # Used in motion detection mode to st
 manual_override_reset_time = 60            # If override is on, how long should we wait (in seconds) before turning it off?
 manual_override_reset_thread = None        # This will hold a background timer to reset the override
 output = None                              # Will later hold the video output that gets sent to the web app
-selected_output_device = None              # Saves the name of the speaker being used
+clip_recorder = None                       # Saves event clips when --preroll is turned on
+h264_stream = None                         # The H.264 (fragmented MP4) live stream, when --h264 is on
+describer = None                           # Describes camera pictures with AI, when --ai is turned on
+frame_bus = None                           # Shares frames with add-on programs through shared memory, when --frame-bus is on
+events = None                              # The event history (bell, motion, AI) behind /events, when --events is on
+detector = None                            # Looks for people and packages on the Pi itself, when --detect is on
+startup = None                             # Keeps track of which parts of the server are ready (see "Fast Start" in main)
+backend = types.SimpleNamespace()          # The device classes, filled in part by part (see load_backend)
+camera = camera_worker = snapshots = None  # Set up in the background when the server starts...
+chime = talkback = audio_devices = audio_streamer = None
+button = pir = delay_probe = None          # ...so these stay None until their part is ready
 last_bell_time = 0                         # When was the last time the doorbell was pressed?
 BELL_COOLDOWN_SECONDS = 5                  # How many seconds must pass before the bell can ring again
 
+# === MQTT Topics (Communication Channels) ===
+# These are like labeled mailboxes for different features
+REMOTE_APP_CAMERA_ONOFF_CONTROL_TOPIC = "ring/remote_app_control/camera"
+REMOTE_DEV_CAMERA_ONOFF_CONTROL_TOPIC = "ring/local_dev_control/camera"
+REMOTE_APP_MICROPHONE_CONTROL_TOPIC = "ring/remote_app_control/microphone"
+REMOTE_APP_AUDIO_DATA_TOPIC = "ring/remote_app_audio_data"
+GPT_REQUEST_TOPIC = "ring/gptrequest"
+GPT_RESPONSE_TOPIC = "ring/gptresponse"
+VOLUME_CONTROL_TOPIC = "ring/remote_app_control/volume"
+COMMAND_STATS_TOPIC = "ring/stats/commands"
+DESCRIBE_STATS_TOPIC = "ring/stats/describe"
+CHIME_STATS_TOPIC = "ring/stats/chime"
+AUDIO_STATS_TOPIC = "ring/stats/audio"
+CAMERA_STATS_TOPIC = "ring/stats/camera"         # Standby policy and trigger -> first picture times
+EVENTS_STATS_TOPIC = "ring/stats/events"
+EVENTS_TOPIC = "ring/events"                      # Every saved event (bell, motion, AI) for the app's timeline
+DETECT_STATS_TOPIC = "ring/stats/detect"
+DETECTIONS_TOPIC = "ring/detections"              # What the local detector sees (labels, boxes, confidence)
+VOICE_EVENTS_TOPIC = "ring/audio/vad"             # "speech started / stopped" at the door microphone
+METRICS_STATS_TOPIC = "ring/stats/metrics"
+READY_TOPIC = "ring/status/ready"                 # Which parts of the server are ready (retained)
+PROFILE_CONTROL_TOPIC = "ring/debug/profile"      # "start" / "stop"
+PROFILE_REPORT_TOPIC = "ring/debug/profile/report"
+
+# === Numbers for /metrics ===
+FRAMES_PUBLISHED = metricsUtils.REGISTRY.Counter("doorbell_frames_published_total", "JPEG frames made by the camera").Labels()
+FRAME_BYTES = metricsUtils.REGISTRY.Counter("doorbell_frame_bytes_total", "Bytes of JPEG frames made by the camera").Labels()
+MQTT_MESSAGES = metricsUtils.REGISTRY.Counter("doorbell_mqtt_messages_total", "MQTT messages received", labels=("topic",))
+MQTT_DISPATCH_SECONDS = metricsUtils.STAGE_SECONDS.Labels("mqtt_dispatch")
+
 # === Class for MJPEG Streaming ===
-class StreamingOutput:
-    def __init__(self):
-        self.frame = None                 # This will hold the most recent camera image
-        self.condition = Condition()      # Threading condition to wait/notify frame updates. 
-                                          # Used to safely let other parts of the program know when a new frame is ready
-
-    def write(self, frame):
-        _, jpeg = cv2.imencode('.jpg', frame)     # Encode OpenCV frame to JPEG. Convert image to JPEG format (web-friendly)
-        with self.condition:                      # Lock access so this section is thread-safe
-            self.frame = jpeg.tobytes()           # Save the JPEG image as bytes
-            self.condition.notify_all()           # Wake up any waiting threads so they can send it to the browser
+# Every camera frame is turned into a JPEG only once, then shared with all viewers
+# through the FrameBroadcaster (see streamUtils.py)
+class StreamingOutput(streamUtils.FrameBroadcaster):
+    # Picamera2's encoders call write() with a finished JPEG (through FileOutput)
+    def write(self, buf):
+        self.Publish(bytes(buf))                  # Save the JPEG bytes and wake up every viewer waiting for a new frame
+        FRAMES_PUBLISHED.Inc()
+        FRAME_BYTES.Inc(len(buf))
+        if frame_bus:
+            frame_bus.Publish(jpeg=buf)           # Picamera2 encoded it, so only the JPEG can be shared
+
+    def flush(self):
+        pass                                      # FileOutput flushes after every frame; nothing is buffered here
+
+    # The "cv2" fallback encodes the camera picture here, on our own capture thread
+    def EncodeFrame(self, frame, quality=85):
+        _, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])     # Encode OpenCV frame to JPEG. Convert image to JPEG format (web-friendly)
+        self.Publish(jpeg.tobytes())              # Share the JPEG with every viewer
+        FRAMES_PUBLISHED.Inc()
+        FRAME_BYTES.Inc(len(jpeg))
+        if frame_bus:
+            frame_bus.Publish(frame, jpeg)        # ...and the picture itself with add-on programs
 
 # === HTTP Request Handler for Web Interface ===
 class StreamingHandler(server.BaseHTTPRequestHandler):
-    # This helper function reads the content of a file (like an HTML, CSS, or JS file)
-    # It will be used to send those files to the user's 
-    def ReadClientApp(self, appfile, binary=False):
-        # Open the file in binary ('rb') if it's an image or other binary file,
-        # otherwise open it in normal text mode ('r') for things like HTML and JS
-        with open(appfile, 'rb' if binary else 'r') as f:
-            return f.read() # Read and return the contents of the file
-
     def do_GET(self):
         try:
-            # === If the user types just the root address (like http://192.168.1.5/), redirect them to index.html ===
-            if self.path == '/':
-                self.send_response(301)                        # 301 means "redirect"
-                self.send_header('Location', '/index.html')    # Tell the browser to go to /index.html
-                self.end_headers()
-
-            # === If the user is requesting the main webpage ===
-            elif self.path == '/index.html':
-                # Read the HTML file for the doorbell interface
-                content = self.ReadClientApp("./wwwroot/html_pages/client_ring_app.html").encode("utf-8")
-                self._send_file_response(content, 'text/html') # Send it to the browser as a webpage
-
-            # === If the browser asks for the JavaScript file ===
-            elif self.path == '/client_app.js':
-                content = self.ReadClientApp('./wwwroot/js/client_app.js').encode("utf-8")
-                self._send_file_response(content, 'application/javascript') # Send JS code to browser
-
-            # === If the browser asks for the CSS (styling) file ===
-            elif self.path == '/client_app_styles.css':
-                content = self.ReadClientApp('./wwwroot/css/client_app_styles.css').encode("utf-8")
-                self._send_file_response(content, 'text/css') # Send CSS to style the page
-
             # === If the browser is trying to start the camera video stream ===
-            elif self.path.startswith('/stream.mjpg'):
+            if self.path.startswith('/stream.mjpg'):
                 self._handle_stream()     # Start sending camera images one after another
 
-            # === If the path doesn’t match any of the above, show a 404 error ===
+            # === The H.264 video stream (much less data than MJPEG; played by the browser's Media Source Extensions)
+            elif self.path.startswith('/stream.mp4') and h264_stream:
+                self._handle_mp4_stream()
+
+            # === Everything else: the root address redirect, and any file under wwwroot/
+            # === (the web page, JavaScript, CSS, images, favicon...) — see the routes in section 9
             else:
-                self.send_error(404) # Page not found
+                response = routes.Respond(self.path, self.headers)
+                if response:
+                    self._send_file_response(*response)   # Send it (files come straight from memory)
+                else:
+                    self.send_error(404)  # Page not found
                 
         except Exception as e:
             # If something goes wrong, log the error for debugging
             logging.error(f"Handler error: {e}")
 
-    def _send_file_response(self, content, content_type):
-        self.send_response(200)                            # Send a "200 OK" response to let the browser know the request was successful
-        self.send_header('Content-type', content_type)     # Tell the browser what type of file is being sent (HTML, JavaScript, CSS, etc.)
-        self.send_header('Content-Length', len(content))   # Tell the browser how big the file is (in bytes)
-        self.send_header('Cache-Control', 'no-cache')      # Tell the browser not to store a cached copy — always ask for a fresh one
+    def _send_file_response(self, status, headers, content):
+        self.send_response(status)                         # "200 OK", or "304 Not Modified" if the browser already has this file
+        for name, value in headers:                        # Type of file, size, compression, caching rules and ETag
+            self.send_header(name, value)
         self.end_headers()                                 # Finish sending the headers
-        self.wfile.write(content)                          # Now actually send the content of the file to the browser
+        if content:
+            self.wfile.write(content)                      # Now actually send the content of the file to the browser
 
     def _handle_stream(self):
         print("📡 MJPEG stream requested")     # Show in the terminal that a video stream was requested, for debugging
@@ -112,13 +147,19 @@ class StreamingHandler(server.BaseHTTPRequestHandler):
         self.send_header('Cache-Control', 'no-cache, private')   # Tell the browser not to cache (save) this stream
         self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=FRAME')  # Tell the browser we’re sending multiple JPEG images in a row ("multipart stream")
         self.end_headers()      # Finish sending headers
+        sequence = max(output.Latest()[0] - 1, 0)   # Start with the newest frame already captured
+        quality = qualityUtils.ViewerQuality.FromPath(self.path)   # ?quality=full|medium|low|minimal|auto
+        qualityUtils.LimitSendBuffer(self.connection)
+        output.AddViewer()                          # Let the capture loop know somebody is watching
         try:
             while True:
-                # Wait until a new frame (image) is available
-                with output.condition:
-                    output.condition.wait(timeout=1) # Wait up to 1 second
-                    frame = output.frame             # Get the latest camera frame
-                if frame:
+                # Wait for a frame this viewer hasn't sent yet (up to 1 second)
+                sequence, frame = output.WaitForFrame(sequence, timeout=1)
+                if frame and quality.Wants(sequence):   # Lower tiers skip some frames
+                    started = time.monotonic()
+                    frame = tier_encoder.Encode(quality.tier, sequence, frame, quality.overlay)   # Smaller picture for slow connections (shared by every viewer on that tier), with boxes if asked
+                    sending = time.perf_counter()
+
                     # Start a new image section
                     self.wfile.write(b'--FRAME\r\n')
 
@@ -131,9 +172,38 @@ class StreamingHandler(server.BaseHTTPRequestHandler):
                     self.wfile.write(frame)
                     self.wfile.write(b'\r\n')    # End the image section
                     self.wfile.flush()           # Make sure it gets sent immediately
+                    streamUtils.SEND_SECONDS.Observe(time.perf_counter() - sending)
+                    streamUtils.MJPEG_FRAMES_SENT.Inc()
+                    streamUtils.MJPEG_BYTES_SENT.Inc(len(frame))
+                    quality.Sent(started, time.monotonic())   # In "auto" mode, pick the tier from how long that took
         except (BrokenPipeError, ConnectionResetError):
              # If the user closes the browser or the connection breaks, just log a warning
             logging.warning("⚠️ MJPEG stream broken")
+        finally:
+            output.RemoveViewer()                   # This viewer is gone
+
+    def _handle_mp4_stream(self):
+        print("📡 H.264 stream requested")
+        self.send_response(200)
+        self.send_header('Cache-Control', 'no-cache, private')
+        self.send_header('Content-Type', 'video/mp4')
+        self.end_headers()      # No length: the video keeps coming until the browser hangs up
+        qualityUtils.LimitSendBuffer(self.connection)
+        viewer = h264Utils.Mp4Viewer()              # Starts at a keyframe and sends the init segment first
+        sequence = h264_stream.StartSequence()      # The newest keyframe already captured, for a quick start
+        h264_stream.AddViewer()                     # Lets the camera worker start the H.264 encoder
+        try:
+            while True:
+                sequence, item = h264_stream.WaitForFrame(sequence, timeout=1)
+                data = viewer.Take(sequence, item) if item else None
+                if data:
+                    self.wfile.write(data)
+                    streamUtils.MP4_FRAMES_SENT.Inc()
+                    streamUtils.MP4_BYTES_SENT.Inc(len(data))
+        except (BrokenPipeError, ConnectionResetError):
+            logging.warning("⚠️ H.264 stream broken")
+        finally:
+            h264_stream.RemoveViewer()
 
 # === Threaded HTTP Server ===
 class StreamingServer(socketserver.ThreadingMixIn, server.HTTPServer):
@@ -141,53 +211,83 @@ class StreamingServer(socketserver.ThreadingMixIn, server.HTTPServer):
     allow_reuse_address = True # Allow the server to quickly restart without waiting for the port to be freed
     daemon_threads = True      # Run each connection in the background (so the server doesn’t get stuck)
 
-# === Camera Frame Capture Loop ===
-def camera_capture_loop():
-    global camera_on # This tells the function whether the camera should be running
-    while True:      # Keep running this loop forever
-        if not camera_on:
-            time.sleep(0.1)  # If the camera is off, wait a short time and check again
-            continue         # Skip the rest and restart the loop
-        try:
-            # Take a picture (called a frame) from the camera
-            frame = camera.capture_array()    # This gives the image as a NumPy array (used by OpenCV)
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) # Convert the color format from BGR (used by OpenCV) to RGB (used by most other systems)
-            output.write(rgb_frame)           # Save the image so it can be shown on the website
-            time.sleep(1 / 24)                # Wait a tiny bit to target about 24 frames per second (like a movie)
-        except Exception as e:
-            print("⚠️ Frame capture error:", e) # If something goes wrong (e.g., camera error), show a warning
+# === Device Backends ===
+# "pi"   - the real hardware: Picamera2 camera, gpiozero button and motion sensor, PyAudio sound card, Mosquitto
+# "fake" - stand-ins from fakeDevices.py, so the whole server runs (and can be benchmarked) on any computer:
+#          a made-up or recorded camera picture (--fake-video), a WAV file as the microphone (--fake-audio),
+#          buttons that are pressed from code, and an MQTT broker inside this program
+# Each part ("mqtt", "camera", "gpio", "audio") is loaded when it is set up, so MQTT doesn't wait
+# for the camera library; the classes are added to the shared `backend`.
+def load_backend(name, part, fake_video=None, fake_audio=None):
+    if name == "fake":
+        import fakeDevices
+        if part == "mqtt":
+            classes = dict(MqttClient=fakeDevices.FakeMqttClient)
+        elif part == "camera":
+            classes = dict(Picamera2=lambda: fakeDevices.FakePicamera2(source=fake_video),
+                           JpegEncoder=fakeDevices.FakeJpegEncoder, MJPEGEncoder=fakeDevices.FakeMJPEGEncoder,
+                           H264Encoder=fakeDevices.FakeH264Encoder, FileOutput=fakeDevices.FakeFileOutput)
+        elif part == "gpio":
+            classes = dict(Button=fakeDevices.FakeButton, MotionSensor=fakeDevices.FakeMotionSensor)
+        else:
+            import audioUtils
+            audioUtils.UseAudioBackend(fakeDevices.FakeAudioBackend(fake_audio))
+            classes = {}
+    elif part == "mqtt":
+        import paho.mqtt.client as paho                 # For sending messages over the internet or local network (used for communication between devices)
+        classes = dict(MqttClient=paho.Client)
+    elif part == "camera":
+        from picamera2 import Picamera2                 # Used to control Raspberry Pi camera
+        from picamera2.encoders import JpegEncoder, MJPEGEncoder, H264Encoder   # Picamera2's own JPEG and H.264 encoders (run outside the Python GIL)
+        from picamera2.outputs import FileOutput        # Sends encoded JPEGs straight into our StreamingOutput
+        classes = dict(Picamera2=Picamera2, JpegEncoder=JpegEncoder, MJPEGEncoder=MJPEGEncoder,
+                       H264Encoder=H264Encoder, FileOutput=FileOutput)
+    elif part == "gpio":
+        from gpiozero import Button, MotionSensor       # For using buttons and motion sensors connected to the Raspberry Pi
+        classes = dict(Button=Button, MotionSensor=MotionSensor)
+    else:
+        classes = {}                                    # audioUtils opens the sound card with PyAudio itself
+    vars(backend).update(classes)
+
+# === Picamera2 Encoder Setup ===
+# Used by the camera worker when --encoder is "jpeg" or "mjpeg"
+def make_picamera2_encoder(settings):
+    encoder = backend.MJPEGEncoder() if settings["encoder"] == "mjpeg" else backend.JpegEncoder(q=settings["quality"])
+    return encoder, backend.FileOutput(output)    # Finished JPEGs go straight into our StreamingOutput
+
+# Used by the camera worker while somebody watches /stream.mp4 (--h264 on).
+# repeat=True puts the SPS/PPS settings in front of every keyframe; iperiod is frames between keyframes.
+def make_h264_encoder(settings):
+    encoder = backend.H264Encoder(bitrate=args.h264_bitrate, repeat=True,
+                                  iperiod=max(1, round(args.h264_keyframe_seconds * settings["fps"])))
+    return encoder, backend.FileOutput(h264_stream)
 
 # === Turn Camera On or Off ===
-def cameraControl(mode):
+# The camera worker thread does the real work; we just send it a command
+def cameraControl(mode, trigger_time=None):
     global camera_on        # This keeps track of whether the camera is currently running
+    # Right after power-up the camera may still be starting: wait for it (a few seconds at most)
+    if not startup.WaitFor("camera", timeout=10):
+        print("⚠️ Camera is not ready")
+        return
 
     # === Turn the camera ON ===
     if mode == "on" and not camera_on:
-        camera.configure(camera.create_video_configuration(main={"size": (640, 480)})) # Set up the camera with a resolution of 640x480
-        camera.start()      # Start the camera
-
-        # Manually adjust camera settings:
-        # - AwbMode 0: Turns off automatic white balance
-        # - ColourGains: Boosts red and blue to fix color tones
-        camera.set_controls({
-            "AwbMode": 0,
-            "ColourGains": (1.5, 2)  
-        })
+        camera_worker.Start(trigger_time)   # Start the camera in the background (timed from the trigger to the first picture)
         camera_on = True             # Update the status to say the camera is on
-        print("📸 Camera started")   # Start capturing frames in the background
-        threading.Thread(target=camera_capture_loop, daemon=True).start()
 
      # === Turn the camera OFF ===
     elif mode == "off" and camera_on:
-        camera.stop()                # Stop the camera
+        # When recording clips or feeding add-ons, the camera stays on
+        if not clip_recorder and not detector and not (frame_bus and frame_bus.readers_present):
+            camera_worker.Stop()     # Stop the camera in the background
         camera_on = False            # Update the status
-        print("🛑 Camera stopped")
 
 # === Start Camera from App or Motion ===
-def startCamera():
+def startCamera(trigger_time=None):
     global manual_override          # This flag prevents the camera from turning on again too soon in motion mode
     if not camera_on:               # Only turn on the camera if it's currently off
-        cameraControl("on")         # Call the function to turn on the camera
+        cameraControl("on", trigger_time)   # Call the function to turn on the camera
         client.publish(REMOTE_DEV_CAMERA_ONOFF_CONTROL_TOPIC, "on")    # Send a message over MQTT so the app knows the camera is now on
         if args.mode == "motion":    # If we're using motion detection mode...
             manual_override = False  # Allow motion to trigger the camera again in the future
@@ -217,8 +317,22 @@ def reset_manual_override():
 
 # === Motion Sensor Trigger ===
 def handleMotionMode():
-    global manual_override                # This flag temporarily blocks the camera from turning on again too soon
     print("👀 Motion detected!")         # Let the user know motion was sensed
+    if (camera_on or manual_override) and not clip_recorder:
+        if events:
+            events.Record("motion")      # Straight from the sensor: don't start a camera check just for the timeline
+        print("🛑 Motion ignored.")      # Nothing else would happen, so don't bother checking
+        return
+    # With --motion-confirm on, the camera first looks for itself (cars and sunlight often fool the sensor)
+    camera_worker.CheckMotion(args.motion_seconds, handleConfirmedMotion)
+
+# === Motion Confirmed (by the camera, or right away when --motion-confirm is off) ===
+def handleConfirmedMotion(score, regions):
+    global manual_override                # This flag temporarily blocks the camera from turning on again too soon
+    if events:
+        events.Record("motion", {"score": round(score, 3)} if score is not None else None)   # For the app's timeline
+    if clip_recorder:
+        clip_recorder.Trigger("motion")   # Save a clip of what the camera saw around the motion
     
     # Only turn on the camera if:
     # - It's currently off
@@ -228,222 +342,143 @@ def handleMotionMode():
     else:
         print("🛑 Motion ignored.")    # If camera is already on or override is active, do nothing
 
-# === Button Press Trigger ===
-def handleButtonMode():
-    startCamera()    # When the doorbell button is pressed, turn on the camera
-
-# === List ALSA Audio Output Devices ===
-def list_alsa_playback_devices():
-    try:
-        result = subprocess.run(["aplay", "-L"], capture_output=True, text=True, check=True)  # Run the command "aplay -L" to list all sound output devices
-        return [line.strip() for line in result.stdout.splitlines() if line and not line.startswith(" ")] # Go through each line of the result, remove spaces, and return a clean list of device names
-    except subprocess.CalledProcessError as e:
-        print("❌ Error listing ALSA devices:", e) # If something goes wrong, print an error message
-        return []                                   # Return an empty list if there was a problem
-
-# === Select a Bluetooth Audio Device if Available ===
-def select_bluetooth_output_device(preferred_keywords=["bluealsa", "bluetooth", "BT"]):
-    global selected_output_device        # Keep track of the chosen speaker (so we don't repeat the search)
-    if selected_output_device:           # If we already selected a speaker before, just reuse it
-        return selected_output_device
-    for device in list_alsa_playback_devices():    # Go through the list of available sound output devices
-        for keyword in preferred_keywords:            # Look for devices that have Bluetooth-related names
-            if keyword.lower() in device.lower():
-                selected_output_device = device       # Save the selected device name
-                print(f"✅ Selected BT device: {device}")    # Show which one was chosen
-                return device
-    # If no Bluetooth speaker was found, use the system default
-    selected_output_device = "default"
-    print("⚠️ No BT device found. Using 'default'")
-    return selected_output_device
-
-def get_bt_sink_name():
-    try:
-        # Run a command to list all available audio sinks (output devices) using PulseAudio
-        result = subprocess.run(["pactl", "list", "short", "sinks"], capture_output=True, text=True)
-        # Go through each line of the result
-        for line in result.stdout.splitlines():
-            if "bluez_output" in line:    # Look for a line that includes "bluez_output" (which means it's a Bluetooth speaker)
-                return line.split()[1]    # Return the name of the Bluetooth sink (the speaker's ID)
-    except Exception as e:    # If something goes wrong (like the command fails), show an error message
-        print("❌ Could not find Bluetooth sink:", e)
-    return None    # If no Bluetooth speaker was found, return None
-
-def get_current_volume_percent(sink):
-    try: # Run a system command to get detailed info about all sound output devices
-        result = subprocess.run(["pactl", "list", "sinks"], capture_output=True, text=True)
-        inside_sink = False    # Flag to know when we're looking at the right speaker (sink)
-        for line in result.stdout.splitlines():    # Go through each line of the output
-            if sink in line:     # If we find the sink we're looking for, mark that we're inside its info block
-                inside_sink = True
-            
-            # If we're inside the sink block and we find a line that shows volume
-            elif inside_sink and "Volume:" in line and "Channel" not in line:
-                match = re.search(r"(\d+)%", line) # Look for a number followed by a % (like "45%")
-                if match:
-                    return int(match.group(1))     # Return the volume as an integer
-
-            # If we hit a blank line while inside the sink block, we’ve reached the end
-            elif inside_sink and line.strip() == "":
-                break  # end of this sink's block
-    except Exception as e:
-        print("❌ Could not get volume:", e)    # If something goes wrong, show an error message
-    return None        # If volume wasn't found, return None
-
-def change_volume(direction):
-    # Step 1: Find the name of the Bluetooth speaker (sink)
-    sink = get_bt_sink_name()
-    if not sink:
-        print("⚠️ Bluetooth sink not found.")
-        return    # Stop if no Bluetooth speaker is connected
-    # Step 2: Get the current volume level of the speaker    
-    current = get_current_volume_percent(sink)
-    if current is None:
-        print("⚠️ Could not read current volume.")
-        return    # Stop if we can’t find out the current volume
-        
-    # Step 3: Decide the new volume based on the direction ("up" or "down")
-    new_volume = current + 5 if direction == "up" else current - 5
-    
-    # Step 4: Make sure the volume stays between 0% and 100%
-    new_volume = max(0, min(100, new_volume)) 
-
-    try:    # Step 5: Use a system command to set the new volume
-        subprocess.run(["pactl", "set-sink-volume", sink, f"{new_volume}%"], check=True)
+# === Add-on Programs Reading the Frame Bus ===
+# While an add-on (see frameBusUtils.py) is reading, it counts as a background viewer, so the
+# camera keeps making frames for it even when nobody is watching in the app
+def handleFrameBusReaders(present):
+    if present:
+        output.AddViewer(background=True)
+        camera_worker.Start()
+    else:
+        output.RemoveViewer(background=True)
+        if not camera_on and not clip_recorder and not detector:
+            camera_worker.Stop()
+
+# Turn "up" / "down" (or an already-merged number of clicks) into a number of volume steps
+def volume_steps(command):
+    if isinstance(command, int):
+        return command
+    command = command.decode() if isinstance(command, bytes) else command
+    return {"up": 1, "down": -1}.get(command.strip().lower(), 0)
+
+# Several quick "Vol +"/"Vol -" clicks waiting in line become one change (e.g. +3 steps)
+def merge_volume_steps(waiting, new):
+    return volume_steps(waiting) + volume_steps(new)
+
+def change_volume(steps):
+    # The audio device manager already knows the Bluetooth speaker and its volume (kept up to date
+    # by the sound server's change events), so this is one quick call: 5% per step, kept within 0-100%
+    new_volume = audio_devices.ChangeVolume(steps)
+    if new_volume is not None:
         print(f"🔊 Volume set to {new_volume}%")    # Confirm the change
-    except subprocess.CalledProcessError as e:
-        print(f"❌ Volume change error: {e}")       # If the command fails, print an error
-        
+
+# === Button Press Trigger ===
 def handleButtonMode():
+    pressed_at = time.perf_counter()  # When the button was pressed (to measure how fast the chime starts)
     global last_bell_time    # Keeps track of the last time the button was pressed
     now = time.time()        # Get the current time in seconds
     if now - last_bell_time < BELL_COOLDOWN_SECONDS:    # If the bell was pressed too recently, ignore this press to prevent spamming
         print("⏳ Bell on cooldown. Ignoring press.")
         return  # Exit early and do nothing
     last_bell_time = now # Update the time so we know when the bell was last pressed
-    
-    # === Play bell sound using ffplay (a media player) ===
-    try:
-        env = os.environ.copy()    # Copy the current environment variables
-        env["DISPLAY"] = ":0"      # Needed for desktop audio routing
-        env["PULSE_RUNTIME_PATH"] = f"/run/user/{os.getuid()}/pulse"  # Path to the audio system
-        # Start playing the bell sound as a background process
-        subprocess.Popen(
-            ["ffplay", "-nodisp", "-autoexit", "./sounds/bell1.mp3"],    # Play without video, exit when done
-            stdout=subprocess.DEVNULL,    # Don’t show output in terminal
-            stderr=subprocess.DEVNULL,
-            env=env        # Use the updated environment
-        )
-        print("🔔 Bell sound played with ffplay")
-    except Exception as e:
-        print(f"❌ Failed to play bell sound: {e}")
+    if events:
+        events.Record("bell")            # Saved (with a thumbnail) on the event writer thread, not here
+
+    # === Play the bell sound (already decoded in memory, on a stream that is always open) ===
+    if chime.Play(args.bell_sound, pressed_at):
+        print("🔔 Bell sound played")
+    if clip_recorder:
+        clip_recorder.Trigger("bell")    # Save a clip of who rang the bell (including the seconds before)
 
     # === If the system is in manual mode, also turn on the camera ===
     if args.mode == "manual":
-        startCamera()    # Start the camera feed
+        startCamera(pressed_at)    # Start the camera feed
 
 # === Send Image to OpenAI GPT-4o and Publish Response ===
+# The describe service (see describeUtils.py) gets the picture, asks the AI and publishes the answer
+# on its own worker; taps while it is busy share the same answer. Turn it on with --ai openai.
 def handleGPTRequest():
-    
-    #Comment out this line when AI integration is enabled
-    client.publish(GPT_RESPONSE_TOPIC, payload="Awaiting AI integration...", qos=0, retain=False)
-    
-    ## AI integration. Delete """ on either end to enable.
-    """
-    # This line tells the app we're waiting for the AI's response
-    client.publish(GPT_RESPONSE_TOPIC, payload="waiting for the AI to Answer...", qos=0, retain=False)
-    try:
-        # === Step 1: Capture an image from the camera and store it in memory ===
-        buffer = io.BytesIO()    # Create an in-memory buffer to store image data
-        camera.capture_file(buffer, format='jpeg')    # Take a picture and save it to the buffer
-        buffer.seek(0)            # Rewind to the beginning of the buffer so we can read it
-        # === Step 2: Convert the image to base64 format (needed for sending to GPT) ===
-        img_b64 = base64.b64encode(buffer.read()).decode('utf-8')
-
-        # === Step 3: Prepare the request to send to OpenAI's GPT-4o model ===
-        payload = {
-            "model": "gpt-4o",    # Tells OpenAI which AI model to use
-            "messages": [{
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": "Describe the image in detail in 2-3 sentences."},
-                    {"type": "image_url", "image_url": { "url": f"data:image/jpeg;base64,{img_b64}" }}
-                ]
-            }],
-            "max_tokens": 400    # Limits the length of the AI’s response
-        }
-
-        # === Step 4: Set up headers, including your OpenAI API key ===
-        headers = { "Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json" } # Authenticates the request
-
-        # === Step 5: Send the image and prompt to OpenAI ===
-        response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload)
-        response.raise_for_status()        # Raises an error if the request fails
-
-        # === Step 6: Extract and print the AI's response ===
-        result = response.json()['choices'][0]['message']['content']
-        print("🤖 GPT:", result)
-
-         # === Step 7: Send the result back to the web app via MQTT ===
-        client.publish(GPT_RESPONSE_TOPIC, payload=result, qos=0, retain=False)
-
-    except Exception as e:    # If something goes wrong, show and send an error message
-        error_msg = f"❌ GPT error: {e}"
-        print(error_msg)
-        client.publish(GPT_RESPONSE_TOPIC, payload=error_msg, qos=0, retain=False)
-        """
+    if describer is None:
+        text = "Awaiting AI integration..." if args.ai == "off" else "The AI is still starting, try again in a moment."
+        if args.ai == "off" and detector:
+            text = detector.Describe()        # Without the cloud AI, say what the local detector sees
+        client.publish(GPT_RESPONSE_TOPIC, payload=text, qos=0, retain=False)
+        return
+    describer.Request()
+
+# === MQTT Command Handlers ===
+# Each of these runs on its own background worker (see dispatchUtils.py), never on the MQTT thread
+
+# === 1. Handle Camera On/Off Request ===
+def handleCameraCommand(payload):
+    cameraControl(payload.decode())    # Turn the camera on or off based on the message content ("on" or "off")
+
+# === 2. Handle Microphone Control Request ===
+def handleMicrophoneCommand(payload):
+    command = payload.decode().lower()    # Get the command: "on" or "off"
+    print("🎤 Microphone control:", command)
+    if command == "on":
+        audio_streamer.StartPlaying()    # Start streaming microphone audio
+    elif command == "off":
+        audio_streamer.StopPlaying()     # Stop streaming audio
+
+# === 3. Handle Incoming Audio from the Web App ===
+def handleTalkbackAudio(payload):
+    if talkback is None:
+        print("⚠️ Speaker not ready yet — audio chunk dropped.")   # Runs on the MQTT thread, so it can't wait
+        return
+    print("🔈 Audio chunk received — queued for playback.")
+    talkback.Play(payload)    # Decoded and played on the talk-back thread
+
+# === 4. Handle Volume Change Request ===
+def handleVolumeCommand(payload):
+    steps = volume_steps(payload)
+    print(f"🔊 Volume change requested: {steps:+d} step(s)")
+    change_volume(steps)
+
+# === 5. Handle Profiler On/Off Request ===
+# "start" begins sampling every thread; "stop" ends it and publishes the report (see metricsUtils.py)
+def handleProfileCommand(payload):
+    command = payload.decode().strip().lower()
+    if command == "start":
+        print("🔬 Profiler started" if profiler.Start() else "⚠️ Profiler is already running")
+    elif command == "stop":
+        report = profiler.Stop()
+        if report:
+            client.publish(PROFILE_REPORT_TOPIC, payload=report, qos=0, retain=False)
+            print("🔬 Profiler stopped, report published")
+
+# === Share Command Statistics Over MQTT ===
+# Every few seconds, publish how busy each command worker is (queue depth, handler time, drops)
+def publish_command_stats():
+    while True:
+        time.sleep(args.stats_interval)
+        client.publish(COMMAND_STATS_TOPIC, payload=json.dumps(dispatcher.Stats()), qos=0, retain=True)
+        if chime:                 # Parts that are still starting are left out
+            client.publish(CHIME_STATS_TOPIC, payload=json.dumps(chime.Stats()), qos=0, retain=True)
+        if audio_streamer:
+            client.publish(AUDIO_STATS_TOPIC, payload=json.dumps(audio_streamer.Stats()), qos=0, retain=True)
+        if camera_worker:
+            client.publish(CAMERA_STATS_TOPIC, payload=json.dumps(camera_worker.Stats()), qos=0, retain=True)
+        if events:
+            client.publish(EVENTS_STATS_TOPIC, payload=json.dumps(events.Stats()), qos=0, retain=True)
+        if describer:
+            client.publish(DESCRIBE_STATS_TOPIC, payload=json.dumps(describer.Stats()), qos=0, retain=True)
+        if detector:
+            client.publish(DETECT_STATS_TOPIC, payload=json.dumps(detector.Stats()), qos=0, retain=True)
+        if args.metrics_mqtt == "on":
+            client.publish(METRICS_STATS_TOPIC, payload=json.dumps(metricsUtils.REGISTRY.Snapshot()), qos=0, retain=True)
 
 # === MQTT Callback Handlers ===
 def on_message(client, userdata, msg):
     topic = msg.topic           # Get the topic (channel) of the message
     print("📩 MQTT:", topic)    # Print the topic to the terminal for debugging
-    
-    # === 1. Handle Camera On/Off Request ===
-    if topic == REMOTE_APP_CAMERA_ONOFF_CONTROL_TOPIC:
-        cameraControl(msg.payload.decode())    # Turn the camera on or off based on the message content ("on" or "off")
-    
-    # === 2. Handle Microphone Control Request ===
-    elif topic == REMOTE_APP_MICROPHONE_CONTROL_TOPIC:
-        command = msg.payload.decode().lower()    # Get the command: "on" or "off"
-        print("🎤 Microphone control:", command)
-        if command == "on":
-            audio_streamer.StartPlaying()    # Start streaming microphone audio
-        elif command == "off":
-            audio_streamer.StopPlaying()     # Stop streaming audio
-    
-    # === 3. Handle GPT Image Description Request ===
-    elif topic == GPT_REQUEST_TOPIC:
-        threading.Thread(target=handleGPTRequest, daemon=True).start()    # Start a new background thread to handle the AI image description
-
-    # === 4. Handle Incoming Audio from the Web App ===
-    elif topic == REMOTE_APP_AUDIO_DATA_TOPIC:
-        print("🔈 Audio chunk received — converting and playing.")
-        try:
-            import tempfile    # Used to temporarily save the audio file
-
-             # Save the received audio data (webm format) to a temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".webm") as raw_file:
-                raw_file.write(msg.payload)
-                raw_file.flush()
-                raw_path = raw_file.name
-
-            # Convert the webm file to wav format using ffmpeg
-            wav_path = raw_path.replace(".webm", ".wav")
-            subprocess.run(["ffmpeg", "-y", "-i", raw_path, wav_path], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            subprocess.run(["aplay", wav_path]) # Play the converted audio using aplay (built-in audio player)
-
-            # Delete the temporary files after use
-            os.unlink(raw_path)
-            os.unlink(wav_path)
-
-        except Exception as e:
-            print("❌ Audio playback failed:", e)
-    
-    # === 5. Handle Volume Change Request ===
-    elif topic == VOLUME_CONTROL_TOPIC:
-        direction = msg.payload.decode()
-        print(f"🔊 Volume change requested: {direction}")
-        change_volume(direction)
+    started = time.perf_counter()
+    # Hand the message to the worker for its topic and return right away
+    if not dispatcher.Dispatch(topic, msg.payload):
+        print("⚠️ No handler for MQTT topic:", topic)
+    MQTT_DISPATCH_SECONDS.Observe(time.perf_counter() - started)
+    MQTT_MESSAGES.Labels(topic).Inc()
 
 def on_connect(client, userdata, flags, rc, properties=None):
     print("✅ MQTT connected:", rc)        # Confirm that the system connected to the MQTT server
@@ -453,66 +488,353 @@ def on_connect(client, userdata, flags, rc, properties=None):
               GPT_REQUEST_TOPIC,                         # For requesting an image description from GPT
               REMOTE_APP_MICROPHONE_CONTROL_TOPIC,       # For turning the microphone on/off
               REMOTE_APP_AUDIO_DATA_TOPIC,               # For receiving audio sent from the app
-              VOLUME_CONTROL_TOPIC]:                     # For increasing/decreasing speaker volume
+              VOLUME_CONTROL_TOPIC,                      # For increasing/decreasing speaker volume
+              PROFILE_CONTROL_TOPIC]:                    # For turning the profiler on/off
         client.subscribe(t)                # Tell MQTT: "I want to hear messages sent to this topic"
     print("📡 Subscribed to all topics.") # Let the user know it's ready to receive commands
+    startup.Ready("mqtt")
+    publish_ready(startup.Status())        # The app sees which parts are still starting
+
+# === Tell the App Which Parts Are Ready ===
+def publish_ready(status):
+    client.publish(READY_TOPIC, payload=json.dumps(status), qos=0, retain=True)
 
 def on_disconnect(client, userdata, flags, rc, properties=None):
     print("🔌 MQTT disconnected:", rc)    # Show a message when the system loses connection to MQTT
     stopCamera()                           # Turn off the camera as a safety step
 
+# === Setting Up the Slow Parts ===
+# Each of these runs on its own thread while the web server and MQTT are already working
+# (see "Fast Start" in main). They import their libraries themselves, so those load in parallel.
+
+# The camera, and everything that uses its pictures
+def start_camera():
+    global cv2, camera, camera_worker, snapshots, frame_bus, clip_recorder
+    import cv2                     # For the "cv2" encoder (StreamingOutput.EncodeFrame)
+    import cameraUtils, snapshotUtils
+    load_backend(args.backend, "camera", fake_video=args.fake_video)
+    camera = backend.Picamera2()   # Create camera object
+    extra_encoders = [(h264_stream, make_h264_encoder)] if h264_stream else []
+    motion_detector = None
+    if args.motion_confirm == "on":
+        import motionUtils
+        motion_detector = motionUtils.MotionDetector(args.motion_threshold)
+    camera_worker = cameraUtils.CameraWorker(camera, output, make_picamera2_encoder,
+                                             width=args.width, height=args.height, fps=args.fps,
+                                             quality=args.quality, encoder=args.encoder,
+                                             idle_fps=args.clip_fps if args.preroll > 0 else None,
+                                             motion_detector=motion_detector, extra_encoders=extra_encoders,
+                                             standby=args.camera_standby, standby_fps=args.camera_standby_fps)
+    snapshots = snapshotUtils.SnapshotService(output, camera_worker, ttl=args.snapshot_ttl)   # Still pictures for /snapshot.jpg and the AI
+    camera_worker.Begin()          # The camera worker waits in the background for "on" commands
+    if args.frame_bus == "on":
+        import frameBusUtils
+        frame_bus = frameBusUtils.FrameBus(args.width, args.height)    # Costs nothing until an add-on reads
+        frame_bus.AddReaderListener(handleFrameBusReaders)
+        frame_bus.Begin()
+    if args.preroll > 0:
+        import clipUtils
+        clip_recorder = clipUtils.ClipRecorder(output, args.clip_dir, args.preroll, args.postroll, args.clip_fps)
+        clip_recorder.Begin()      # Start filling the pre-roll...
+        camera_worker.Start()      # ...which needs the camera running all the time
+
+# The doorbell chime and any other sounds are decoded once, now, and played from memory
+def start_chime():
+    global chime
+    load_backend(args.backend, "audio", fake_audio=args.fake_audio)
+    import audioUtils
+    player = audioUtils.ChimePlayer(overlap=args.chime_overlap)
+    player.Load("bell", args.chime)
+    for sound in args.sound:
+        name, path = sound.split("=", 1)
+        player.Load(name, path)
+    player.SetLatencyHook(lambda name, seconds: print(f"🔔 '{name}' started {1000 * seconds:.0f} ms after the press"))
+    player.Begin()
+    chime = player
+
+# The speaker (volume, talk-back from the app) and the door microphone
+def start_audio():
+    global audio_devices, talkback, audio_streamer
+    import audioUtils, audioDeviceUtils
+    audio_devices = audioDeviceUtils.AudioDeviceManager()   # Watches the Bluetooth speaker and its volume
+    audio_devices.Begin()
+    player = audioUtils.TalkbackPlayer()   # Plays voice messages from the web app
+    player.Begin()
+    talkback = player
+    streamer = audioUtils.AudioPlayback()
+    streamer.SetMQTTClient(client, "ring/audioresponse")    # Topic for voice data
+    streamer.SetPlayBackFrameCount(80)                      # Buffer size for streaming
+    if args.audio == "stream":
+        streamer.SetStreamMode(args.audio_rate, args.audio_frame_ms, args.audio_codec)   # Small packets, low delay
+    if args.vad == "on":
+        streamer.SetVoiceDetection(VOICE_EVENTS_TOPIC, start_db=args.vad_start_db,
+                                   hangover_ms=args.vad_hangover_ms)      # Leave out the silence
+    audio_streamer = streamer
+
+# The button and the motion sensor. A press while the chime is still loading rings once it is ready.
+def start_sensors():
+    global button, pir
+    load_backend(args.backend, "gpio")
+    button = backend.Button(2)     # Button connected to GPIO pin 2
+    pir = backend.MotionSensor(4)  # Motion sensor on GPIO pin 4
+    if args.mode == "motion":
+        pir.when_motion = startup.Guard("camera", handleMotionMode)    # Motion sensor triggers the camera
+    button.when_pressed = startup.Guard("chime", handleButtonMode)      # Button press triggers bell + camera
+
+# Describing the camera picture with AI (--ai)
+def start_ai():
+    global describer
+    import describeUtils
+    if args.ai == "stub":
+        describe_stub = describeUtils.StubDescribeServer()    # Pretends to be OpenAI, right here on the Pi
+        describe_stub.Begin()
+        ai_backend = describeUtils.OpenAIBackend("stub", url=describe_stub.url, timeout=args.ai_timeout)
+    else:
+        if not OPENAI_API_KEY:
+            print("⚠️ OPENAI_API_KEY is missing from .env; AI requests will fail")
+        ai_backend = describeUtils.OpenAIBackend(OPENAI_API_KEY, url=args.ai_url, model=args.ai_model,
+                                                 timeout=args.ai_timeout)
+    service = describeUtils.DescribeService(
+        lambda: snapshots.Get(max_width=args.ai_width),    # Pictures are shrunk so they upload faster
+        ai_backend,
+        lambda text: client.publish(GPT_RESPONSE_TOPIC, payload=text, qos=0, retain=False))
+    service.AddAnswerListener(record_ai_answer)           # Answers go in the event history too
+    service.Begin()
+    describer = service
+
+# Looking for people and packages on the Pi (--detect). The model runs in its own low-priority
+# process on shrunken copies of the stream's frames. Like the clip recorder, it keeps the camera running.
+def start_detect():
+    global detector
+    import detectUtils
+    settings = detectUtils.ModelSettings(args.detect_model, config=args.detect_config, labels=args.detect_labels,
+                                         format=args.detect_format, engine=args.detect_engine, size=args.detect_size,
+                                         threshold=args.detect_threshold, classes=args.detect_classes.split(","),
+                                         threads=args.detect_threads, camera_width=args.width)
+    service = detectUtils.DetectionService(
+        output, settings,
+        lambda message: client.publish(DETECTIONS_TOPIC, payload=json.dumps(message), qos=0, retain=False),
+        cpu_budget=args.detect_cpu, batch=args.detect_batch)
+    service.Begin()                # Counts as a background viewer of the stream...
+    tier_encoder.SetOverlay(service, default=args.detect_overlay == "on")   # Boxes on /stream.mjpg?overlay=on
+    detector = service
+    camera_worker.Start()          # ...and needs the camera running all the time
+
+# The event history behind /events: bell presses, motion and AI answers, with thumbnails (--events)
+def start_events():
+    global events
+    import eventUtils
+    store = eventUtils.EventStore(args.events_db, picture=event_picture, thumbnail=event_thumbnail,
+                                  keep_days=args.events_keep_days)
+    store.AddListener(publish_events)
+    store.Begin()
+    events = store
+
+# An event's picture is the newest stream frame at the moment it happens. With the stream off
+# there is none, and the event is saved without a thumbnail (taking a still would turn the camera
+# on and hold up the event writer). It's shrunk later, on the event writer thread.
+def event_picture():
+    return snapshots.LiveFrame() if snapshots else None
+
+def event_thumbnail(jpeg):
+    return snapshots.Shrink(jpeg, args.event_thumb_width)
+
+# Tell the app about each saved event, so its timeline updates without asking /events again
+def publish_events(saved):
+    for event in saved:
+        client.publish(EVENTS_TOPIC, payload=json.dumps(event), qos=0, retain=False)
+
+def record_ai_answer(answer, jpeg):
+    if events:
+        events.Record("ai", {"text": answer}, jpeg=jpeg)   # With the picture that was described
+
 # === Main Program Execution ===
-if __name__ == '__main__':
-    # === 1. Define MQTT Topics (Communication Channels) ===
-    # These are like labeled mailboxes for different features
-    REMOTE_APP_CAMERA_ONOFF_CONTROL_TOPIC = "ring/remote_app_control/camera"
-    REMOTE_DEV_CAMERA_ONOFF_CONTROL_TOPIC = "ring/local_dev_control/camera"
-    REMOTE_APP_MICROPHONE_CONTROL_TOPIC = "ring/remote_app_control/microphone"
-    REMOTE_APP_AUDIO_DATA_TOPIC = "ring/remote_app_audio_data"
-    GPT_REQUEST_TOPIC = "ring/gptrequest"
-    GPT_RESPONSE_TOPIC = "ring/gptresponse"
-    VOLUME_CONTROL_TOPIC = "ring/remote_app_control/volume"
-
-    # === 2. Read Options From the Command Line ===
+def main(argv=None):
+    # Everything set up here is shared with the handlers above (and with the benchmarks)
+    global args, backend, profiler, delay_probe, chime, camera, output, tier_encoder, h264_stream, camera_worker
+    global snapshots, describer, clip_recorder, frame_bus, button, pir, audio_devices, talkback, dispatcher, client
+    global audio_streamer, routes, httpd, startup, events, detector
+    # === 1. Read Options From the Command Line ===
     # Example: --mode motion or --secure on
     parser = argparse.ArgumentParser()
     parser.add_argument('--mode', type=str, default='manual', help='manual | motion')
     parser.add_argument('--secure', type=str, default='off')
-    args = parser.parse_args()
-
-    # === 3. Set Up Hardware and Systems ===
-    pygame.mixer.init()            # Start sound system
-    camera = Picamera2()           # Create camera object
+    parser.add_argument('--port', type=int, default=None, help='web server port (default 8000, or 8001 with --secure on)')
+    parser.add_argument('--backend', type=str, default='pi', choices=['pi', 'fake'],
+                        help='pi = real camera, GPIO, sound card and MQTT broker | fake = stand-ins for testing on any computer')
+    parser.add_argument('--fake-video', type=str, help='--backend fake: video file or folder of pictures to use as the camera')
+    parser.add_argument('--fake-audio', type=str, help='--backend fake: WAV file to use as the microphone')
+    parser.add_argument('--server', type=str, default='threaded', choices=['threaded', 'asyncio'],
+                        help='threaded = one thread per connection | asyncio = one event loop for all connections')
+    parser.add_argument('--encoder', type=str, default='jpeg', choices=['jpeg', 'mjpeg', 'cv2'],
+                        help='jpeg (Picamera2 software encoder) | mjpeg (hardware encoder, not on Pi 5) | cv2 (OpenCV fallback)')
+    parser.add_argument('--width', type=int, default=640, help='camera stream width in pixels')
+    parser.add_argument('--height', type=int, default=480, help='camera stream height in pixels')
+    parser.add_argument('--fps', type=int, default=24, help='camera stream frames per second')
+    parser.add_argument('--camera-standby', type=str, default='configured', choices=['off', 'configured', 'warm'],
+                        help='while nobody needs the camera: off = fully stopped (least power) | configured = stopped '
+                             'but set up | warm = running slowly, nothing encoded (fastest first picture)')
+    parser.add_argument('--camera-standby-fps', type=int, default=2, help='sensor frame rate during warm standby')
+    parser.add_argument('--quality', type=int, default=85, help='JPEG quality (1-100)')
+    parser.add_argument('--preroll', type=float, default=0, help='seconds of video kept before a bell/motion event (0 = no clips)')
+    parser.add_argument('--postroll', type=float, default=10, help='seconds of video saved after a bell/motion event')
+    parser.add_argument('--clip-fps', type=int, default=8, help='frames per second saved in event clips')
+    parser.add_argument('--clip-dir', type=str, default='./clips', help='folder for saved event clips')
+    parser.add_argument('--motion-confirm', type=str, default='off', help='on = confirm motion sensor triggers with the camera')
+    parser.add_argument('--motion-threshold', type=float, default=0.02, help='fraction of the picture that must change to count as motion')
+    parser.add_argument('--motion-seconds', type=float, default=3, help='how long the camera looks for motion after the sensor fires')
+    parser.add_argument('--audio', type=str, default='stream', choices=['stream', 'wav'],
+                        help='stream = small low-delay packets | wav = ~2 second WAV files (old behavior)')
+    parser.add_argument('--audio-codec', type=str, default='adpcm', choices=['adpcm', 'pcm'], help='compression for streamed audio')
+    parser.add_argument('--audio-rate', type=int, default=16000, help='sample rate for streamed audio (Hz)')
+    parser.add_argument('--audio-frame-ms', type=int, default=20, help='milliseconds of sound per streamed packet (multiple of 10)')
+    parser.add_argument('--vad', type=str, default='off', choices=['on', 'off'],
+                        help='on = only send microphone sound while somebody speaks (keep-alives in between)')
+    parser.add_argument('--vad-start-db', type=float, default=9.0, help='dB above the background noise that counts as speech')
+    parser.add_argument('--vad-hangover-ms', type=int, default=400, help='keep sending this long after speech stops')
+    parser.add_argument('--metrics', type=str, default='on', choices=['on', 'off'], help='record timings and counters for /metrics')
+    parser.add_argument('--metrics-mqtt', type=str, default='off', choices=['on', 'off'],
+                        help='also publish the metrics as JSON on ring/stats/metrics every --stats-interval seconds')
+    parser.add_argument('--profile-interval-ms', type=float, default=10, help='how often the on-demand profiler samples the threads')
+    parser.add_argument('--stats-interval', type=float, default=30, help='seconds between MQTT statistics messages (0 = off)')
+    parser.add_argument('--snapshot-ttl', type=float, default=2.0, help='seconds a /snapshot.jpg picture is reused')
+    parser.add_argument('--ai', type=str, default='off', choices=['off', 'openai', 'stub'],
+                        help='off | openai (needs OPENAI_API_KEY in .env) | stub (local test server, no internet)')
+    parser.add_argument('--ai-url', type=str, default='https://api.openai.com/v1/chat/completions')
+    parser.add_argument('--ai-model', type=str, default='gpt-4o')
+    parser.add_argument('--ai-width', type=int, default=512, help='pictures sent to the AI are shrunk to this width')
+    parser.add_argument('--ai-timeout', type=float, default=20, help='seconds to wait for the AI before giving up')
+    parser.add_argument('--chime', type=str, default='./sounds/bell1.mp3', help='doorbell sound file')
+    parser.add_argument('--sound', type=str, action='append', default=[], help='extra sound as name=path (repeatable)')
+    parser.add_argument('--bell-sound', type=str, default='bell', help='which loaded sound the button plays')
+    parser.add_argument('--chime-overlap', type=str, default='restart', choices=['restart', 'mix', 'ignore'],
+                        help='what a press does while the chime is still ringing')
+    parser.add_argument('--events', type=str, default='on', choices=['on', 'off'],
+                        help='save bell presses, motion and AI answers with thumbnails (/events, ring/events)')
+    parser.add_argument('--events-db', type=str, default='./events/events.db', help='event history database file')
+    parser.add_argument('--events-keep-days', type=float, default=365, help='delete events older than this (0 = keep all)')
+    parser.add_argument('--event-thumb-width', type=int, default=160, help='width of event thumbnails in pixels')
+    parser.add_argument('--detect', type=str, default='off', choices=['on', 'off'],
+                        help='look for people and packages on the Pi itself (ring/detections, keeps the camera on); see detectUtils.py')
+    parser.add_argument('--detect-model', type=str, default='hog',
+                        help='hog (OpenCV 4.x people detector) | a model file for OpenCV DNN / ONNX Runtime')
+    parser.add_argument('--detect-config', type=str, help='second model file some formats need (e.g. Caffe .prototxt)')
+    parser.add_argument('--detect-labels', type=str, help='class names of the model, one per line')
+    parser.add_argument('--detect-format', type=str, default='ssd', choices=['ssd', 'yolo'], help="layout of the model's output")
+    parser.add_argument('--detect-engine', type=str, default='opencv', choices=['opencv', 'onnxruntime'])
+    parser.add_argument('--detect-size', type=int, default=320, help='model input size in pixels')
+    parser.add_argument('--detect-threshold', type=float, default=0.5, help='lowest confidence that counts')
+    parser.add_argument('--detect-classes', type=str, default='person,package', help='labels to report, comma separated (empty = all)')
+    parser.add_argument('--detect-batch', type=int, default=1, help='newest frames run through the model together')
+    parser.add_argument('--detect-cpu', type=float, default=0.5, help='most of one CPU core the detector may use (0.5 = half)')
+    parser.add_argument('--detect-threads', type=int, default=2, help='threads the model may use')
+    parser.add_argument('--detect-overlay', type=str, default='off', choices=['on', 'off'],
+                        help='draw the boxes on /stream.mjpg by default (viewers can ask with ?overlay=on|off)')
+    parser.add_argument('--frame-bus', type=str, default='on', choices=['on', 'off'],
+                        help='share raw frames and JPEGs with add-on programs through shared memory (see frameBusUtils.py)')
+    parser.add_argument('--h264', type=str, default='on', choices=['on', 'off'], help='offer the H.264 live stream (/stream.mp4) next to MJPEG')
+    parser.add_argument('--h264-bitrate', type=int, default=1_000_000, help='H.264 bitrate in bits per second')
+    parser.add_argument('--h264-keyframe-seconds', type=float, default=1.0, help='seconds between H.264 keyframes (new viewers start at one)')
+    args = parser.parse_args(argv)
+
+    # === 2. Fast Start: the Web Server and MQTT Come First ===
+    # Only the quick parts are set up here, so the app can connect moments after power-up.
+    # The slow ones (camera, chime, sound card, sensors, AI) are set up at the same time on
+    # background threads in step 6; commands that need them wait for them, and /ready (and the
+    # retained ring/status/ready message) shows how far along they are. See startupUtils.py.
+    startup = startupUtils.Startup()
+    startup.Add("http")
+    startup.Add("mqtt")
+    # The slow parts are listed now (they start in step 6), so nothing counts as "everything ready" before them
+    startup.Add("camera", start_camera)
+    startup.Add("chime", start_chime)
+    startup.Add("audio", start_audio, needs=["chime"])   # After the chime, so the bell gets the sound card first
+    startup.Add("sensors", start_sensors)
+    if args.events == "on":
+        startup.Add("events", start_events)
+    if args.ai != "off":
+        startup.Add("ai", start_ai, needs=["camera"])   # Its pictures come from the camera
+    if args.detect == "on":
+        startup.Add("detect", start_detect, needs=["camera"])
+    load_backend(args.backend, "mqtt")
+    metricsUtils.REGISTRY.enabled = args.metrics == "on"
+    profiler = metricsUtils.SamplingProfiler(args.profile_interval_ms / 1000)   # Only runs when asked for
+    if args.metrics == "on":
+        delay_probe = metricsUtils.SchedulingDelayProbe()     # Shows when threads wait for the GIL or the CPU
+        delay_probe.Begin()
     output = StreamingOutput()     # Prepare video stream manager
-    button = Button(2)             # Button connected to GPIO pin 2
-    pir = MotionSensor(4)          # Motion sensor on GPIO pin 4
+    tier_encoder = qualityUtils.TierEncoder()   # Smaller versions of each frame for slow viewers (made at most once per frame)
+    if args.h264 == "on":
+        # Keep a few seconds of H.264 so a new viewer can start from the last keyframe
+        h264_stream = h264Utils.H264Stream(args.width, args.height, args.fps,
+                                           ring_size=max(8, int(3 * args.fps * args.h264_keyframe_seconds)))
+    # Values that are only read when /metrics is asked for
+    metricsUtils.REGISTRY.Gauge("doorbell_stream_viewers", "People and recorders watching each stream",
+                                lambda: {"mjpeg": output.viewers, "mp4": h264_stream.viewers if h264_stream else 0},
+                                labels=("format",))
+    metricsUtils.REGISTRY.Gauge("doorbell_camera_fps", "Frames per second the capture loop achieves (cv2 encoder)",
+                                lambda: camera_worker.scheduler.achieved_fps if camera_worker and camera_worker.running else 0.0)
+    metricsUtils.REGISTRY.Gauge("doorbell_command_queue_depth", "MQTT commands waiting for their worker",
+                                lambda: {name: stats["depth"] for name, stats in dispatcher.Stats().items()},
+                                labels=("worker",))
+    metricsUtils.REGISTRY.Gauge("doorbell_h264_bytes_total", "H.264 fragment bytes made by the camera",
+                                lambda: h264_stream.bytes_sent if h264_stream else 0)
+    metricsUtils.REGISTRY.Gauge("doorbell_frame_bus_readers", "1 while an add-on program reads the shared-memory frame bus",
+                                lambda: int(frame_bus.readers_present) if frame_bus else 0)
+    metricsUtils.REGISTRY.Gauge("doorbell_startup_seconds", "Seconds after start when each part of the server was ready",
+                                lambda: {name: part["seconds"] for name, part in startup.Status()["parts"].items()
+                                         if part["state"] == "ready"},
+                                labels=("part",))
+
+    # === 3. Decide Which Worker Handles Each MQTT Topic ===
+    # Camera and microphone: only the newest waiting command matters (the last click wins).
+    # Volume: waiting clicks are added together. AI: the describe service has its own worker
+    # (and shares one answer between repeated taps), so its requests are just handed over.
+    # Commands for parts that are still starting wait for them on their worker (startup.Guard).
+    dispatcher = dispatchUtils.CommandDispatcher()
+    dispatcher.Register(REMOTE_APP_CAMERA_ONOFF_CONTROL_TOPIC, handleCameraCommand, "camera", policy="latest")
+    dispatcher.Register(REMOTE_APP_MICROPHONE_CONTROL_TOPIC, startup.Guard("audio", handleMicrophoneCommand),
+                        "microphone", policy="latest")
+    dispatcher.Register(GPT_REQUEST_TOPIC, lambda payload: handleGPTRequest(), "gpt", policy="inline")
+    dispatcher.Register(REMOTE_APP_AUDIO_DATA_TOPIC, handleTalkbackAudio, "talkback", policy="inline")
+    dispatcher.Register(VOLUME_CONTROL_TOPIC, startup.Guard("audio", handleVolumeCommand), "volume",
+                        policy="merge", merge=merge_volume_steps)
+    dispatcher.Register(PROFILE_CONTROL_TOPIC, handleProfileCommand, "profile")
 
     # === 4. Connect to MQTT (Messaging System) ===
-    client = paho.Client(transport="tcp")        # Use plain TCP for local MQTT
+    client = backend.MqttClient(transport="tcp") # Use plain TCP for local MQTT
     client.on_message = on_message               # Define what to do when messages arrive
     client.on_connect = on_connect               # Define what to do when connected
     client.on_disconnect = on_disconnect         # Define what to do when disconnected
+    startup.AddListener(publish_ready)            # Tell the app every time a part becomes ready
     client.connect("127.0.0.1", 1883, 60)        # Connect to local MQTT broker
     client.loop_start()                          # Start MQTT client in the background
 
-    # === 5. Prepare Audio Streaming ===
-    audio_streamer = audioUtils.AudioPlayback()
-    audio_streamer.SetMQTTClient(client, "ring/audioresponse")    # Topic for voice data
-    audio_streamer.SetPlayBackFrameCount(80)                 # Buffer size for streaming
-
-    # === 6. Set What Each Sensor Does ===
-    if args.mode == "motion":
-        pir.when_motion = handleMotionMode    # Motion sensor triggers the camera
-    button.when_pressed = handleButtonMode    # Button press triggers bell + camera
-
-    # === 7. Start Capturing Video Frames in the Background ===
-    threading.Thread(target=camera_capture_loop, daemon=True).start()
-
-    # === 8. Start the Web Server (HTTPS if secure mode is on) ===
-    port = 8001 if args.secure == "on" else 8000
-    server_address = ('', port)
-    httpd = StreamingServer(server_address, StreamingHandler)
-
+    # === 5. Open the Web Server (HTTPS if secure mode is on) ===
+    # The web app's files are read into memory once (and re-read if they change)
+    assets = webUtils.StaticAssetCache("./wwwroot", aliases={
+        "/index.html": "html_pages/client_ring_app.html",
+        "/client_app.js": "js/client_app.js",
+        "/client_app_styles.css": "css/client_app_styles.css",
+    })
+    routes = webUtils.Router(assets)
+    # If the user types just the root address (like http://192.168.1.5/), redirect them to index.html
+    routes.Add("/", webUtils.Redirect("/index.html"))
+    # A still picture for dashboards (/snapshot.jpg?width=320); may wait for the camera, so it's "blocking".
+    # If the camera doesn't get ready, the answer is /ready's "503 still starting" instead.
+    routes.Add("/snapshot.jpg", startup.Guard("camera", lambda path, headers: snapshots.Respond(path, headers),
+                                              otherwise=startup.Respond), blocking=True)
+    # Timings and counters in the Prometheus format, and the on-demand profiler (/profile?seconds=10)
+    routes.Add("/metrics", metricsUtils.REGISTRY.Respond)
+    routes.Add("/profile", profiler.Respond, blocking=True)
+    # The event history for the app's timeline (/events?before=&kind=) and each event's thumbnail
+    # (/events/<id>/thumb.jpg); reads the database, so it's "blocking"
+    routes.Add("/events", startup.Guard("events", lambda path, headers: events.Respond(path, headers),
+                                        otherwise=startup.Respond), prefix=True, blocking=True)
+    # Which parts are ready (for the app, and for health checks): 200 once all of them are
+    routes.Add("/ready", startup.Respond)
+    port = args.port or (8001 if args.secure == "on" else 8000)
+    context = None
     if args.secure == "on":
         cert_path = "./certs/ring_server.crt"
         key_path = "./certs/ring_server.key"
@@ -522,16 +844,71 @@ if __name__ == '__main__':
         # Create a secure HTTPS context
         context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
         context.load_cert_chain(certfile=cert_path, keyfile=key_path)
-        httpd.socket = context.wrap_socket(httpd.socket, server_side=True)
-        print(f"🌐 HTTPS server on port {port}")
-    else:
-        print(f"🌐 HTTP server on port {port}")
 
-     # === 9. Keep the Server Running Until Manually Stopped ===
+    if args.server == "asyncio":
+        # One event loop serves every connection (and does the TLS handshakes); its port opens in step 7
+        httpd = asyncServerUtils.AsyncStreamServer(routes, {"/stream.mjpg": output}, port, context,
+                                                   tier_encoder=tier_encoder,
+                                                   mp4_streams={"/stream.mp4": h264_stream} if h264_stream else None,
+                                                   on_listening=lambda: startup.Ready("http"))
+    else:
+        server_address = ('', port)
+        httpd = StreamingServer(server_address, StreamingHandler)
+        if context:
+            httpd.socket = context.wrap_socket(httpd.socket, server_side=True)
+            print(f"🌐 HTTPS server on port {port}")
+        else:
+            print(f"🌐 HTTP server on port {port}")
+        startup.Ready("http")    # Browsers can connect now (they are answered once serve_forever runs, just below)
+
+    # === 6. Set Up the Slow Parts in the Background, All at Once ===
+    startup.Begin()
+
+    if args.stats_interval > 0:
+        threading.Thread(target=publish_command_stats, daemon=True).start()
+
+     # === 7. Keep the Server Running Until Manually Stopped ===
     try:
-        httpd.serve_forever()    # Start the web server
+        if args.server == "asyncio":
+            httpd.ServeForever()     # Start the asyncio web server
+        else:
+            httpd.serve_forever()    # Start the web server
     except KeyboardInterrupt:    # If someone presses Ctrl+C...
-        print("🛑 Shutting down...")
-        client.disconnect()      # Disconnect from MQTT
-        client.loop_stop()       # Stop MQTT background process
-        camera.stop()            # Turn off the camera
+        pass
+    print("🛑 Shutting down...")
+    startup.WaitFor(timeout=10)  # Let parts that are still starting finish, so they can be closed properly
+    client.disconnect()      # Disconnect from MQTT
+    client.loop_stop()       # Stop MQTT background process
+    dispatcher.Close()       # Stop the command workers
+    if talkback:
+        talkback.Close()     # Stop the talk-back player
+    if audio_devices:
+        audio_devices.Close()  # Stop watching the speaker
+    if chime:
+        chime.Close()        # Close the chime's sound stream
+    if delay_probe:
+        delay_probe.Close()  # Stop the scheduling delay probe
+    if describer:
+        describer.Close()    # Stop the AI describe worker
+    if detector:
+        detector.Close()     # Stop the detector process
+    if events:
+        events.Close()       # Save the events that are still waiting
+    if clip_recorder:
+        clip_recorder.Close()  # Save any clip that is still being recorded
+    if camera_worker:
+        camera_worker.Shutdown()  # Turn off the camera and end its background thread
+    if frame_bus:
+        frame_bus.Close()    # Remove the shared memory (add-ons wait for the next server)
+
+# === Stop the Server From Code ===
+# Makes main() return (after the same clean-up as Ctrl+C). Used by the benchmarks, which run
+# the whole server with --backend fake on a thread of their own.
+def shutdown():
+    if args.server == "asyncio":
+        httpd.Shutdown()
+    else:
+        httpd.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -11,12 +11,14 @@ sudo apt install -y \
     python3 \
     python3-pip \
     python3-venv \
-    python3-pygame \
     python3-pyaudio \
     python3-opencv \
     python3-picamera2 \
     python3-gpiozero \
     python3-paho-mqtt \
+    python3-av \
+    python3-brotli \
+    python3-pulsectl \
     libatlas-base-dev \
     libportaudio2 \
     portaudio19-dev \
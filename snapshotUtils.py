@@ -0,0 +1,94 @@
+import threading
+import time
+from urllib.parse import urlsplit, parse_qs
+import cv2
+import numpy as np
+
+# === Snapshots (single still pictures) ===
+# Dashboards, NVRs and the AI "describe" button all want one still picture now and then.
+# Taking a separate camera capture for each of them competes with the live stream, so instead:
+#   1. a snapshot made in the last `ttl` seconds is simply reused
+#   2. if the live stream is running, its newest JPEG is used as-is (no capture, no encoding)
+#   3. only if the camera is idle does the camera worker take one still (and turn off again)
+# Several requests arriving at once share the same work.
+class SnapshotService:
+    def __init__(self, output, camera_worker, ttl=2.0, fresh_seconds=1.0, still_timeout=5.0, quality=85):
+        self.output = output                  # The StreamingOutput with the live JPEG frames
+        self.camera_worker = camera_worker    # Takes a still when the live stream isn't running
+        self.ttl = ttl                        # Seconds a snapshot may be reused
+        self.fresh_seconds = fresh_seconds    # A live frame older than this means the stream has stopped
+        self.still_timeout = still_timeout    # Longest wait for the camera to take a still
+        self.quality = quality
+        self.lock = threading.Lock()          # Only one request refreshes at a time; the others reuse its result
+        self.cache = {}                       # max_width -> (time, jpeg)
+        self.frame_time = 0.0                 # When the live stream last produced a frame
+        self.sources = {"cache": 0, "stream": 0, "still": 0, "failed": 0}   # Numbers for monitoring
+        output.AddFrameListener(self._on_frame)
+
+    def _on_frame(self, sequence):
+        self.frame_time = time.monotonic()
+
+    def Get(self, max_width=None):
+        # Returns a JPEG (bytes) no wider than max_width, or None if the camera couldn't take one
+        with self.lock:
+            now = time.monotonic()
+            cached = self.cache.get(max_width)
+            if cached and now - cached[0] < self.ttl:
+                self.sources["cache"] += 1
+                return cached[1]
+            jpeg = self._latest_stream_frame(now)
+            if jpeg is not None:
+                self.sources["stream"] += 1
+            else:
+                jpeg = self._take_still()
+                if jpeg is None:
+                    self.sources["failed"] += 1
+                    return None
+                self.sources["still"] += 1
+            jpeg = self.Shrink(jpeg, max_width)
+            self.cache[max_width] = (time.monotonic(), jpeg)
+            return jpeg
+
+    def Respond(self, url_path, request_headers):
+        # Web handler for /snapshot.jpg (optionally ?width=320)
+        width = parse_qs(urlsplit(url_path).query).get("width", [""])[0]
+        jpeg = self.Get(int(width) if width.isdigit() and int(width) > 0 else None)
+        if jpeg is None:
+            return 503, [("Content-Type", "text/plain"), ("Content-Length", "19")], b"Camera unavailable\n"
+        return 200, [("Content-Type", "image/jpeg"),
+                     ("Cache-Control", f"max-age={int(self.ttl)}"),
+                     ("Content-Length", str(len(jpeg)))], jpeg
+
+    def LiveFrame(self):
+        # The live stream's newest JPEG, or None if the stream isn't running (never takes a still)
+        return self._latest_stream_frame(time.monotonic())
+
+    def _latest_stream_frame(self, now):
+        if now - self.frame_time > self.fresh_seconds:
+            return None
+        _, frame = self.output.Latest()
+        return frame
+
+    def _take_still(self):
+        done = threading.Event()
+        result = []
+        def on_still(picture):
+            result.append(picture)
+            done.set()
+        self.camera_worker.CaptureStill(on_still)
+        if not done.wait(self.still_timeout) or result[0] is None:
+            return None
+        _, jpeg = cv2.imencode('.jpg', result[0], [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        return jpeg.tobytes()
+
+    def Shrink(self, jpeg, max_width):
+        # Smaller pictures upload faster (e.g. to the AI) and are all a dashboard tile needs
+        if not max_width:
+            return jpeg
+        picture = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if picture is None or picture.shape[1] <= max_width:
+            return jpeg
+        height = round(picture.shape[0] * max_width / picture.shape[1])
+        picture = cv2.resize(picture, (max_width, height), interpolation=cv2.INTER_AREA)
+        _, smaller = cv2.imencode('.jpg', picture, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        return smaller.tobytes()
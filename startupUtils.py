@@ -0,0 +1,124 @@
+import json
+import logging
+import threading
+import time
+
+# === Fast Start ===
+# Loading OpenCV, NumPy, the camera library and the sound card takes seconds on a Raspberry Pi.
+# Instead of doing all of it before anything works, the server binds its web port and connects
+# to MQTT first, then sets up the other parts (camera, chime, audio, sensors, AI...) on their own
+# threads at the same time. Each part is tracked here:
+#   waiting  - not started yet (or waiting for a part it needs)
+#   starting - being set up right now
+#   ready    - done; "seconds" is when it became ready, counted from the start of main()
+#   failed   - setting it up raised an error (the rest of the server keeps running)
+# Handlers that need a part wrap themselves in Guard(), so a command that arrives early waits for
+# its part instead of failing. /ready answers 200 once everything is ready (503 until then).
+class Startup:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.condition = threading.Condition()
+        self.parts = {}                   # name -> {"state", "seconds", "took", "error"}
+        self.tasks = []                   # (name, function, needs) for Begin()
+        self.listeners = []               # Called with Status() whenever a part changes
+
+    def Add(self, name, function=None, needs=()):
+        # function=None: the part is set up somewhere else and marked with Ready() (e.g. "http")
+        with self.condition:
+            self.parts[name] = {"state": "waiting", "seconds": None, "took": None, "error": None}
+        if function:
+            self.tasks.append((name, function, tuple(needs)))
+
+    def AddListener(self, listener):
+        self.listeners.append(listener)
+
+    def Begin(self):
+        for name, function, needs in self.tasks:
+            threading.Thread(target=self._run, args=(name, function, needs), name=f"start-{name}", daemon=True).start()
+
+    def Ready(self, name):
+        if not self.IsReady(name):        # e.g. MQTT reconnecting later doesn't count again
+            self._set(name, "ready")
+
+    def IsReady(self, name):
+        with self.condition:
+            return self.parts.get(name, {}).get("state") == "ready"
+
+    def WaitFor(self, names=None, timeout=None):
+        # True once every named part (default: all of them) is ready; False if one failed or time ran out
+        names = (names,) if isinstance(names, str) else tuple(names or self.parts)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while True:
+                states = [self.parts.get(name, {}).get("state") for name in names]
+                if all(state == "ready" for state in states):
+                    return True
+                if "failed" in states or None in states:
+                    return False          # A failed (or unknown) part will never be ready
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+
+    def Guard(self, names, handler, timeout=30, otherwise=None):
+        # Wraps a handler so it runs only once its parts are ready. If they aren't ready within
+        # `timeout` seconds (0 = don't wait), `otherwise` is called instead (or nothing happens).
+        def guarded(*args, **kwargs):
+            if self.WaitFor(names, timeout):
+                return handler(*args, **kwargs)
+            print(f"⏳ {getattr(handler, '__name__', 'handler')} skipped: {names} not ready")
+            return otherwise(*args, **kwargs) if otherwise else None
+        return guarded
+
+    def Status(self):
+        with self.condition:
+            parts = {name: dict(part) for name, part in self.parts.items()}
+        return {"ready": all(part["state"] == "ready" for part in parts.values()),
+                "uptime": round(time.perf_counter() - self.started, 3), "parts": parts}
+
+    def Respond(self, url_path, request_headers):
+        # Web handler for /ready: 200 when everything is ready, 503 while starting (or if a part failed)
+        status = self.Status()
+        body = json.dumps(status).encode()
+        return 200 if status["ready"] else 503, [("Content-Type", "application/json"),
+                                                 ("Cache-Control", "no-cache"),
+                                                 ("Content-Length", str(len(body)))], body
+
+    def _run(self, name, function, needs):
+        for need in needs:
+            if not self.WaitFor(need):
+                self._set(name, "failed", f"{need} failed")
+                return
+        self._set(name, "starting")
+        try:
+            function()
+        except Exception as e:
+            logging.exception(f"{name} failed to start")
+            print(f"❌ {name} failed to start: {e}")
+            self._set(name, "failed", str(e))
+            return
+        self._set(name, "ready")
+
+    def _set(self, name, state, error=None):
+        now = round(time.perf_counter() - self.started, 3)
+        with self.condition:
+            part = self.parts.setdefault(name, {"state": "waiting", "seconds": None, "took": None, "error": None})
+            if state == "starting":
+                part["took"] = now                    # Becomes the time the setup took, once it is done
+            elif state in ("ready", "failed"):
+                part["seconds"] = now
+                part["took"] = round(now - part["took"], 3) if part["took"] is not None else now
+            part["state"] = state
+            part["error"] = error
+            self.condition.notify_all()
+            everything_ready = all(p["state"] == "ready" for p in self.parts.values())
+        if state == "ready":
+            print(f"✅ {name} ready after {now:.2f} s")
+            if everything_ready:
+                print(f"✅ Everything ready after {now:.2f} s")
+        status = self.Status()
+        for listener in self.listeners:
+            try:
+                listener(status)
+            except Exception as e:
+                logging.error(f"Startup listener error: {e}")
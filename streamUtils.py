@@ -0,0 +1,164 @@
+import threading
+import time
+from collections import deque
+import metricsUtils
+
+# Numbers for /metrics, shared by both web servers
+SEND_SECONDS = metricsUtils.STAGE_SECONDS.Labels("send")      # Writing one frame to a viewer's connection
+FRAMES_SENT = metricsUtils.REGISTRY.Counter("doorbell_stream_frames_sent_total", "Frames sent to viewers", labels=("format",))
+BYTES_SENT = metricsUtils.REGISTRY.Counter("doorbell_stream_bytes_sent_total", "Stream bytes sent to viewers", labels=("format",))
+MJPEG_FRAMES_SENT, MJPEG_BYTES_SENT = FRAMES_SENT.Labels("mjpeg"), BYTES_SENT.Labels("mjpeg")
+MP4_FRAMES_SENT, MP4_BYTES_SENT = FRAMES_SENT.Labels("mp4"), BYTES_SENT.Labels("mp4")
+
+# === Frame Broadcaster ===
+# Holds the most recent encoded camera frames and hands them out to every viewer.
+# Each frame gets a sequence number (1, 2, 3, ...) so a viewer always knows
+# which frames it has already sent and never sends the same frame twice.
+class FrameBroadcaster:
+    def __init__(self, ring_size=4):
+        self.condition = threading.Condition()   # Lets viewers sleep until a new frame arrives
+        self.ring = deque(maxlen=ring_size)      # Small ring of (sequence, frame) pairs, oldest first
+        self.sequence = 0                        # Sequence number of the newest frame (0 = no frame yet)
+        self.viewer_count = 0                    # How many viewers are currently watching
+        self.background_count = 0                # How many of those are background viewers (see AddViewer)
+        self.viewer_listeners = []               # Functions to call when the number of viewers changes
+        self.frame_listeners = []                # Functions to call (with the sequence number) for every new frame
+
+    @property
+    def frame(self):
+        # The newest frame (or None if nothing has been captured yet)
+        with self.condition:
+            return self.ring[-1][1] if self.ring else None
+
+    def Publish(self, frame, reset=False):
+        # Store a new frame and wake up every viewer that is waiting for one.
+        # reset=True forgets the older frames first (in the same step, so a viewer never sees an empty ring)
+        with self.condition:
+            if reset:
+                self.ring.clear()
+            self.sequence += 1
+            sequence = self.sequence
+            self.ring.append((sequence, frame))
+            self.condition.notify_all()
+        for listener in self.frame_listeners:    # Outside the lock, so a listener can't hold up viewers
+            listener(sequence)
+        return sequence
+
+    def AddFrameListener(self, listener):
+        # listener(sequence) is called on the camera's thread after every new frame; it must be quick
+        self.frame_listeners.append(listener)
+
+    def Latest(self):
+        # Return (sequence, frame) for the newest frame, or (0, None) if there is none
+        with self.condition:
+            return self.ring[-1] if self.ring else (0, None)
+
+    def WaitForFrame(self, last_sequence, timeout=1.0):
+        # Give a viewer the next frame it has not sent yet.
+        # - If the very next frame is still in the ring, return it (no skipped frames).
+        # - If the viewer fell so far behind that frame is gone, jump to the newest frame.
+        # - If there is nothing new within the timeout, return (last_sequence, None).
+        # The lock is only held while picking the frame, never while sending it,
+        # so a slow viewer can't stall the camera or the other viewers.
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.sequence > last_sequence, timeout):
+                return last_sequence, None
+            oldest_sequence = self.ring[0][0]
+            if last_sequence + 1 < oldest_sequence:
+                return self.ring[-1]                                # Too far behind: drop to the newest frame
+            return self.ring[last_sequence + 1 - oldest_sequence]   # Next frame in order
+
+    # === Viewer Tracking ===
+    # The camera only needs to capture and encode frames while somebody is watching.
+    # "Background" viewers (like the clip recorder) only need a slow trickle of frames,
+    # so the camera can run at a lower frame rate when nobody else is watching.
+    @property
+    def viewers(self):
+        with self.condition:
+            return self.viewer_count
+
+    @property
+    def live_viewers(self):
+        # Viewers that want the full frame rate (people looking at the stream)
+        with self.condition:
+            return self.viewer_count - self.background_count
+
+    def AddViewerListener(self, listener):
+        # listener(count) is called with the new viewer count whenever it changes
+        self.viewer_listeners.append(listener)
+
+    def AddViewer(self, background=False):
+        with self.condition:
+            self.viewer_count += 1
+            self.background_count += 1 if background else 0
+            count = self.viewer_count
+        for listener in self.viewer_listeners:
+            listener(count)
+
+    def RemoveViewer(self, background=False):
+        with self.condition:
+            self.viewer_count = max(0, self.viewer_count - 1)
+            self.background_count = max(0, self.background_count - (1 if background else 0))
+            count = self.viewer_count
+        for listener in self.viewer_listeners:
+            listener(count)
+
+
+# === Frame Scheduler ===
+# Paces the capture loop against fixed deadlines (one every 1/fps seconds) instead of
+# sleeping a fixed amount after each frame, so the time spent capturing and encoding
+# no longer slows the stream down. Also keeps track of the frame rate we really get.
+class FrameScheduler:
+    def __init__(self, fps=24):
+        self.SetFps(fps)
+        self.achieved_fps = 0.0         # Smoothed frame rate we are actually delivering
+        self.jitter = 0.0               # Smoothed difference (in seconds) between the real and ideal frame spacing
+        self.frames = 0                 # Frames delivered so far
+        self.skipped = 0                # Deadlines missed because a frame took too long
+        self.Reset()
+
+    def SetFps(self, fps):
+        self.interval = 1.0 / fps       # Seconds between two frames
+
+    def Reset(self):
+        # Forget the old deadline, e.g. after the camera was paused for a while
+        self.next_deadline = None
+        self.last_frame_time = None
+
+    def TimeUntilNextFrame(self):
+        # How many seconds to wait before the next frame is due (0 if it's due already)
+        if self.next_deadline is None:
+            return 0.0
+        return max(0.0, self.next_deadline - time.monotonic())
+
+    def MarkFrame(self):
+        # Call right after waiting, when a new frame is about to be captured
+        now = time.monotonic()
+        if self.next_deadline is None:
+            self.next_deadline = now
+        late = now - self.next_deadline
+        if late > self.interval:
+            # We are more than a whole frame behind: skip the missed deadlines instead of
+            # rushing out a burst of frames to catch up
+            missed = int(late / self.interval)
+            self.skipped += missed
+            self.next_deadline += missed * self.interval
+        self.next_deadline += self.interval
+
+        if self.last_frame_time is not None:
+            spacing = now - self.last_frame_time
+            if spacing > 0:
+                # Exponential moving averages: cheap, and they smooth out one-off hiccups
+                self.achieved_fps += 0.05 * (1.0 / spacing - self.achieved_fps)
+                self.jitter += 0.05 * (abs(spacing - self.interval) - self.jitter)
+        self.last_frame_time = now
+        self.frames += 1
+
+    def Stats(self):
+        return {
+            "target_fps": round(1.0 / self.interval, 2),
+            "achieved_fps": round(self.achieved_fps, 2),
+            "jitter_ms": round(self.jitter * 1000, 2),
+            "frames": self.frames,
+            "skipped": self.skipped,
+        }
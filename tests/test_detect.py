@@ -0,0 +1,83 @@
+# === Local Detector on the Fake Backend ===
+# Runs the whole server with --backend fake and --detect on, with nobody watching the stream and
+# no "camera on" command: the detector alone must keep the camera making frames, and publish
+# what it sees on ring/detections.
+#
+#   python3 -m pytest tests/test_detect.py
+import os, socket, sys, threading, time
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+onnx = pytest.importorskip("onnx")        # Only used to build a tiny test model
+import numpy as np
+import fakeDevices
+
+def tiny_yolo_model(folder):
+    # A YOLO-shaped model ([batch, 4 + classes, anchors]) made of one convolution: it "finds"
+    # something in every picture, which is all this test needs
+    from onnx import helper, numpy_helper, TensorProto
+    classes = 2
+    weights = np.random.default_rng(0).normal(0, 0.05, (4 + classes, 3, 32, 32)).astype(np.float32)
+    bias = np.array([160, 160, 80, 120, 0.0, -1.0], dtype=np.float32)
+    graph = helper.make_graph(
+        [helper.make_node("Conv", ["images", "W", "B"], ["features"], strides=[32, 32]),
+         helper.make_node("Reshape", ["features", "shape"], ["output0"])],
+        "tiny", [helper.make_tensor_value_info("images", TensorProto.FLOAT, [None, 3, 320, 320])],
+        [helper.make_tensor_value_info("output0", TensorProto.FLOAT, [None, 4 + classes, 100])],
+        [numpy_helper.from_array(weights, "W"), numpy_helper.from_array(bias, "B"),
+         numpy_helper.from_array(np.array([0, 4 + classes, -1], dtype=np.int64), "shape")])
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    path = os.path.join(folder, "tiny.onnx")
+    onnx.save(model, path)
+    labels = os.path.join(folder, "labels.txt")
+    with open(labels, "w") as f:
+        f.write("person\npackage\n")
+    return path, labels
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def test_detector_runs_without_stream_viewers(tmp_path):
+    import ring_server
+    model, labels = tiny_yolo_model(str(tmp_path))
+    argv = ["--backend", "fake", "--port", str(free_port()), "--stats-interval", "0",
+            "--events", "off", "--frame-bus", "off", "--h264", "off",
+            "--detect", "on", "--detect-model", model, "--detect-format", "yolo",
+            "--detect-labels", labels, "--detect-threshold", "0"]
+    server = threading.Thread(target=ring_server.main, args=(argv,), daemon=True)
+    server.start()
+    listener = None
+    try:
+        deadline = time.monotonic() + 30
+        while ring_server.startup is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert ring_server.startup.WaitFor(["camera", "detect"], timeout=60)
+        listener = fakeDevices.FakeMqttClient()
+        arrived = threading.Event()
+        listener.on_message = lambda client, userdata, message: arrived.set()
+        listener.connect()
+        listener.subscribe(ring_server.DETECTIONS_TOPIC)
+        listener.loop_start()
+
+        assert arrived.wait(20), "no message on ring/detections"
+        stats = ring_server.detector.Stats()
+        assert stats["frames_detected"] > 0
+        assert stats["found"]
+        assert ring_server.output.live_viewers == 0      # Nobody watched the stream...
+        assert not ring_server.camera_on                 # ...and the camera was never turned on for people
+
+        # Turning the camera "off" from the app must not starve the detector
+        ring_server.cameraControl("on")
+        ring_server.cameraControl("off")
+        seen = ring_server.detector.Stats()["frames_seen"]
+        time.sleep(1)
+        assert ring_server.detector.Stats()["frames_seen"] > seen
+    finally:
+        if listener:
+            listener.disconnect()
+            listener.loop_stop()
+        ring_server.shutdown()
+        server.join(20)
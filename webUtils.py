@@ -0,0 +1,169 @@
+import gzip
+import hashlib
+import os
+import threading
+import time
+
+# Brotli compresses web files even smaller than gzip. It's optional: without it we only use gzip.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# === Static Web Files (HTML, JavaScript, CSS, images) ===
+# Everything under wwwroot/ is read into memory once, together with ready-made gzip and
+# brotli versions and an "ETag" (a fingerprint of the file). When a phone asks for a file
+# it already has, it sends the fingerprint back and gets a tiny "304 Not Modified" answer
+# instead of the whole file. Files are re-read automatically when they change on disk.
+CONTENT_TYPES = {
+    ".html": "text/html; charset=utf-8",
+    ".js": "application/javascript; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+    ".json": "application/json",
+    ".svg": "image/svg+xml",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".ico": "image/x-icon",
+    ".mp3": "audio/mpeg",
+}
+COMPRESSIBLE = {".html", ".js", ".css", ".json", ".svg", ".ico"}   # Images and sounds are already compressed
+
+class StaticAsset:
+    def __init__(self, path):
+        self.path = path
+        extension = os.path.splitext(path)[1].lower()
+        self.content_type = CONTENT_TYPES.get(extension, "application/octet-stream")
+        # Pages, scripts and styles change while you work on them, so the browser checks every time
+        # (cheap with ETags); images can be kept for a day.
+        self.cache_control = "no-cache" if extension in {".html", ".js", ".css"} else "public, max-age=86400"
+        self.compressible = extension in COMPRESSIBLE
+        self.last_checked = 0.0
+        self.Load()
+
+    def Load(self):
+        with open(self.path, "rb") as f:
+            body = f.read()
+        self.mtime = os.stat(self.path).st_mtime_ns
+        fingerprint = hashlib.sha256(body).hexdigest()[:20]
+        # Each version (plain / gzip / brotli) gets its own ETag, as HTTP requires
+        self.variants = {"identity": (body, f'"{fingerprint}"')}
+        if self.compressible:
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                self.variants["gzip"] = (compressed, f'"{fingerprint}-gz"')
+            if brotli:
+                compressed = brotli.compress(body, quality=11)
+                if len(compressed) < len(body):
+                    self.variants["br"] = (compressed, f'"{fingerprint}-br"')
+        self.etags = {etag for _, etag in self.variants.values()}
+
+    def Choose(self, accept_encoding):
+        # Pick the smallest version the browser says it understands
+        accepted = {part.split(";")[0].strip().lower() for part in (accept_encoding or "").split(",")}
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and encoding in accepted:
+                return encoding, self.variants[encoding]
+        return "identity", self.variants["identity"]
+
+
+class StaticAssetCache:
+    def __init__(self, root="./wwwroot", aliases=None, check_interval=1.0):
+        self.root = os.path.abspath(root)
+        self.aliases = aliases or {}            # Short web addresses for files, e.g. "/index.html" -> "html_pages/client_ring_app.html"
+        self.check_interval = check_interval    # How often (seconds) to look for changed files on disk
+        self.assets = {}
+        self.lock = threading.Lock()
+        self.Load()
+
+    def Load(self):
+        # Read every file under the web root up front, so the first visitor doesn't wait for the SD card
+        count = 0
+        for folder, _, names in os.walk(self.root):
+            for name in names:
+                if self._get(os.path.join(folder, name)):
+                    count += 1
+        print(f"🌐 Cached {count} web files from {self.root}")
+
+    def Respond(self, url_path, request_headers):
+        # Returns (status, headers, body) for a web address, or None if there is no such file
+        asset = self._get(self._file_for(url_path))
+        if asset is None:
+            return None
+        encoding, (body, etag) = asset.Choose(request_headers.get("Accept-Encoding"))
+        headers = [("Content-Type", asset.content_type),
+                   ("Cache-Control", asset.cache_control),
+                   ("ETag", etag),
+                   ("Vary", "Accept-Encoding")]
+        # The browser already has this exact file: just say "Not Modified"
+        if_none_match = request_headers.get("If-None-Match")
+        if if_none_match and ("*" in if_none_match or
+                              any(tag.strip().removeprefix("W/") in asset.etags for tag in if_none_match.split(","))):
+            return 304, headers, b""
+        if encoding != "identity":
+            headers.append(("Content-Encoding", encoding))
+        headers.append(("Content-Length", str(len(body))))
+        return 200, headers, body
+
+    def _file_for(self, url_path):
+        url_path = url_path.split("?", 1)[0]
+        relative = self.aliases.get(url_path, url_path.lstrip("/"))
+        path = os.path.abspath(os.path.join(self.root, relative))
+        # Never serve anything outside the web root (e.g. "/../.env")
+        if not path.startswith(self.root + os.sep):
+            return None
+        return path
+
+    def _get(self, path):
+        if path is None:
+            return None
+        with self.lock:
+            asset = self.assets.get(path)
+            now = time.monotonic()
+            try:
+                if asset is None:
+                    if not os.path.isfile(path):
+                        return None
+                    asset = self.assets[path] = StaticAsset(path)
+                elif now - asset.last_checked >= self.check_interval:
+                    if os.stat(path).st_mtime_ns != asset.mtime:
+                        asset.Load()          # The file was edited: read the new version
+                asset.last_checked = now
+            except OSError:
+                self.assets.pop(path, None)   # The file was deleted
+                return None
+            return asset
+
+
+# === Route Table ===
+# Maps web addresses to functions that build a response, so the regular (threaded) web
+# server and the asyncio web server answer exactly the same way.
+# Each function is called as handler(path, request_headers) and returns (status, headers, body),
+# or None for "not found". Anything without a route is looked up in the static file cache.
+class Router:
+    def __init__(self, assets=None):
+        self.assets = assets
+        self.routes = []            # (path, handler, prefix, blocking)
+
+    def Add(self, path, handler, prefix=False, blocking=False):
+        # prefix=True matches every address starting with `path`.
+        # blocking=True marks handlers that may wait (e.g. for the camera), so the asyncio
+        # server runs them on a worker thread instead of its event loop.
+        self.routes.append((path, handler, prefix, blocking))
+
+    def Find(self, url_path):
+        # Returns (handler, blocking) for an address
+        path = url_path.split("?", 1)[0]
+        for route_path, handler, prefix, blocking in self.routes:
+            if path == route_path or (prefix and path.startswith(route_path)):
+                return handler, blocking
+        return (self.assets.Respond if self.assets else None), False
+
+    def Respond(self, url_path, request_headers):
+        handler, _ = self.Find(url_path)
+        return handler(url_path, request_headers) if handler else None
+
+
+# A handler that sends the browser somewhere else (e.g. "/" -> "/index.html")
+def Redirect(location):
+    return lambda path, headers: (301, [("Location", location), ("Content-Length", "0")], b"")
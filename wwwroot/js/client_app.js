@@ -1,6 +1,7 @@
 // === DOM ELEMENT REFERENCES ===
 // These lines find and save parts of the webpage so we can control them with JavaScript
 const camera_image = document.getElementById('camera_image');       // This is the live camera feed (video stream)
+const camera_video = document.getElementById('camera_video');       // The same camera feed as H.264 video (when the browser supports it)
 const messageDiv = document.getElementById('response');             // This is where the GPT description (AI response) will appear
 const camera_button = document.getElementById('camera_control');    // This is the button the user clicks to start or stop the camera
 const gpt_button = document.getElementById('gpt_control');          // This button asks the AI to describe what it sees from the camera
@@ -28,6 +29,29 @@ let mediaRecorder;           // This will be used to record audio from the user
 let audioChunks = [];        // This is where small pieces of recorded audio are stored before being sent
 let cameraRetryCount = 0;    // Counts how many times we've tried to reload the camera stream (if it fails)
 const MAX_RETRIES = 3;       // The maximum number of times to retry loading the camera before giving up
+// Stream quality: open the app as /index.html?quality=low to force a tier (full | medium | low | minimal),
+// otherwise the server picks one automatically from how fast this connection is
+const STREAM_QUALITY = new URLSearchParams(window.location.search).get("quality") || "auto";
+// Stream format: H.264 (/stream.mp4) when the browser can play it, otherwise MJPEG.
+// Open the app as /index.html?stream=mjpeg to always use MJPEG.
+const STREAM_FORMAT = new URLSearchParams(window.location.search).get("stream") || "auto";
+let h264Session = null;      // The H.264 stream being played (or null)
+
+// === STREAMING AUDIO (JITTER BUFFER) ===
+// The doorbell sends its microphone as small numbered packets (about 20 ms of sound each).
+// Packets can arrive a little early or late, so we hold a short "jitter buffer" and
+// schedule each packet to play right after the previous one, with no gaps.
+const AUDIO_PACKET_MAGIC = "ORA1";     // Every streaming audio packet starts with these 4 letters
+const AUDIO_HEADER_BYTES = 20;         // Size of the packet header (see audioUtils.py)
+const AUDIO_FLAG_KEEPALIVE = 1;        // Header-only packet sent during silence: nothing to play
+const JITTER_TARGET_SECONDS = 0.12;    // How far ahead of "now" we schedule sound (absorbs network hiccups)
+const JITTER_MAX_SECONDS = 0.5;        // If we get further behind than this, skip ahead to cut the delay
+const JITTER_MAX_WAITING = 5;          // Packets to hold while waiting for a missing one before giving up on it
+let audioContext = null;               // Web Audio engine (created when the user clicks "Listen")
+let audioListening = false;            // Are we playing the door microphone right now?
+let audioPlayhead = 0;                 // When (in audioContext time) the next packet should start playing
+let audioNextSequence = null;          // Sequence number of the packet we want to play next
+let audioWaiting = new Map();          // Packets that arrived before the one we are waiting for
 
 // === CONNECTION SECURITY CONFIG ===
 // These settings help the app know how to securely connect to the MQTT server
@@ -171,6 +195,7 @@ listen_button.addEventListener('click', () => {
     const isListening = listen_button.innerText === "Listen";    // Check if the user is starting or stopping the listening
     listen_button.innerText = isListening ? "Stop Listening" : "Listen";    // Update the button text based on the current state
     SendCommand(REMOTE_APP_MICROPHONE_CONTROL_TOPIC, isListening ? "on" : "off");    // Send a message to the Raspberry Pi to turn the microphone on or off
+    resetAudioStream(isListening);        // Start (or stop) the streaming audio player
     audio_player.style.display = "none";  // Hide the audio player while switching states
     if (!isListening) {    // If stopping listening, pause the audio and clear its source
         audio_player.pause();
@@ -201,10 +226,15 @@ function setRemoteCameraMode(mode) {
     camera_button.innerText = mode === "on" ? "Stop Camera" : "Start Camera"; // Change the button text to match the new state
 
     if (mode === "on") {    // If the camera is being turned on, show the video stream
-        camera_image.style.display = "inline";    // Make the image visible
         cameraRetryCount = 0;                     // Reset retry count
-        loadMJPEGStream();                        // Start loading the video stream
+        if (canPlayH264()) {
+            startH264Stream();                    // Low-bandwidth H.264 video (falls back to MJPEG if it fails)
+        } else {
+            camera_image.style.display = "inline";    // Make the image visible
+            loadMJPEGStream();                        // Start loading the video stream
+        }
     } else {    // If the camera is being turned off, hide the image
+        stopH264Stream();
         camera_image.style.display = "none";      // Hide the video stream
         camera_image.src = "";                    // Clear the image source
     }
@@ -212,7 +242,7 @@ function setRemoteCameraMode(mode) {
 // This function loads the MJPEG (motion JPEG) video stream from the Raspberry Pi
 function loadMJPEGStream() {
     const timestamp = Date.now();        // Add a unique timestamp to prevent caching
-    camera_image.src = `/stream.mjpg?ts=${timestamp}`; // Set the video stream URL with the timestamp
+    camera_image.src = `/stream.mjpg?quality=${encodeURIComponent(STREAM_QUALITY)}&ts=${timestamp}`; // Set the video stream URL with the quality tier and timestamp
     // If the video fails to load...
     camera_image.onerror = () => {
         console.error("❌ Failed to load MJPEG stream.");
@@ -226,11 +256,117 @@ function loadMJPEGStream() {
     };
 }
 
+// === H.264 LIVE STREAM (Media Source Extensions) ===
+// /stream.mp4 is fragmented MP4: an "init segment" describing the video, then one small piece per frame.
+// We download it with fetch() and feed each piece to the <video> element through a SourceBuffer.
+const H264_MAX_DELAY = 1.0;     // If playback falls this many seconds behind live, jump ahead
+const H264_KEEP_SECONDS = 10;   // Forget video older than this, so memory doesn't grow
+
+function canPlayH264() {
+    return STREAM_FORMAT !== "mjpeg" && window.MediaSource &&
+        MediaSource.isTypeSupported('video/mp4; codecs="avc1.42E01E"');
+}
+
+async function startH264Stream() {
+    stopH264Stream();
+    const session = { controller: new AbortController(), mediaSource: new MediaSource(),
+                      sourceBuffer: null, pending: [], waiting: new Uint8Array(0) };
+    h264Session = session;
+    camera_video.src = URL.createObjectURL(session.mediaSource);
+    camera_video.style.display = "inline";
+    camera_image.style.display = "none";
+    camera_image.onerror = null;                  // No MJPEG retries while H.264 plays
+    camera_image.removeAttribute("src");          // A hidden <img> keeps downloading MJPEG: stop it
+    try {
+        await new Promise(resolve => session.mediaSource.addEventListener("sourceopen", resolve, { once: true }));
+        const response = await fetch(`/stream.mp4?ts=${Date.now()}`, { signal: session.controller.signal });
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        const reader = response.body.getReader();
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) throw new Error("stream ended");
+            appendH264(session, value);
+        }
+    } catch (err) {
+        if (h264Session !== session) return;      // Stopped on purpose
+        console.warn("⚠️ H.264 stream failed, using MJPEG instead:", err);
+        stopH264Stream();
+        camera_image.style.display = "inline";
+        loadMJPEGStream();
+    }
+}
+
+function stopH264Stream() {
+    if (!h264Session) return;
+    const session = h264Session;
+    h264Session = null;
+    session.controller.abort();
+    URL.revokeObjectURL(camera_video.src);
+    camera_video.removeAttribute("src");
+    camera_video.load();
+    camera_video.style.display = "none";
+}
+
+function appendH264(session, bytes) {
+    if (!session.sourceBuffer) {
+        // The codec (profile and level) is in the init segment's "avcC" box, which may arrive split over chunks
+        const joined = new Uint8Array(session.waiting.length + bytes.length);
+        joined.set(session.waiting);
+        joined.set(bytes, session.waiting.length);
+        const codec = findH264Codec(joined);
+        if (!codec) {
+            session.waiting = joined;
+            return;
+        }
+        session.sourceBuffer = session.mediaSource.addSourceBuffer(`video/mp4; codecs="${codec}"`);
+        session.sourceBuffer.addEventListener("updateend", () => feedH264(session));
+        bytes = joined;
+    }
+    session.pending.push(bytes);
+    feedH264(session);
+}
+
+function feedH264(session) {
+    const buffer = session.sourceBuffer;
+    if (buffer.updating || h264Session !== session) return;
+    const ranges = buffer.buffered;
+    if (ranges.length) {
+        const end = ranges.end(ranges.length - 1);
+        if (end - camera_video.currentTime > H264_MAX_DELAY) {
+            camera_video.currentTime = end - 0.1;     // Stay close to live
+        }
+        if (camera_video.currentTime - ranges.start(0) > H264_KEEP_SECONDS) {
+            buffer.remove(0, camera_video.currentTime - H264_KEEP_SECONDS / 2);   // "updateend" calls us again
+            return;
+        }
+    }
+    if (session.pending.length) {
+        buffer.appendBuffer(session.pending.shift());
+        camera_video.play().catch(() => {});
+    }
+}
+
+function findH264Codec(bytes) {
+    // Look for "avcC"; the next bytes are version, profile, constraints and level, e.g. "avc1.42e01e"
+    for (let i = 0; i + 8 <= bytes.length; i++) {
+        if (bytes[i] === 0x61 && bytes[i + 1] === 0x76 && bytes[i + 2] === 0x63 && bytes[i + 3] === 0x43) {
+            const hex = n => n.toString(16).padStart(2, "0");
+            return "avc1." + hex(bytes[i + 5]) + hex(bytes[i + 6]) + hex(bytes[i + 7]);
+        }
+    }
+    return null;
+}
+
 // === AUDIO LISTEN HANDLER ===
 // This function plays audio that was recorded at the door and sent to the web app
 function handleListenFromDoorMicrophone(message) {
     try {
-        const blob = new Blob([message.payloadBytes], { type: 'audio/wav' });    // Step 1: Convert the received audio data into a playable audio file (WAV format)
+        const bytes = message.payloadBytes;
+        if (isAudioPacket(bytes)) {            // New style: small streaming packets
+            queueAudioPacket(bytes);
+            return;
+        }
+        const blob = new Blob([bytes], { type: 'audio/wav' });    // Step 1: Convert the received audio data into a playable audio file (WAV format)
         const audioUrl = URL.createObjectURL(blob);                              // Step 2: Create a temporary URL for the audio file
         audio_player.src = audioUrl;                                             // Step 3: Set the audio player's source to that URL and play it
         audio_player.play().catch(err => {
@@ -241,6 +377,100 @@ function handleListenFromDoorMicrophone(message) {
     }
 }
 
+// === STREAMING AUDIO PLAYER ===
+// Start or stop the streaming player (called when "Listen" is clicked)
+function resetAudioStream(start) {
+    audioWaiting.clear();
+    audioNextSequence = null;
+    audioListening = start;
+    if (start) {
+        // Browsers only allow sound after a click, so the audio engine is created here
+        audioContext = audioContext || new (window.AudioContext || window.webkitAudioContext)();
+        audioContext.resume();
+    }
+}
+// Check whether a message is a streaming audio packet (starts with "ORA1")
+function isAudioPacket(bytes) {
+    return bytes.length >= AUDIO_HEADER_BYTES &&
+        String.fromCharCode(bytes[0], bytes[1], bytes[2], bytes[3]) === AUDIO_PACKET_MAGIC;
+}
+// Put an arriving packet in the jitter buffer and play every packet that is ready
+function queueAudioPacket(bytes) {
+    if (!audioListening) return;                         // Not listening (a few packets may still arrive after "Stop")
+    const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+    const sequence = view.getUint32(8, true);
+    if (audioNextSequence === null) audioNextSequence = sequence;   // First packet: start from here
+    if (sequence < audioNextSequence) return;            // Too late, that moment has already played
+    audioWaiting.set(sequence, bytes);
+
+    // A packet went missing: don't wait forever, skip it (play a moment of silence instead)
+    if (!audioWaiting.has(audioNextSequence) && audioWaiting.size > JITTER_MAX_WAITING) {
+        audioNextSequence = Math.min(...audioWaiting.keys());
+    }
+    while (audioWaiting.has(audioNextSequence)) {
+        playAudioPacket(audioWaiting.get(audioNextSequence));
+        audioWaiting.delete(audioNextSequence);
+        audioNextSequence++;
+    }
+}
+// Decode one packet and schedule it right after the previous one
+function playAudioPacket(bytes) {
+    const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+    if (view.getUint8(5) & AUDIO_FLAG_KEEPALIVE) return;   // Silence at the door: it only keeps the numbering going
+    const codec = view.getUint8(4);
+    const sampleRate = view.getUint16(6, true);
+    const payload = bytes.subarray(AUDIO_HEADER_BYTES);
+    const samples = codec === 1
+        ? decodeADPCM(payload, view.getInt16(16, true), view.getUint8(18))
+        : decodePCM16(payload);
+    if (samples.length === 0) return;
+
+    const buffer = audioContext.createBuffer(1, samples.length, sampleRate);
+    buffer.getChannelData(0).set(samples);
+    const source = audioContext.createBufferSource();
+    source.buffer = buffer;
+    source.connect(audioContext.destination);
+
+    // Keep the playhead a little ahead of "now": not too close (gaps), not too far (delay)
+    const now = audioContext.currentTime;
+    if (audioPlayhead < now || audioPlayhead > now + JITTER_MAX_SECONDS) {
+        audioPlayhead = now + JITTER_TARGET_SECONDS;
+    }
+    source.start(audioPlayhead);
+    audioPlayhead += buffer.duration;
+}
+// 16-bit samples -> numbers between -1 and 1 (what Web Audio expects)
+function decodePCM16(payload) {
+    const view = new DataView(payload.buffer, payload.byteOffset, payload.byteLength);
+    const samples = new Float32Array(payload.byteLength >> 1);
+    for (let i = 0; i < samples.length; i++) samples[i] = view.getInt16(i * 2, true) / 32768;
+    return samples;
+}
+// IMA ADPCM (4 bits per sample, first sample in the high half of each byte) -> numbers between -1 and 1
+const ADPCM_INDEX_TABLE = [-1, -1, -1, -1, 2, 4, 6, 8, -1, -1, -1, -1, 2, 4, 6, 8];
+const ADPCM_STEP_TABLE = [
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45, 50, 55, 60, 66, 73, 80, 88, 97,
+    107, 118, 130, 143, 157, 173, 190, 209, 230, 253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724, 796,
+    876, 963, 1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327, 3660, 4026, 4428,
+    4871, 5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442, 11487, 12635, 13899, 15289, 16818, 18500, 20350,
+    22385, 24623, 27086, 29794, 32767];
+function decodeADPCM(payload, predictor, index) {
+    const samples = new Float32Array(payload.length * 2);
+    for (let i = 0; i < samples.length; i++) {
+        const code = i % 2 === 0 ? payload[i >> 1] >> 4 : payload[i >> 1] & 0x0f;
+        const step = ADPCM_STEP_TABLE[index];
+        let diff = step >> 3;
+        if (code & 4) diff += step;
+        if (code & 2) diff += step >> 1;
+        if (code & 1) diff += step >> 2;
+        predictor += code & 8 ? -diff : diff;
+        predictor = Math.max(-32768, Math.min(32767, predictor));
+        index = Math.max(0, Math.min(88, index + ADPCM_INDEX_TABLE[code]));
+        samples[i] = predictor / 32768;
+    }
+    return samples;
+}
+
 // === GPT UI RESPONSE HANDLER ===
 // This function updates the webpage when the AI (GPT) sends a response
 function handleGPTResponseUpdate(message) {
@@ -276,7 +506,7 @@ function makeid(length) {
 // Show or hide the spinner while waiting for the AI
 function displaySpinner(show) {
     document.getElementById('spinner').style.display = show ? 'block' : 'none';    // Show or hide spinner
-    camera_image.style.display = show ? 'none' : 'inline';                         // Hide or show camera image
+    (h264Session ? camera_video : camera_image).style.display = show ? 'none' : 'inline';   // Hide or show camera image
 }
 // Show a popup alert message to the user using SweetAlert
 function showAlert(title, text) {